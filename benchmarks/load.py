@@ -0,0 +1,364 @@
+"""
+Test de charge du transport streamable-http du serveur MCP
+
+    python -m benchmarks.load                                   # lance serveur + stand-ins, paliers 1,4,16
+    python -m benchmarks.load --concurrency 1,8,32 --duration 30
+    python -m benchmarks.load --mix carbon_impact_analysis=3,run_sonarqube_analysis=1
+    python -m benchmarks.load --url http://127.0.0.1:3000/mcp   # cible un serveur déjà lancé
+    python -m benchmarks.load --workers 1,2,4                   # passage à l'échelle multi-worker
+
+Chaque agent virtuel ouvre sa session MCP et enchaîne les appels d'outils tirés selon le mix.
+Avec --workers, le harnais lance N workers en état partagé SQLite et répartit chaque appel sur le
+worker qui a le moins d'appels en cours, comme l'upstream least_conn de nginx/nginx.conf.
+Mistral, l'API web SonarQube et qlty sont servis par benchmarks.stubs ; l'hôte SSH de sonar-scanner
+est un serveur asyncssh en processus qui accepte l'upload SFTP et simule le scanner.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+from uuid import uuid4
+
+from benchmarks.stubs import StubServer, StubState
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "load.json"
+
+DEFAULT_MIX = {
+    "carbon_impact_analysis": 5,
+    "full_eco_analysis": 2,
+    "run_sonarqube_analysis": 2,
+    "github_repo_analysis": 1,
+}
+
+SAMPLE_CODE = """def work(n):
+    total = 0
+    for i in range(n):
+        for j in range(50):
+            total += i * j
+    return total
+
+result = work({size})
+"""
+
+
+def tool_arguments(tool: str, rng: random.Random, backend: str) -> dict:
+    """Arguments d'un appel ; le code varie à chaque appel pour ne pas profiter de la coalescence"""
+    code = SAMPLE_CODE.format(size=rng.randint(100, 2000))
+    if tool == "carbon_impact_analysis":
+        return {"code": code, "filename": "load.py", "backend": backend}
+    if tool == "full_eco_analysis":
+        return {"code": code, "filename": "load.py", "include_sonar": True, "backend": backend, "mode": "measure"}
+    if tool == "run_sonarqube_analysis":
+        return {"code": code, "filename": "load.py"}
+    if tool == "github_repo_analysis":
+        return {"repo_github": f"analyse le projet owner/project-{rng.randint(0, 10**6)}"}
+    if tool == "batch_eco_analysis":
+        return {"items": [{"code": code, "filename": f"load_{i}.py"} for i in range(4)], "backend": backend}
+    raise ValueError(f"Outil non pris en charge par le générateur : {tool}")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# Hôte SSH de substitution
+
+def _ssh_server_class():
+    import asyncssh
+
+    class StandInSSHServer(asyncssh.SSHServer):
+        def begin_auth(self, username):
+            return True
+
+        def password_auth_supported(self):
+            return True
+
+        def validate_password(self, username, password):
+            return True
+
+    return StandInSSHServer
+
+
+async def start_ssh_stand_in(sonar_host: str, scanner_delay_s: float = 0.5, host: str = "127.0.0.1"):
+    """Serveur SSH local : SFTP confiné dans un dossier temporaire, commandes simulées (rien n'est exécuté)"""
+    import asyncssh
+
+    root = tempfile.mkdtemp(prefix="ecocode_ssh_")
+    (Path(root) / "tmp").mkdir()
+
+    async def handle(process):
+        command = process.command or ""
+        if "sonar-scanner" in command:
+            await asyncio.sleep(scanner_delay_s)
+            process.stdout.write(f"INFO: More about the report processing at {sonar_host}/api/ce/task?id=stub-{uuid4().hex[:12]}\n")
+        process.exit(0)
+
+    acceptor = await asyncssh.create_server(
+        _ssh_server_class(), host, 0,
+        server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+        process_factory=handle,
+        sftp_factory=lambda chan: asyncssh.SFTPServer(chan, chroot=root.encode()),
+    )
+    return acceptor, acceptor.sockets[0].getsockname()[1]
+
+
+# Serveur MCP sous test
+
+def start_server(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=ROOT_DIR,
+        env={**os.environ, **env, "PORT": str(port)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/metrics")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Serveur non joignable après {timeout}s : {base_url}")
+
+
+# Générateur de charge
+
+def _call_succeeded(result) -> tuple:
+    if result.isError:
+        return False, "tool_error"
+    payload = result.structuredContent
+    if payload is None and result.content:
+        try:
+            payload = json.loads(result.content[0].text)
+        except (ValueError, AttributeError):
+            payload = None
+    if isinstance(payload, dict) and "result" in payload and len(payload) == 1:
+        payload = payload["result"]
+    if isinstance(payload, dict) and payload.get("status") == "error":
+        return False, "status_error"
+    if isinstance(payload, dict) and isinstance(payload.get("data"), dict) and payload["data"].get("error"):
+        return False, "service_error"
+    return True, None
+
+
+async def agent(urls: List[str], inflight: Dict[str, int], mix: Dict[str, float], deadline: float,
+                samples: List[dict], seed: int, backend: str, think_s: float):
+    from mcp import ClientSession
+    from mcp.client.streamable_http import streamablehttp_client
+
+    rng = random.Random(seed)
+    tools, weights = list(mix), list(mix.values())
+    try:
+        async with contextlib.AsyncExitStack() as stack:
+            # Une session par worker (stateless_http) : chaque appel choisit le worker le moins chargé
+            sessions = {}
+            for url in urls:
+                read, write, _ = await stack.enter_async_context(streamablehttp_client(url, timeout=60, sse_read_timeout=600))
+                sessions[url] = await stack.enter_async_context(ClientSession(read, write))
+                await sessions[url].initialize()
+            while time.monotonic() < deadline:
+                tool = rng.choices(tools, weights)[0]
+                fewest = min(inflight[url] for url in urls)
+                url = rng.choice([url for url in urls if inflight[url] == fewest])
+                inflight[url] += 1
+                started = time.perf_counter()
+                try:
+                    result = await sessions[url].call_tool(tool, tool_arguments(tool, rng, backend))
+                    ok, error = _call_succeeded(result)
+                except Exception as e:
+                    ok, error = False, type(e).__name__
+                finally:
+                    inflight[url] -= 1
+                samples.append({"tool": tool, "latency_s": time.perf_counter() - started, "ok": ok,
+                                "error": error, "finished_at": time.monotonic()})
+                if think_s:
+                    await asyncio.sleep(think_s)
+    except Exception as e:
+        samples.append({"tool": "session", "latency_s": 0.0, "ok": False, "error": type(e).__name__,
+                        "finished_at": time.monotonic()})
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(samples: List[dict], duration_s: float) -> dict:
+    per_tool = {}
+    for tool in sorted({s["tool"] for s in samples}):
+        calls = [s for s in samples if s["tool"] == tool]
+        latencies = sorted(s["latency_s"] * 1000 for s in calls if s["ok"])
+        errors = {}
+        for s in calls:
+            if not s["ok"]:
+                errors[s["error"]] = errors.get(s["error"], 0) + 1
+        per_tool[tool] = {
+            "calls": len(calls),
+            "throughput_rps": round(len(calls) / duration_s, 3),
+            "p50_ms": round(_percentile(latencies, 0.50), 1),
+            "p95_ms": round(_percentile(latencies, 0.95), 1),
+            "p99_ms": round(_percentile(latencies, 0.99), 1),
+            "error_rate": round(sum(errors.values()) / len(calls), 4),
+            "errors": errors,
+        }
+    total = len(samples)
+    failed = sum(1 for s in samples if not s["ok"])
+    return {
+        "calls": total,
+        "throughput_rps": round(total / duration_s, 3),
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "tools": per_tool,
+    }
+
+
+async def run_stage(urls: List[str], concurrency: int, duration_s: float, mix: Dict[str, float], backend: str,
+                    think_s: float, seed: int) -> dict:
+    samples: List[dict] = []
+    inflight = {url: 0 for url in urls}
+    started = time.monotonic()
+    deadline = started + duration_s
+    await asyncio.gather(*(
+        agent(urls, inflight, mix, deadline, samples, seed + i, backend, think_s) for i in range(concurrency)
+    ))
+    # Les appels en vol à l'échéance prolongent le palier : le débit se rapporte à la durée réelle
+    elapsed = time.monotonic() - started
+    return {"workers": len(urls), "concurrency": concurrency, "duration_s": round(elapsed, 2), **summarize(samples, elapsed)}
+
+
+def print_stage(stage: dict):
+    print(f"\n== {stage['workers']} worker(s), {stage['concurrency']} agents : {stage['calls']} appels, "
+          f"{stage['throughput_rps']} appels/s, erreurs {stage['error_rate']:.1%}")
+    print(f"{'outil':<28}{'appels':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erreurs':>9}")
+    for tool, s in stage["tools"].items():
+        print(f"{tool:<28}{s['calls']:>8}{s['throughput_rps']:>9}{s['p50_ms']:>10}{s['p95_ms']:>10}"
+              f"{s['p99_ms']:>10}{s['error_rate']:>9.1%}")
+
+
+def scaling_summary(stages: List[dict]) -> dict:
+    """Débit au palier le plus chargé rapporté à celui d'un worker : proche de N si le passage à l'échelle est linéaire"""
+    top = max(stage["concurrency"] for stage in stages)
+    by_workers = {stage["workers"]: stage["throughput_rps"] for stage in stages if stage["concurrency"] == top}
+    reference = by_workers.get(1)
+    return {
+        "concurrency": top,
+        "throughput_rps": by_workers,
+        "speedup": {workers: round(rps / reference, 2) for workers, rps in by_workers.items()} if reference else None,
+    }
+
+
+async def main_async(args) -> dict:
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    levels = [int(c) for c in args.concurrency.split(",")]
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    report = {"mix": mix, "backend": args.backend, "stages": []}
+
+    servers, stub, acceptor = [], None, None
+    try:
+        if args.url is not None:
+            report["url"] = args.url
+            for concurrency in levels:
+                stage = await run_stage([args.url], concurrency, args.duration, mix, args.backend, args.think_ms / 1000, args.seed)
+                print_stage(stage)
+                report["stages"].append(stage)
+            return report
+
+        stub = StubServer(StubState(latency_s=args.stub_latency_ms / 1000, mistral_content="None"))
+        stub.__enter__()
+        acceptor, ssh_port = await start_ssh_stand_in(stub.url, args.scanner_delay_ms / 1000)
+        env = {
+            **stub.env(),
+            "SSH_HOST": "127.0.0.1",
+            "SSH_PORT": str(ssh_port),
+            "SSH_USERNAME": "load",
+            "SSH_PASSWORD": "load",
+            "SSH_KEY_PATH": "",
+            "SSH_KNOWN_HOSTS": "none",
+        }
+        for workers in worker_counts:
+            worker_env = dict(env)
+            if workers > 1:
+                # Même configuration que scripts/start_services.sh : état partagé, runners batch répartis
+                state_dir = tempfile.mkdtemp(prefix="ecocode_shared_")
+                worker_env.update({
+                    "ECOCODE_SHARED_STATE": "sqlite",
+                    "SHARED_STATE_DB": str(Path(state_dir) / "shared.db"),
+                    "BATCH_RUNNER_WORKERS": str(max(1, -(-(os.cpu_count() or 1) // workers))),
+                })
+            servers = [start_server(args.port + i, worker_env) for i in range(workers)]
+            bases = [f"http://127.0.0.1:{args.port + i}" for i in range(workers)]
+            await asyncio.gather(*(wait_ready(base) for base in bases))
+            urls = [f"{base}/mcp" for base in bases]
+            report.setdefault("urls", {})[workers] = urls
+
+            for concurrency in levels:
+                stage = await run_stage(urls, concurrency, args.duration, mix, args.backend, args.think_ms / 1000, args.seed)
+                print_stage(stage)
+                report["stages"].append(stage)
+            stop_servers(servers)
+            servers = []
+        if len(worker_counts) > 1:
+            report["scaling"] = scaling_summary(report["stages"])
+            print(f"\nPassage à l'échelle ({report['scaling']['concurrency']} agents) : {report['scaling']['speedup']}")
+    finally:
+        stop_servers(servers)
+        if acceptor is not None:
+            acceptor.close()
+        if stub is not None:
+            stub.__exit__(None, None, None)
+    return report
+
+
+def stop_servers(servers: List[subprocess.Popen]):
+    for server in servers:
+        server.terminate()
+    for server in servers:
+        server.wait(timeout=10)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Test de charge EcoCode Analyzer (streamable-http)")
+    parser.add_argument("--url", help="Endpoint MCP existant ; sinon serveur et stand-ins sont lancés localement")
+    parser.add_argument("--port", type=int, default=3100, help="Port du (premier) serveur lancé par le harnais")
+    parser.add_argument("--workers", default="1", help="Nombres de workers à comparer, ex. 1,2,4 (ports consécutifs)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Paliers d'agents simultanés")
+    parser.add_argument("--duration", type=float, default=20, help="Durée de chaque palier (s)")
+    parser.add_argument("--mix", help="Pondération outil=poids,... (défaut : %s)" % ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--backend", default="direct", choices=("direct", "codecarbon"))
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause de chaque agent entre deux appels")
+    parser.add_argument("--stub-latency-ms", type=float, default=20, help="Latence simulée des API HTTP")
+    parser.add_argument("--scanner-delay-ms", type=float, default=500, help="Durée simulée de sonar-scanner")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(main_async(args))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"\nRésultats écrits dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Benchmarks des chemins critiques de l'analyseur
+
+    python -m benchmarks.run                    # tout, comparé à benchmarks/baseline.json
+    python -m benchmarks.run --quick            # sans les mesures carbone de bout en bout
+    python -m benchmarks.run -k complexity      # filtre par nom (regex)
+    python -m benchmarks.run --update-baseline  # enregistre les résultats comme nouvelle référence
+
+SonarQube, Mistral et qlty sont servis par benchmarks.stubs : aucun appel réseau externe.
+Le code de sortie vaut 1 si une régression dépasse la tolérance.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.stubs import StubServer, StubState
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_OUTPUT = BENCH_DIR / "results" / "latest.json"
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, repeat: int = 20, slow: bool = False):
+    """Enregistre un cas : la fonction décorée prépare les entrées et renvoie l'appel à chronométrer"""
+    def register(setup):
+        BENCHMARKS.append({"name": name, "setup": setup, "repeat": repeat, "slow": slow})
+        return setup
+    return register
+
+
+@benchmark("complexity_small", repeat=200)
+@benchmark("complexity_medium", repeat=20)
+@benchmark("complexity_huge", repeat=3)
+def bench_complexity(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import MODULE_SIZES, make_module
+    from services.carbon.carbon_analyzer import analyze_code_complexity
+    code = make_module(MODULE_SIZES[case.rsplit("_", 1)[1]])
+    return lambda: analyze_code_complexity(code)
+
+
+@benchmark("retrieve_python_files_100", repeat=20)
+@benchmark("retrieve_python_files_2000", repeat=5)
+def bench_retrieve_files(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import make_tree
+    from services.github.main import retrieve_python_files
+    files = int(case.rsplit("_", 1)[1])
+    directories = max(1, files // 20)
+    root = Path(stack.enter_context(tempfile.TemporaryDirectory())) / "repo"
+    make_tree(root, directories, files // directories)
+    return lambda: retrieve_python_files(str(root))
+
+
+@benchmark("retrieve_python_files_200_vendored_2000", repeat=5)
+def bench_retrieve_vendored(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import make_tree, make_vendored
+    from services.github.main import retrieve_python_files
+    root = Path(stack.enter_context(tempfile.TemporaryDirectory())) / "repo"
+    make_tree(root, 10, 20)
+    make_vendored(root, 2000)
+    return lambda: retrieve_python_files(str(root))
+
+
+@benchmark("eco_score_5000_issues", repeat=20)
+def bench_eco_score(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import make_carbon, make_quality
+    from main import calculate_eco_score
+    carbon, quality = make_carbon(), make_quality(5000)
+    return lambda: calculate_eco_score(carbon, quality)
+
+
+@benchmark("eco_scores_batch_2000x20", repeat=10)
+def bench_eco_scores_batch(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import make_carbon, make_quality
+    from main import calculate_eco_scores
+    carbon = [make_carbon(seed=i) for i in range(2000)]
+    quality = [make_quality(20, seed=i) for i in range(2000)]
+    return lambda: calculate_eco_scores(carbon, quality)
+
+
+@benchmark("sonar_eco_score_50000_issues", repeat=10)
+def bench_sonar_eco_score(case: str, stack: contextlib.ExitStack):
+    from benchmarks.stubs import make_issues
+    from services.sonarqube.sonar import calculate_eco_score
+    issues = {"issues": make_issues(50000), "total_issues": 50000, "project_key": "bench"}
+    return lambda: calculate_eco_score(issues)
+
+
+def _history_store(stack: contextlib.ExitStack):
+    from services import history
+    store = history.HistoryStore(Path(stack.enter_context(tempfile.TemporaryDirectory())) / "history.db")
+    stack.enter_context(mock.patch.object(history, "store", store))
+    return history, store
+
+
+@benchmark("history_insert_10000", repeat=10)
+def bench_history_insert(case: str, stack: contextlib.ExitStack):
+    from benchmarks.synthetic import make_carbon
+    history, store = _history_store(stack)
+    carbon = [make_carbon(seed=i) for i in range(10000)]
+    score = {"score": 72.5, "grade": "B"}
+
+    def run():
+        for i, result in enumerate(carbon):
+            history.record_analysis(None, f"mod_{i % 100}.py", carbon=result, eco_score=score,
+                                    repository="https://github.com/owner/project", code_hash=f"{i % 500}")
+        store.flush()
+    return run
+
+
+@benchmark("history_trend_repository_100000", repeat=50)
+def bench_history_trend(case: str, stack: contextlib.ExitStack):
+    history, store = _history_store(stack)
+    now = time.time()
+    rows = []
+    for i in range(100000):
+        # Analyses réparties sur 30 jours : l'agrégation porte sur ~720 heures
+        rows.append(history._row("carbon", now - (i % 720) * 3600, f"mod_{i % 100}.py", f"{i % 500}",
+                                 "https://github.com/owner/project", None,
+                                 energy_kwh=(i % 97) * 1e-6, emissions_kg=(i % 97) * 4e-7))
+    store.add(rows)
+    store.flush()
+    return lambda: history.trend("https://github.com/owner/project", bucket="day")
+
+
+@benchmark("carbon_noop_direct", repeat=5, slow=True)
+@benchmark("carbon_noop_codecarbon", repeat=2, slow=True)
+def bench_carbon_noop(case: str, stack: contextlib.ExitStack):
+    from services.carbon.carbon_analyzer import analyze_carbon_impact
+    backend = case.rsplit("_", 1)[1]
+    loop = asyncio.new_event_loop()
+    stack.callback(loop.close)
+    return lambda: loop.run_until_complete(analyze_carbon_impact("pass\n", "noop.py", backend=backend))
+
+
+@benchmark("sonar_issues_500", repeat=20)
+def bench_sonar_issues(case: str, stack: contextlib.ExitStack):
+    from services.sonarqube.sonar import get_sonar_issues
+    return lambda: get_sonar_issues("bench")
+
+
+@benchmark("sonar_wait_for_task", repeat=20)
+def bench_sonar_wait(case: str, stack: contextlib.ExitStack):
+    from services.sonarqube.sonar import wait_for_task
+    loop = asyncio.new_event_loop()
+    stack.callback(loop.close)
+    return lambda: loop.run_until_complete(wait_for_task("bench"))
+
+
+@benchmark("mistral_round_trip", repeat=20)
+def bench_mistral(case: str, stack: contextlib.ExitStack):
+    from services.github.main import curl_response, github_prompt
+    prompt = github_prompt("analyse ce projet owner/project")
+    return lambda: curl_response(prompt).json()
+
+
+@benchmark("qlty_project_data", repeat=10)
+@benchmark("qlty_project_data_revalidated", repeat=20)
+def bench_qlty(case: str, stack: contextlib.ExitStack):
+    from services.codeclimate import cache
+    from services.codeclimate.json_errors import main as qlty_main
+    stack.enter_context(mock.patch.object(cache, "QLTY_CACHE_DIR", Path(stack.enter_context(tempfile.TemporaryDirectory()))))
+    loop = asyncio.new_event_loop()
+    stack.callback(loop.close)
+    if case.endswith("revalidated"):
+        # TTL nul : chaque appel coûte une requête conditionnelle (304) par ressource
+        stack.enter_context(mock.patch.object(cache, "QLTY_CACHE_TTL", 0))
+        return lambda: loop.run_until_complete(qlty_main("owner", "project"))
+    projects = itertools.count()
+    return lambda: loop.run_until_complete(qlty_main("owner", f"project-{next(projects)}"))
+
+
+@benchmark("qlty_files_metrics_200", repeat=10)
+def bench_qlty_files(case: str, stack: contextlib.ExitStack):
+    from services.codeclimate.api.client import get_files_metrics
+    paths = [f"src/mod_{i}.py" for i in range(200)]
+    loop = asyncio.new_event_loop()
+    stack.callback(loop.close)
+    return lambda: loop.run_until_complete(get_files_metrics(paths, "stub", "owner", "project"))
+
+
+def measure(fn, repeat: int) -> dict:
+    """Un appel de chauffe puis `repeat` appels chronométrés, GC collecté avant chacun"""
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fn()
+        for _ in range(repeat):
+            gc.collect()
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 4),
+        "stdev_ms": round(statistics.stdev(timings), 4) if len(timings) > 1 else 0.0,
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit or None,
+        "timestamp": time.time(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Cas dont le meilleur temps dépasse la référence de plus de `tolerance` (et de `min_delta_ms` en absolu)
+
+    On compare le minimum plutôt que la médiane : c'est la mesure la moins sensible au bruit de la machine.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if not reference or "error" in result:
+            continue
+        before, after = reference["min_ms"], result["min_ms"]
+        result["baseline_min_ms"] = before
+        result["ratio"] = round(after / before, 3) if before else None
+        if after > before * (1 + tolerance) and after - before > min_delta_ms:
+            regressions.append({"name": name, "baseline_ms": before, "current_ms": after, "ratio": result["ratio"]})
+    return regressions
+
+
+def run(pattern: str = None, quick: bool = False, repeat_scale: float = 1.0) -> dict:
+    selected = [b for b in BENCHMARKS if (not pattern or re.search(pattern, b["name"])) and not (quick and b["slow"])]
+    results = {}
+    with StubServer(StubState(issues=500, qlty_items=2000, qlty_page_size=100)):
+        for bench in sorted(selected, key=lambda b: b["name"]):
+            with contextlib.ExitStack() as stack:
+                try:
+                    fn = bench["setup"](bench["name"], stack)
+                    results[bench["name"]] = measure(fn, max(1, int(bench["repeat"] * repeat_scale)))
+                except Exception as e:
+                    results[bench["name"]] = {"error": str(e)}
+            line = results[bench["name"]]
+            summary = f"{line['median_ms']:>10.3f} ms (min {line['min_ms']:.3f})" if "error" not in line else f"échec : {line['error']}"
+            print(f"{bench['name']:<32} {summary}")
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks EcoCode Analyzer")
+    parser.add_argument("-k", "--filter", help="Regex sur le nom des cas")
+    parser.add_argument("--quick", action="store_true", help="Ignore les cas lents (exécution réelle de code)")
+    parser.add_argument("--repeat-scale", type=float, default=1.0, help="Multiplie le nombre de répétitions")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Ralentissement relatif toléré sur le meilleur temps")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="Écart absolu en dessous duquel on ignore le bruit")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = {"environment": environment(), "results": run(args.filter, args.quick, args.repeat_scale)}
+
+    regressions = []
+    if args.baseline.exists() and not args.update_baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = compare(report["results"], baseline, args.tolerance, args.min_delta_ms)
+        report["baseline_environment"] = baseline.get("environment")
+    report["regressions"] = regressions
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Résultats écrits dans {args.output}")
+
+    if args.update_baseline:
+        baseline = {"environment": report["environment"], "results": {k: v for k, v in report["results"].items() if "error" not in v}}
+        if args.baseline.exists():
+            previous = json.loads(args.baseline.read_text()).get("results", {})
+            baseline["results"] = {**previous, **baseline["results"]}
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Référence mise à jour : {args.baseline}")
+        return 0
+
+    for r in regressions:
+        print(f"RÉGRESSION {r['name']} : {r['baseline_ms']:.3f} ms -> {r['current_ms']:.3f} ms (x{r['ratio']})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Serveurs locaux imitant les API externes (SonarQube, Mistral, qlty) pour les benchmarks et les tests de charge
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SEVERITIES = ("BLOCKER", "CRITICAL", "MAJOR", "MINOR", "INFO")
+MESSAGES = (
+    "Reduce the cognitive complexity of this function",
+    "Remove this unused local variable",
+    "Memory allocation inside a loop",
+    "Rename this variable",
+    "Duplicate code block",
+)
+
+
+STUB_RULES = (
+    {"key": "python:S1066", "type": "CODE_SMELL", "tags": ["clumsy"], "sysTags": [], "cleanCodeAttribute": "CLEAR"},
+    {"key": "python:S3776", "type": "CODE_SMELL", "tags": [], "sysTags": ["brain-overload"], "cleanCodeAttribute": "FOCUSED"},
+    {"key": "python:S1481", "type": "CODE_SMELL", "tags": [], "sysTags": ["unused"], "cleanCodeAttribute": "CLEAR"},
+    {"key": "python:S117", "type": "CODE_SMELL", "tags": [], "sysTags": ["convention"], "cleanCodeAttribute": "IDENTIFIABLE"},
+    {"key": "python:S7500", "type": "CODE_SMELL", "tags": [], "sysTags": ["performance"], "cleanCodeAttribute": "EFFICIENT"},
+)
+
+
+def make_issues(count: int, project_key: str = "stub", seed: int = 0) -> list:
+    """Issues SonarQube synthétiques, déterministes pour une graine donnée"""
+    rng = random.Random(seed)
+    return [
+        {
+            "key": f"issue-{i}",
+            "rule": rng.choice(("python:S1066", "python:S3776", "python:S1481", "python:S117")),
+            "severity": rng.choice(SEVERITIES),
+            "message": rng.choice(MESSAGES),
+            "line": rng.randint(1, 500),
+            "component": f"{project_key}:item_{i % 8}/analysis.py",
+        }
+        for i in range(count)
+    ]
+
+
+class StubState:
+    """Comportement configurable des stubs : latence simulée et taille des réponses"""
+
+    def __init__(self, latency_s: float = 0.0, issues: int = 200, mistral_content: str = "None",
+                 qlty_items: int = 50, qlty_page_size: int = 0, qlty_version: int = 0,
+                 qlty_failures: tuple = (), qlty_retry_after: str = None):
+        self.latency_s = latency_s
+        self.issues = issues
+        self.mistral_content = mistral_content
+        self.qlty_items = qlty_items
+        self.qlty_page_size = qlty_page_size
+        # Incrémenter qlty_version simule une nouvelle analyse : les ETag changent
+        self.qlty_version = qlty_version
+        # Statuts d'erreur renvoyés, dans l'ordre, aux premières requêtes qlty (429, 503…), avec Retry-After éventuel
+        self.qlty_failures = list(qlty_failures)
+        self.qlty_retry_after = qlty_retry_after
+        self.requests = {}
+        self.not_modified = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def count(self, service: str):
+        with self._lock:
+            self.requests[service] = self.requests.get(service, 0) + 1
+
+    def next_failure(self):
+        with self._lock:
+            return self.qlty_failures.pop(0) if self.qlty_failures else None
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+def _qlty_page(items: list, query: dict, page_size: int) -> dict:
+    if not page_size:
+        return {"data": items}
+    page = int(query.get("page[number]", ["1"])[0])
+    size = int(query.get("page[size]", [str(page_size)])[0])
+    chunk = items[(page - 1) * size:page * size]
+    body = {"data": chunk, "meta": {"page": page, "pageSize": size, "total": len(items)}}
+    if page * size < len(items):
+        body["links"] = {"next": f"?page[number]={page + 1}&page[size]={size}"}
+    return body
+
+
+def _make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, l'ACK retardé ajoute ~40 ms
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _delay(self):
+            if state.latency_s:
+                time.sleep(state.latency_s)
+
+        def do_GET(self):
+            # Requêtes simultanées observées par le serveur (max_in_flight) : contrôle des limites de concurrence
+            state.enter()
+            try:
+                self._get()
+            finally:
+                state.leave()
+
+        def _get(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            self._delay()
+
+            if url.path == "/api/server/version":
+                state.count("sonar")
+                return self._send(200, {"version": "stub"})
+            if url.path == "/api/ce/task":
+                state.count("sonar")
+                return self._send(200, {"task": {"id": query.get("id", [""])[0], "status": "SUCCESS"}})
+            if url.path == "/api/rules/search":
+                state.count("sonar_rules")
+                page, size = int(query.get("p", ["1"])[0]), int(query.get("ps", ["100"])[0])
+                return self._send(200, {"total": len(STUB_RULES), "p": page, "ps": size,
+                                        "paging": {"pageIndex": page, "pageSize": size, "total": len(STUB_RULES)},
+                                        "rules": list(STUB_RULES[(page - 1) * size:page * size])})
+            if url.path == "/api/issues/search":
+                state.count("sonar")
+                project_key = query.get("componentKeys", ["stub"])[0]
+                issues = make_issues(state.issues, project_key)
+                total = len(issues)
+                if "rules" in query:
+                    wanted = set(query["rules"][0].split(","))
+                    issues = [issue for issue in issues if issue["rule"] in wanted]
+                    total = len(issues)
+                issues = issues[:int(query.get("ps", ["100"])[0])]
+                return self._send(200, {"total": total, "paging": {"pageIndex": 1, "pageSize": len(issues), "total": total},
+                                        "issues": issues})
+
+            match = re.match(r"^/gh/([^/]+)/projects/([^/]+)/(metrics|issues|files|analyses/[^/]+)$", url.path)
+            if match:
+                state.count("qlty")
+                failure = state.next_failure()
+                if failure:
+                    headers = {"Retry-After": state.qlty_retry_after} if state.qlty_retry_after is not None else {}
+                    return self._send(failure, {"error": f"Erreur simulée {failure}"}, headers)
+                owner, project, resource = match.groups()
+                if resource == "metrics":
+                    items = [{"id": f"m{i}", "type": "metric", "attributes": {"value": i}} for i in range(state.qlty_items)]
+                elif resource == "issues":
+                    items = [{"id": f"i{i}", "type": "issue", "attributes": {"path": f"src/mod_{i}.py"}} for i in range(state.qlty_items)]
+                elif resource == "files":
+                    return self._send(200, {"data": {"path": query.get("path", [""])[0], "complexity": 3, "lines": 120}})
+                else:
+                    return self._send(200, {"id": resource.split("/")[-1], "state": "completed"})
+                body = _qlty_page(items, query, state.qlty_page_size)
+                etag = '"%s"' % hashlib.sha1(f"{state.qlty_version}:{self.path}".encode()).hexdigest()[:16]
+                if self.headers.get("If-None-Match") == etag:
+                    state.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                return self._send(200, body, {"ETag": etag})
+
+            self._send(404, {"error": f"Route inconnue : {url.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            self._delay()
+            if urlparse(self.path).path == "/v1/chat/completions":
+                state.count("mistral")
+                return self._send(200, {"choices": [{"message": {"role": "assistant", "content": state.mistral_content}}]})
+            self._send(404, {"error": f"Route inconnue : {self.path}"})
+
+    return Handler
+
+
+class StubServer:
+    """Serveur HTTP local, dans un thread, exposant les routes SonarQube, Mistral et qlty"""
+
+    def __init__(self, state: StubState = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = state or StubState()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self.state))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        """Variables d'environnement pointant les services vers ce stub (à poser avant leur import)"""
+        return {
+            "SONAR_HOST": self.url,
+            "SONAR_TOKEN": "stub",
+            "MISTRAL_API_URL": f"{self.url}/v1/chat/completions",
+            "MISTRAL_API_KEY": "stub",
+            "QLTY_API_URL": self.url,
+            "QLTY_TOKEN": "stub",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        os.environ.update(self.env())
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
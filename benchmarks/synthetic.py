@@ -0,0 +1,96 @@
+"""
+Générateurs déterministes d'entrées pour les benchmarks : modules Python, arborescences, issues
+"""
+import random
+from pathlib import Path
+
+FUNCTION_TEMPLATES = (
+    """def {name}(data):
+    total = 0
+    for i in range(len(data)):
+        for j in range(len(data)):
+            if data[i] > data[j]:
+                total += 1
+    return total
+""",
+    """def {name}(n):
+    if n < 2:
+        return n
+    return {name}(n - 1) + {name}(n - 2)
+""",
+    """def {name}(items):
+    result = [x * 2 for x in items if x % 3]
+    while result:
+        result.pop()
+    return {{k: v for k, v in enumerate(items)}}
+""",
+    """class {cls}:
+    def __init__(self, size):
+        self.values = list(range(size))
+
+    def {name}(self):
+        for value in self.values:
+            for other in self.values:
+                for third in self.values:
+                    if value + other == third:
+                        return value
+        return None
+""",
+)
+
+MODULE_SIZES = {"small": 5, "medium": 200, "huge": 4000}
+
+
+def make_module(functions: int, seed: int = 0) -> str:
+    """Module Python syntaxiquement valide contenant `functions` définitions variées"""
+    rng = random.Random(seed)
+    parts = ["import os\nimport json\nfrom typing import List\n"]
+    for i in range(functions):
+        template = rng.choice(FUNCTION_TEMPLATES)
+        parts.append(template.format(name=f"func_{i}", cls=f"Class{i}"))
+    parts.append('if __name__ == "__main__":\n    print(func_0([3, 1, 2]) if callable(func_0) else None)\n')
+    return "\n\n".join(parts)
+
+
+def make_tree(root: Path, directories: int, files_per_directory: int, seed: int = 0) -> Path:
+    """Arborescence de dépôt : fichiers .py, fichiers non Python et un dossier .git à ignorer"""
+    root.mkdir(parents=True, exist_ok=True)
+    (root / ".git" / "objects").mkdir(parents=True, exist_ok=True)
+    (root / ".git" / "objects" / "pack.py").write_text("# ignoré\n")
+    for d in range(directories):
+        directory = root / f"pkg_{d}" / f"sub_{d % 7}"
+        directory.mkdir(parents=True, exist_ok=True)
+        for f in range(files_per_directory):
+            (directory / f"mod_{f}.py").write_text(make_module(3, seed=seed + d * 1000 + f))
+        (directory / "README.md").write_text("documentation\n")
+    return root
+
+
+def make_vendored(root: Path, files: int, seed: int = 0) -> Path:
+    """Virtualenv commité par erreur et modules protobuf générés : contenu que l'ingestion doit ignorer"""
+    venv = root / ".venv"
+    (venv / "lib" / "site-packages").mkdir(parents=True, exist_ok=True)
+    (venv / "pyvenv.cfg").write_text("home = /usr/bin\n")
+    for f in range(files):
+        package = venv / "lib" / "site-packages" / f"dep_{f % 50}"
+        package.mkdir(exist_ok=True)
+        (package / f"mod_{f}.py").write_text(make_module(3, seed=seed + f))
+    (root / "proto").mkdir(exist_ok=True)
+    for f in range(files // 10):
+        (root / "proto" / f"service_{f}_pb2.py").write_text("# Generated by the protocol buffer compiler.  DO NOT EDIT!\n" + make_module(3, seed=f))
+    return root
+
+
+def make_quality(issues: int, seed: int = 0) -> dict:
+    """Résultat qualité au format de submit_code_safe"""
+    from benchmarks.stubs import make_issues
+    return {"issues": make_issues(issues, seed=seed)}
+
+
+def make_carbon(seed: int = 0) -> dict:
+    """Résultat carbone minimal au format de analyze_carbon_impact"""
+    rng = random.Random(seed)
+    return {
+        "carbon_impact": {"emissions_kg": rng.random() * 1e-5},
+        "complexity_analysis": {"complexity_score": rng.randint(0, 20)},
+    }
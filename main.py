@@ -2,21 +2,42 @@
 MCP Server - Analyseur de Code Écologique
 Point d'entrée principal qui orchestre tous les services
 """
-from mcp.server.fastmcp import FastMCP
-from pydantic import Field
+from mcp.server.fastmcp import FastMCP, Context
+from pydantic import BaseModel, Field
 from typing import Dict, Optional, List
 from enum import Enum
 import asyncio
 import json
-from services.sonarqube.sonar_analyzer import submit_code_safe
-from services.carbon.carbon_analyzer import analyze_carbon_impact, analyze_github_carbon
+import logging
+import os
 import mcp.types as types
-from services.github.main import all_together
-from services.codeclimate.json_errors import main as qlty_metrics
+from services.lazy import lazy_import
+from services.progress import progress_scope, report_stage
+from services.metrics import track_tool, mark_outcome, render_metrics
+from services.cancellation import deadline, run_blocking
+from services.jobs import job_manager
+from services.singleflight import singleflight, make_key, normalize_code, with_coalesced
+from services.history import record_analysis, trend, content_hash
+from services.artifacts import ARTIFACT_PAGE_BYTES, artifact_path, read_artifact, read_resource
+from services.responses import RESOURCE_URI, shape
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# Modules de service chargés au premier appel d'outil : le serveur répond à initialize sans payer leurs imports
+sonar_analyzer = lazy_import("services.sonarqube.sonar_analyzer")
+carbon_analyzer = lazy_import("services.carbon.carbon_analyzer")
+differential = lazy_import("services.carbon.differential")
+scaling = lazy_import("services.carbon.scaling")
+github = lazy_import("services.github.main")
+qlty = lazy_import("services.codeclimate.json_errors")
 
 mcp = FastMCP(
     "EcoCode Analyzer",
-    port=3000,
+    # FastMCP passe host="127.0.0.1" explicitement à ses Settings : FASTMCP_HOST n'est pris en compte qu'ici
+    host=os.getenv("FASTMCP_HOST", "127.0.0.1"),
+    port=int(os.getenv("PORT", "3000")),
     stateless_http=True
 )
 
@@ -26,75 +47,118 @@ class AnalysisType(str, Enum):
     QUALITY = "quality"
     GITHUB = "github"
 
+class EnergyBackend(str, Enum):
+    CODECARBON = "codecarbon"
+    DIRECT = "direct"
+
+class CarbonMode(str, Enum):
+    MEASURE = "measure"
+    PREDICT = "predict"
+    HYBRID = "hybrid"
+
+class BatchItem(BaseModel):
+    code: str = Field(description="Code Python à analyser")
+    filename: str = Field(default="analysis.py", description="Nom du fichier")
+
+class Detail(str, Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
+FIELDS_DESCRIPTION = "Champs à renvoyer en chemins pointés (ex: eco_score.score, items.*.eco_score) ; tout par défaut"
+DETAIL_DESCRIPTION = "full : tout en ligne ; summary : contenus volumineux (sortie, issues, fichier, notes) remplacés par des ressources ecocode://artifacts/{id} à lire au besoin"
+
+class TrendBucket(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+
+class JobKind(str, Enum):
+    FULL_ECO = "full_eco"
+    SONARQUBE = "sonarqube"
+    GITHUB = "github"
+
 async def safe_execute(coro, timeout=600):
     try:
-        print(f"Début de l'exécution (timeout: {timeout}s)...")
-        result = await asyncio.wait_for(coro, timeout=timeout)
-        print("Exécution terminée.")
+        await report_stage("start", f"Début de l'exécution (timeout: {timeout}s)")
+        # L'échéance suit le travail jusque dans les runners, git et les appels HTTP (services/cancellation.py)
+        with deadline(timeout):
+            result = await asyncio.wait_for(coro, timeout=timeout)
+        await report_stage("done", "Exécution terminée")
         return result
     except asyncio.TimeoutError:
-        print("Timeout atteint !")
+        mark_outcome("timeout")
+        await report_stage("timeout", "Timeout atteint")
         return {"status": "error", "message": "Timeout lors de l'exécution de la tâche."}
     except Exception as e:
-        print(f"Erreur : {str(e)}")
+        mark_outcome("error")
+        logger.exception("Erreur pendant l'exécution : %s", e)
         return {"status": "error", "message": f"Erreur : {str(e)}"}
 
-def calculate_eco_score(carbon_data: dict, quality_data: dict = None) -> dict:
-    """Calcule un score écologique global."""
-    score = 100
+GRADES = (("D", "Problématique"), ("C", "Acceptable"), ("B", "Bon"), ("A", "Excellent"))
 
-    carbon_impact = carbon_data.get("carbon_impact", {})
-    emissions = carbon_impact.get("emissions_kg", 0)
-    complexity = carbon_data.get("complexity_analysis", {}).get("complexity_score", 0)
+def _count_severity(quality_data: Optional[dict], severity: str) -> int:
+    if not quality_data or "issues" not in quality_data:
+        return 0
+    return sum(1 for issue in quality_data["issues"] if issue.get("severity") == severity)
 
-    score -= min(emissions * 10000, 30)
-    score -= min(complexity * 2, 40)
+def calculate_eco_scores(carbon_list: List[dict], quality_list: Optional[List[dict]] = None) -> List[dict]:
+    """Calcule les scores écologiques d'un lot en une seule passe vectorisée."""
+    import numpy as np
 
-    if quality_data and "issues" in quality_data:
-        critical_issues = sum(1 for issue in quality_data["issues"] if issue.get("severity") == "CRITICAL")
-        major_issues = sum(1 for issue in quality_data["issues"] if issue.get("severity") == "MAJOR")
+    quality_list = quality_list or [None] * len(carbon_list)
+    emissions = np.array([c.get("carbon_impact", {}).get("emissions_kg", 0) for c in carbon_list], dtype=float)
+    complexity = np.array([c.get("complexity_analysis", {}).get("complexity_score", 0) for c in carbon_list], dtype=float)
+    critical = np.array([_count_severity(q, "CRITICAL") for q in quality_list], dtype=int)
+    major = np.array([_count_severity(q, "MAJOR") for q in quality_list], dtype=int)
 
-        score -= critical_issues * 10
-        score -= major_issues * 5
+    scores = 100 - np.minimum(emissions * 10000, 30) - np.minimum(complexity * 2, 40) - critical * 10 - major * 5
+    scores = np.maximum(scores, 0)
+    grade_index = np.digitize(scores, [40, 60, 80])
 
-    score = max(0, score)
-
-    if score >= 80:
-        grade = "A"
-        label = "Excellent"
-    elif score >= 60:
-        grade = "B"
-        label = "Bon"
-    elif score >= 40:
-        grade = "C"
-        label = "Acceptable"
-    else:
-        grade = "D"
-        label = "Problématique"
+    return [
+        {
+            "score": round(float(scores[i]), 1),
+            "grade": GRADES[grade_index[i]][0],
+            "label": GRADES[grade_index[i]][1],
+            "emissions_kg": float(emissions[i]),
+            "complexity_score": float(complexity[i]),
+            "critical_issues": int(critical[i]),
+            "major_issues": int(major[i]),
+        }
+        for i in range(len(carbon_list))
+    ]
 
-    return {
-        "score": round(score, 1),
-        "grade": grade,
-        "label": label,
-        "emissions_kg": emissions,
-        "complexity_score": complexity,
-        "critical_issues": critical_issues,
-        "major_issues": major_issues,
-    }
+def calculate_eco_score(carbon_data: dict, quality_data: dict = None) -> dict:
+    """Calcule un score écologique global."""
+    return calculate_eco_scores([carbon_data], [quality_data])[0]
 
 @mcp.tool(
     title="Calcul impact carbone code",
     description="Mesure l'empreinte carbone et énergétique d'un code Python. Il est possible directement d'analyser l'impact carbone d'un fichier Python qui a été pris depuis GitHub. Il existe plusieurs méthodes d'évaluations pour créer de la redondance, il vaut mieux donc essayer d'utiliser tous.",
 )
+@track_tool
 async def carbon_impact_analysis(
     code: str = Field(description="Code/fichier Python à analyser"),
     filename: str = Field(default="analysis.py", description="Nom du fichier"),
+    backend: EnergyBackend = Field(default=EnergyBackend.CODECARBON, description="codecarbon (précis, démarrage lent) ou direct (RAPL / modèle temps CPU, quasi instantané)"),
+    profile_memory: bool = Field(default=False, description="Profil mémoire tracemalloc : pic, sites d'allocation, blocs par fonction (exécution nettement ralentie, énergie non comparable)"),
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
 ) -> Dict:
     try:
-        result = await safe_execute(analyze_carbon_impact(code, filename))
+        async def measure():
+            result = await safe_execute(carbon_analyzer.analyze_carbon_impact(code, filename, backend=backend.value, profile_memory=profile_memory))
+            # Mesure gonflée par tracemalloc : hors historique
+            if not profile_memory:
+                record_analysis(code, filename, carbon=result)
+            return result
+
+        key = make_key("carbon", code=normalize_code(code), filename=filename, backend=backend.value, profile_memory=profile_memory)
+        result, calls = await singleflight.do(key, measure)
         return {
             "status": "success",
-            "data": result,
+            "data": shape(result, "carbon", fields, detail.value),
+            "coalesced_calls": calls,
         }
     except Exception as e:
         return {
@@ -106,29 +170,145 @@ async def carbon_impact_analysis(
 #     title="Métriques et insight de qlty",
 #     description="Renvoie des métriques de compléxité et commentaire des erreurs par ligne",
 # )
-# def qlty_metrics_analysis(
+# async def qlty_metrics_analysis(
 #     github_owner: str = Field(description="owner du repo github à analyser"),
 #     github_project: str = Field(description="nom du repo github à analyser")
 # ):
 #     try:
 #     # if True:
-#         return qlty_metrics(github_owner, github_project)
+#         return await qlty.main(github_owner, github_project)
 #     except Exception as e:
 #         return {
 #             "status": "error",
 #             "message": f"Erreur lors de l'analyse qlty : {str(e)}",
 #         }
     
+def github_request_key(repo_github: str) -> str:
+    """Une URL (même partielle) est normalisée, un prompt libre est comparé sans la casse ni les espaces"""
+    text = " ".join(repo_github.split())
+    if " " not in text:
+        return make_key("github", repo=github.normalize_repo(text).lower())
+    return make_key("github", prompt=text.lower())
+
+async def run_github_analysis(repo_github: str) -> dict:
+    """Analyse GitHub dédupliquée : les appels identiques simultanés partagent le même clone et le même appel LLM"""
+    res, calls = await singleflight.do(github_request_key(repo_github), lambda: run_blocking(github.all_together, repo_github))
+    return with_coalesced(res, calls)
+
+async def run_sonar_analysis(code: str, filename: str = "analysis.py") -> dict:
+    """Scan SonarQube historisé, partagé entre l'outil direct et les travaux asynchrones"""
+    result = await safe_execute(sonar_analyzer.submit_code_safe(code, filename))
+    record_analysis(code, filename, quality=result)
+    return result
+
+async def run_full_eco_analysis(code: str, filename: str = "analysis.py", include_sonar: bool = True,
+                                backend: str = "codecarbon", mode: str = "measure") -> dict:
+    """Pipeline carbone + SonarQube + score, partagé entre l'outil direct et les travaux asynchrones"""
+    if mode == "predict":
+        await report_stage("predicting", "Estimation statique de l'énergie")
+        carbon_result = await asyncio.to_thread(carbon_analyzer.predict_carbon_impact, code, filename, backend)
+    elif mode == "hybrid":
+        await report_stage("predicting", "Estimation statique, mesure si le code exécute quelque chose")
+        carbon_result = await safe_execute(carbon_analyzer.analyze_carbon_hybrid(code, filename, backend=backend), timeout=600)
+    else:
+        await report_stage("carbon", "Début de l'analyse carbone")
+        carbon_result = await safe_execute(carbon_analyzer.analyze_carbon_impact(code, filename, backend=backend), timeout=600)
+
+    quality_result = {}
+    if include_sonar:
+        await report_stage("sonar", "Début de l'analyse SonarQube")
+        quality_result = await safe_execute(sonar_analyzer.submit_code_safe(code, filename), timeout=600)
+
+    await report_stage("scoring", "Calcul du score écologique")
+    eco_score = calculate_eco_score(carbon_result, quality_result)
+    record_analysis(code, filename, carbon=carbon_result, quality=quality_result, eco_score=eco_score)
+
+    return {
+        "status": "success",
+        "carbon_analysis": carbon_result,
+        "quality_analysis": quality_result,
+        "eco_score": eco_score,
+    }
+
 @mcp.tool(
-    title="Calcul impact carbone code",
-    description="Mesure l'empreinte carbone et énergétique d'un code Python. Il est possible directement d'analyser l'impact carbone d'un fichier Python qui a été pris depuis GitHub. Il existe plusieurs méthodes d'évaluations pour créer de la redondance, il vaut mieux donc essayer de toutes les utilisers.",
+    title="Analyse complète écologique",
+    description="Combine analyse carbone, avec la qualité du code, tout en donnant des recommandations d'un fichier ou code Python. Il existe plusieurs méthodes d'évaluations pour créer de la redondance, il vaut mieux donc essayer de toutes les utilisers.",
 )
-async def carbon_impact_analysis(
-    code: str = Field(description="Code Python à analyser"),
+@track_tool
+async def full_eco_analysis(
+    ctx: Context,
+    code: str,
+    filename: str = "analysis.py",
+    include_sonar: bool = True,
+    backend: EnergyBackend = EnergyBackend.CODECARBON,
+    mode: CarbonMode = CarbonMode.MEASURE,
+    fields: Optional[List[str]] = None,
+    detail: Detail = Detail.FULL,
+) -> dict:
+    try:
+        with progress_scope(ctx):
+            result = await run_full_eco_analysis(code, filename, include_sonar, backend.value, mode.value)
+        return shape(result, "full_eco", fields, detail.value)
+    except Exception as e:
+        logger.exception("Erreur lors de l'analyse complète : %s", e)
+        return {
+            "status": "error",
+            "message": f"Erreur lors de l'analyse complète : {str(e)}",
+        }
+
+@mcp.tool(
+    title="Analyse impact carbone GitHub",
+    description="Analyse l'impact carbone des fichiers Python d'un repo GitHub. mode='predict' estime la classe énergétique de tous les fichiers en quelques secondes sans rien exécuter, mode='hybrid' mesure en plus les fichiers choisis par l'ordonnanceur, mode='measure' ne fait que les mesures. L'ordonnanceur classe les fichiers (point d'entrée, complexité, fichiers qui l'importent, taille, énergie prédite) et mesure du haut du classement tant que le budget temps / énergie le permet ; schedule.files explique chaque choix.",
+)
+@track_tool
+async def github_carbon_analysis(
+    ctx: Context,
+    repo_url: str = Field(description="URL complète du repository GitHub public"),
+    mode: CarbonMode = Field(default=CarbonMode.PREDICT, description="predict, hybrid ou measure"),
+    measure_top: int = Field(default=5, description="Nombre maximal de fichiers à exécuter (hybrid, measure)"),
+    time_budget_s: Optional[float] = Field(default=None, description="Budget de temps des mesures en secondes (défaut : SCHEDULE_TIME_BUDGET_S)"),
+    energy_budget_kwh: Optional[float] = Field(default=None, description="Budget d'énergie des mesures en kWh (défaut : aucun)"),
+    backend: EnergyBackend = Field(default=EnergyBackend.DIRECT, description="Backend de mesure des fichiers exécutés"),
+    exclude_tests: bool = Field(default=False, description="Ignorer les fichiers et dossiers de tests"),
+    commit: Optional[str] = Field(default=None, description="SHA du commit à analyser (HEAD de la branche par défaut sinon)"),
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
+):
+    try:
+        with progress_scope(ctx):
+            result = await safe_execute(carbon_analyzer.analyze_github_carbon(github.normalize_repo(repo_url), mode.value, measure_top, backend.value, exclude_tests, commit, time_budget_s, energy_budget_kwh), timeout=600)
+        return {
+            "status": "success",
+            "data": shape(result, "github_carbon", fields, detail.value),
+        }
+    except Exception as e:
+        logger.exception("Erreur lors de l'analyse GitHub : %s", e)
+        return {
+            "status": "error",
+            "message": f"Erreur lors de l'analyse GitHub : {str(e)}",
+        }
+
+
+@mcp.tool(
+    title="Comparaison énergétique avant / après",
+    description="Vérifie si une optimisation fait réellement gagner de l'énergie : exécute la version de référence et la version candidate en alternance (AB, BA, ...) dans le même interpréteur chaud, puis renvoie l'écart d'énergie, de temps CPU et de durée avec un test apparié (p-value, IC 95 %) et un verdict : improved, regressed, negligible ou no_significant_difference. À préférer à deux appels séparés de carbon_impact_analysis.",
+)
+@track_tool
+async def carbon_diff_analysis(
+    ctx: Context,
+    baseline_code: str = Field(description="Version actuelle du code"),
+    candidate_code: str = Field(description="Version optimisée proposée"),
     filename: str = Field(default="analysis.py", description="Nom du fichier"),
+    rounds: int = Field(default=10, description="Nombre de paires A/B mesurées (2 à 50)"),
+    backend: EnergyBackend = Field(default=EnergyBackend.DIRECT, description="Backend de mesure énergétique"),
+    alpha: float = Field(default=0.05, description="Seuil de significativité"),
 ) -> Dict:
     try:
-        result = await safe_execute(analyze_carbon_impact(code, filename))
+        with progress_scope(ctx):
+            result = await safe_execute(
+                differential.analyze_carbon_diff(baseline_code, candidate_code, filename, min(max(rounds, 2), 50), backend.value, alpha),
+                timeout=600,
+            )
         return {
             "status": "success",
             "data": result,
@@ -136,80 +316,60 @@ async def carbon_impact_analysis(
     except Exception as e:
         return {
             "status": "error",
-            "message": f"Erreur lors de l'analyse carbone : {str(e)}",
+            "message": f"Erreur lors de la comparaison : {str(e)}",
         }
 
 @mcp.tool(
-    title="Analyse complète écologique",
-    description="Combine analyse carbone, avec la qualité du code, tout en donnant des recommandations d'un fichier ou code Python. Il existe plusieurs méthodes d'évaluations pour créer de la redondance, il vaut mieux donc essayer de toutes les utilisers.",
+    title="Complexité empirique d'une fonction",
+    description="Exécute une fonction du code à des tailles d'entrée croissantes (n, n×growth_factor, ...) dans le sandbox et ajuste temps et énergie contre n en log-log : renvoie la classe de croissance observée (O(1), O(log n), O(n), O(n log n), O(n^2), O(n^3), O(2^n)), la pente, et le coût extrapolé à target_size. Les paramètres int / list / str / dict / set sont déduits des annotations, valeurs par défaut ou noms (n, size, data, items...) ; sinon fournir input_generator, du code définissant make_input(n) qui renvoie le tuple d'arguments.",
 )
-async def full_eco_analysis(
-    code: str,
-    filename: str = "analysis.py",
-    include_sonar: bool = True,
-) -> dict:
+@track_tool
+async def complexity_scaling_analysis(
+    ctx: Context,
+    code: str = Field(description="Code Python contenant la fonction"),
+    function_name: str = Field(description="Nom de la fonction à mesurer"),
+    input_generator: Optional[str] = Field(default=None, description="Code définissant make_input(n) -> tuple d'arguments"),
+    start_size: int = Field(default=8, description="Première taille d'entrée"),
+    growth_factor: float = Field(default=2.0, description="Facteur entre deux tailles successives"),
+    max_size: int = Field(default=10_000_000, description="Taille maximale"),
+    time_budget_s: float = Field(default=20, description="Budget de temps total ; arrêt avant une taille qui le dépasserait"),
+    target_size: int = Field(default=1_000_000, description="Taille pour laquelle extrapoler temps et énergie"),
+) -> Dict:
     try:
-        print("🔍 Début de l'analyse carbone...")
-        carbon_result = await safe_execute(analyze_carbon_impact(code, filename), timeout=600)
-        print("Analyse carbone terminée.")
-
-        quality_result = {}
-        if include_sonar:
-            print("Début de l'analyse SonarQube...")
-            quality_result = await safe_execute(submit_code_safe(code, filename), timeout=600)
-            print("Analyse SonarQube terminée.")
-
-        print("Calcul du score écologique...")
-        eco_score = calculate_eco_score(carbon_result, quality_result)
-        print("Score écologique calculé.")
-
+        with progress_scope(ctx):
+            result = await safe_execute(
+                scaling.analyze_scaling(code, function_name, input_generator, "analysis.py", start_size, growth_factor,
+                                        max_size, min(time_budget_s, 300), target_size),
+                timeout=600,
+            )
         return {
             "status": "success",
-            "carbon_analysis": carbon_result,
-            "quality_analysis": quality_result,
-            "eco_score": eco_score,
+            "data": result,
         }
     except Exception as e:
-        print(f"Erreur : {str(e)}")
         return {
             "status": "error",
-            "message": f"Erreur lors de l'analyse complète : {str(e)}",
+            "message": f"Erreur lors de la mesure de complexité : {str(e)}",
         }
 
-# @mcp.tool(
-#     title="Analyse impact carbone GitHub",
-#     description="Analyse l'impact carbone des fichiers Python d'un repo GitHub",
-# )
-# async def github_carbon_analysis(repo_url):
-#     try:
-#         print(f"🔍 Début de l'analyse GitHub pour {repo_url}...")
-#         result = await safe_execute(analyze_github_carbon(repo_url), timeout=600)
-#         print("Analyse GitHub terminée.")
-#         return {
-#             "status": "success",
-#             "data": result,
-#         }
-#     except Exception as e:
-#         print(f"Erreur lors de l'analyse GitHub : {str(e)}")
-#         return {
-#             "status": "error",
-#             "message": f"Erreur lors de l'analyse GitHub : {str(e)}",
-#         }
-
-
 @mcp.tool(
     title="Submit Code for SonarQube Analysis",
     description="Soumet un fichier de code Python à SonarQube via SSH et retourne les problèmes détectés. Il est possible d'analyser directement un fichier que l'on a pris depuis Github sans demander à l'utilisateur son avis.",
 )
+@track_tool
 async def run_sonarqube_analysis(
+    ctx: Context,
     code: str = Field(description="Code source à analyser"),
     filename: str = Field(default="analysis.py", description="Nom du fichier"),
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
 ) -> Dict:
     try:
-        result = await  safe_execute(submit_code_safe(code, filename))
+        with progress_scope(ctx):
+            result = await run_sonar_analysis(code, filename)
         return {
             "status": "success",
-            "data": result,
+            "data": shape(result, "sonar", fields, detail.value),
         }
     except Exception as e:
         return {
@@ -221,9 +381,209 @@ async def run_sonarqube_analysis(
     title="Analyse repo github",
     description="Analyse les utilisations de fonctions et de fichier dans un repositery github contenant du code Python à partir d'un paramètre repo_github correspondant à l'url complet du repositery (qui doit être public). Si l'utilisateur ne donne qu'une partie de l'url, remplie la. Renvoie le fichier le plus important à optimiser et des notes d'optimisations. Contient des données de complexité algorithmique. Le fichier est celui qu'il faudrait faire l'analyse avec les autres outils. Les informations générales (notes d'optimisations) sont utiles à dire à l'utilisateur.",
 )
-async def github_repo_analysis(repo_github:str):
-    res = all_together(repo_github)
-    return res
+@track_tool
+async def github_repo_analysis(
+    ctx: Context,
+    repo_github: str,
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
+):
+    try:
+        with progress_scope(ctx):
+            result = await safe_execute(run_github_analysis(repo_github), timeout=600)
+        if result.get("status") == "error":
+            return result
+        return shape(result, "github", fields, detail.value)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Erreur lors de l'analyse du repository : {str(e)}",
+        }
+
+@mcp.tool(
+    title="Analyse écologique par lot",
+    description="Analyse plusieurs fichiers Python en un seul appel (liste de {code, filename}) : un seul scan SonarQube pour tout le lot, des runners de mesure partagés et un calcul de score groupé. Renvoie un résultat par fichier et un agrégat ; un fichier interrompu (budget CPU / durée par fichier) ou non exécuté porte une erreur et n'est ni noté ni agrégé. Préférer cet outil à des appels répétés fichier par fichier.",
+)
+@track_tool
+async def batch_eco_analysis(
+    ctx: Context,
+    items: List[BatchItem] = Field(description="Fichiers à analyser"),
+    include_sonar: bool = Field(default=True, description="Inclure SonarQube"),
+    backend: EnergyBackend = Field(default=EnergyBackend.DIRECT, description="Backend de mesure énergétique"),
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
+) -> Dict:
+    try:
+        with progress_scope(ctx):
+            result = await run_batch_eco_analysis([item.model_dump() for item in items], include_sonar, backend.value)
+        return shape(result, "batch", fields, detail.value)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Erreur lors de l'analyse par lot : {str(e)}",
+        }
+
+async def run_batch_eco_analysis(items: List[dict], include_sonar: bool = True, backend: str = "direct") -> dict:
+    """Mesures carbone et scan SonarQube du lot en parallèle, puis scoring vectorisé"""
+    if not items:
+        return {"status": "error", "message": "Lot vide"}
+    await report_stage("batch", f"Analyse de {len(items)} fichiers")
+    carbon_task = safe_execute(carbon_analyzer.analyze_carbon_batch(items, backend=backend), timeout=600)
+    if include_sonar:
+        carbon_results, quality = await asyncio.gather(carbon_task, safe_execute(sonar_analyzer.submit_batch_safe(items), timeout=600))
+    else:
+        carbon_results, quality = await carbon_task, {}
+    if isinstance(carbon_results, dict):
+        return carbon_results
+    quality_items = quality.get("items") or [None] * len(items)
+
+    await report_stage("scoring", "Calcul des scores écologiques")
+    # Fichiers interrompus ou jamais exécutés : énergie nulle non mesurée, ni score ni agrégat
+    measured = [i for i, carbon in enumerate(carbon_results) if "error" not in carbon]
+    scores = [{"error": carbon.get("error")} for carbon in carbon_results]
+    for i, score in zip(measured, calculate_eco_scores([carbon_results[i] for i in measured], [quality_items[i] for i in measured])):
+        scores[i] = score
+    for item, carbon, item_quality, score in zip(items, carbon_results, quality_items, scores):
+        record_analysis(item["code"], item["filename"], carbon=carbon, quality=item_quality, eco_score=score)
+    results = [
+        {
+            "filename": item["filename"],
+            "carbon_analysis": carbon,
+            "quality_analysis": item_quality or {},
+            "eco_score": score,
+        }
+        for item, carbon, item_quality, score in zip(items, carbon_results, quality_items, scores)
+    ]
+    scored = [scores[i] for i in measured]
+    grades = [score["grade"] for score in scored]
+    return {
+        "status": "success",
+        "items": results,
+        "aggregate": {
+            "files": len(items),
+            "files_measured": len(scored),
+            "files_failed": len(items) - len(scored),
+            "mean_score": round(sum(score["score"] for score in scored) / len(scored), 1) if scored else None,
+            "min_score": min((score["score"] for score in scored), default=None),
+            "grades": {grade: grades.count(grade) for grade, _ in reversed(GRADES)},
+            "total_emissions_kg": sum(score["emissions_kg"] for score in scored),
+            "total_energy_kwh": sum(carbon_results[i]["carbon_impact"].get("energy_kwh", 0) for i in measured),
+            "critical_issues": sum(score["critical_issues"] for score in scored),
+            "major_issues": sum(score["major_issues"] for score in scored),
+            "sonar_error": quality.get("error"),
+        },
+    }
+
+@mcp.tool(
+    title="Soumettre une analyse asynchrone",
+    description="Lance une analyse longue en arrière-plan et renvoie immédiatement un job_id. kind vaut 'full_eco' (code, filename, include_sonar), 'sonarqube' (code, filename) ou 'github' (repo_github). Suivre ensuite avec get_analysis_job_status puis récupérer le résultat avec get_analysis_job_result.",
+)
+@track_tool
+async def submit_analysis_job(
+    kind: JobKind = Field(description="Type d'analyse : full_eco, sonarqube ou github"),
+    code: Optional[str] = Field(default=None, description="Code Python à analyser (full_eco, sonarqube)"),
+    filename: str = Field(default="analysis.py", description="Nom du fichier"),
+    include_sonar: bool = Field(default=True, description="Inclure SonarQube (full_eco)"),
+    repo_github: Optional[str] = Field(default=None, description="URL du repository (github)"),
+    backend: EnergyBackend = Field(default=EnergyBackend.CODECARBON, description="Backend de mesure énergétique (full_eco)"),
+    mode: CarbonMode = Field(default=CarbonMode.MEASURE, description="measure, predict ou hybrid (full_eco)"),
+) -> Dict:
+    if kind == JobKind.GITHUB:
+        if not repo_github:
+            return {"status": "error", "message": "repo_github est requis pour kind='github'"}
+        factory = lambda: run_github_analysis(repo_github)
+        params = {"repo_github": repo_github}
+    else:
+        if code is None:
+            return {"status": "error", "message": f"code est requis pour kind='{kind.value}'"}
+        if kind == JobKind.FULL_ECO:
+            factory = lambda: run_full_eco_analysis(code, filename, include_sonar, backend.value, mode.value)
+        else:
+            factory = lambda: run_sonar_analysis(code, filename)
+        params = {"filename": filename}
+    return job_manager.submit(kind.value, factory, params)
+
+@mcp.tool(
+    title="Statut d'une analyse asynchrone",
+    description="Renvoie l'état (queued, running, done, failed), la dernière étape et le temps écoulé d'un travail soumis avec submit_analysis_job.",
+)
+@track_tool
+async def get_analysis_job_status(job_id: str = Field(description="Identifiant renvoyé par submit_analysis_job")) -> Dict:
+    return job_manager.status(job_id)
+
+@mcp.tool(
+    title="Résultat d'une analyse asynchrone",
+    description="Renvoie le résultat d'un travail terminé (state = done). Les résultats sont conservés pendant un temps limité après la fin du travail.",
+)
+@track_tool
+async def get_analysis_job_result(
+    job_id: str = Field(description="Identifiant renvoyé par submit_analysis_job"),
+    fields: Optional[List[str]] = Field(default=None, description=FIELDS_DESCRIPTION + " (préfixés par result.)"),
+    detail: Detail = Field(default=Detail.FULL, description=DETAIL_DESCRIPTION),
+) -> Dict:
+    status = job_manager.result(job_id)
+    heavy_kind = {JobKind.FULL_ECO.value: "full_eco", JobKind.SONARQUBE.value: "sonar"}.get(status.get("kind"), "github")
+    return shape(status, heavy_kind, fields, detail.value, root="result.", keep=("status", "job_id", "state"))
+
+@mcp.tool(
+    title="Tendances énergie et score",
+    description="Renvoie l'évolution dans le temps de l'énergie mesurée et estimée, des émissions, de la complexité, des issues SonarQube et du score écologique d'un fichier ou d'un repository GitHub. Toutes les analyses faites avec les autres outils sont historisées : donner repository (URL, même partielle), path (chemin dans le repo) et/ou code pour retrouver les analyses d'une version précise. Le code analysé hors repository est historisé par contenu : le retrouver en passant code.",
+)
+@track_tool
+async def analysis_trends(
+    repository: Optional[str] = Field(default=None, description="URL du repository GitHub analysé"),
+    path: Optional[str] = Field(default=None, description="Nom du fichier ou chemin relatif dans le repository"),
+    code: Optional[str] = Field(default=None, description="Code exact dont on veut l'historique"),
+    days: int = Field(default=30, description="Fenêtre d'historique en jours"),
+    bucket: TrendBucket = Field(default=TrendBucket.DAY, description="Agrégation par heure, jour ou semaine"),
+) -> Dict:
+    if not (repository or path or code):
+        return {"status": "error", "message": "repository, path ou code est requis"}
+    try:
+        repository = github.normalize_repo(repository) if repository else None
+        data = await asyncio.to_thread(trend, repository, path, content_hash(code), days, bucket.value)
+        return {
+            "status": "success",
+            "data": data,
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Erreur lors de la lecture de l'historique : {str(e)}",
+        }
+
+@mcp.tool(
+    title="Sortie complète d'une exécution",
+    description="Renvoie par pages la sortie complète d'un programme mesuré lorsqu'elle a été tronquée dans execution_output (output_capture.stdout.artifact_id). Relancer avec offset = next_offset tant que next_offset n'est pas null.",
+)
+@track_tool
+async def get_execution_output(
+    artifact_id: str = Field(description="Identifiant d'artefact (output_capture.*.artifact_id)"),
+    offset: int = Field(default=0, description="Position de départ en octets"),
+    limit: int = Field(default=ARTIFACT_PAGE_BYTES, description="Taille maximale de la page en octets"),
+) -> Dict:
+    return await asyncio.to_thread(read_artifact, artifact_id, offset, limit)
+
+@mcp.resource(
+    RESOURCE_URI,
+    name="artifact",
+    title="Contenu déchargé d'un résultat",
+    description="Partie volumineuse d'un résultat renvoyé en mode summary : sortie d'exécution, issues SonarQube (JSON), contenu de fichier ou notes d'analyse.",
+    mime_type="text/plain",
+)
+async def artifact_resource(artifact_id: str) -> str:
+    return await asyncio.to_thread(read_resource, artifact_id)
+
+@mcp.custom_route("/artifacts/{artifact_id}", methods=["GET"])
+async def artifact_endpoint(request: Request):
+    path = artifact_path(request.path_params["artifact_id"])
+    if path is None:
+        return PlainTextResponse("Artefact inconnu ou expiré", status_code=404)
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 async def test_carbon_impact():
     code = """
@@ -270,7 +630,7 @@ if __name__ == "__main__":
     duplicate_code()
     sql_injection_risk()
         """
-    result = await safe_execute(analyze_carbon_impact(code, "test.py"), timeout=600)
+    result = await safe_execute(carbon_analyzer.analyze_carbon_impact(code, "test.py"), timeout=600)
     print("Résultat analyse carbone :", result)
 
 async def test_sonarqube():
@@ -318,17 +678,34 @@ if __name__ == "__main__":
     duplicate_code()
     sql_injection_risk()
 """
-    result = await safe_execute(submit_code_safe(code, "test.py"), timeout=600)
+    result = await safe_execute(sonar_analyzer.submit_code_safe(code, "test.py"), timeout=600)
     print("Résultat SonarQube :", result)
 
 async def test_github():
     repo_url = "https://github.com/psf/requests"  # Exemple de repo
-    result = await safe_execute(analyze_github_carbon(repo_url), timeout=600)
+    result = await safe_execute(carbon_analyzer.analyze_github_carbon(repo_url), timeout=600)
     print("Résultat GitHub :", result)
 
 
+async def serve():
+    """Équivalent de mcp.run(transport="streamable-http"), avec préchauffage optionnel après ouverture du port"""
+    import uvicorn
+    from services.warmup import ECOCODE_WARMUP, warmup_after_start
+
+    config = uvicorn.Config(
+        mcp.streamable_http_app(),
+        host=mcp.settings.host,
+        port=mcp.settings.port,
+        log_level=mcp.settings.log_level.lower(),
+    )
+    server = uvicorn.Server(config)
+    if ECOCODE_WARMUP:
+        asyncio.create_task(warmup_after_start(server))
+    await server.serve()
+
+
 if __name__ == "__main__":
     # asyncio.run(test_carbon_impact())
     # asyncio.run(test_sonarqube())
     # asyncio.run(test_github())
-    mcp.run(transport="streamable-http")
+    asyncio.run(serve())
@@ -0,0 +1,73 @@
+#!/usr/bin/env bash
+# Démarre N workers EcoCode Analyzer (un processus et une boucle asyncio chacun) derrière l'upstream nginx
+#
+#   ECOCODE_WORKERS=4 scripts/start_services.sh
+#
+# Les workers partagent l'état SQLite (travaux, single-flight), l'historique et les caches sur disque.
+# Chaque worker garde ses propres métriques : Prometheus interroge http://HOST:PORT/metrics de chacun.
+#
+# L'upstream nginx est écrit dans nginx/generated/ecocode_workers.conf (non versionné). Sous docker-compose,
+# le service nginx monte ./nginx/generated sur /etc/nginx/ecocode et joint les workers de l'hôte par
+# host.docker.internal (extra_hosts: "host.docker.internal:host-gateway") ; ECOCODE_NGINX_CONTAINER désigne
+# le conteneur à recharger.
+set -euo pipefail
+
+ROOT_DIR="$(cd "$(dirname "$0")/.." && pwd)"
+RUN_DIR="${ECOCODE_RUN_DIR:-$HOME/.cache/ecocode/run}"
+CORES="$(nproc 2>/dev/null || getconf _NPROCESSORS_ONLN)"
+WORKERS="${ECOCODE_WORKERS:-$CORES}"
+BASE_PORT="${ECOCODE_BASE_PORT:-3001}"
+# Adresse des workers vue par nginx : 127.0.0.1 pour un nginx lancé sur l'hôte
+UPSTREAM_HOST="${ECOCODE_UPSTREAM_HOST:-host.docker.internal}"
+UPSTREAM_DIR="${ECOCODE_NGINX_UPSTREAM_DIR:-$ROOT_DIR/nginx/generated}"
+NGINX_CONTAINER="${ECOCODE_NGINX_CONTAINER:-}"
+PYTHON="${PYTHON:-python}"
+
+export ECOCODE_SHARED_STATE=sqlite
+# Joignables depuis le conteneur nginx (passerelle docker) ; 127.0.0.1 suffit si nginx tourne sur l'hôte
+if [[ "$UPSTREAM_HOST" == "127.0.0.1" || "$UPSTREAM_HOST" == "localhost" ]]; then
+    export FASTMCP_HOST="${FASTMCP_HOST:-127.0.0.1}"
+else
+    export FASTMCP_HOST="${FASTMCP_HOST:-0.0.0.0}"
+fi
+# Les runners batch se partagent les cœurs entre workers au lieu d'en lancer nproc chacun
+export BATCH_RUNNER_WORKERS="${BATCH_RUNNER_WORKERS:-$(( (CORES + WORKERS - 1) / WORKERS ))}"
+
+mkdir -p "$RUN_DIR" "$UPSTREAM_DIR"
+cd "$ROOT_DIR"
+UPSTREAM_CONF="$UPSTREAM_DIR/ecocode_workers.conf"
+# Écrit à côté puis renommé : nginx ne lit jamais une liste partielle
+UPSTREAM_TMP="$UPSTREAM_CONF.tmp"
+echo "# Généré par scripts/start_services.sh ($WORKERS workers)" > "$UPSTREAM_TMP"
+
+for ((i = 0; i < WORKERS; i++)); do
+    port=$((BASE_PORT + i))
+    pidfile="$RUN_DIR/worker-$port.pid"
+    if [[ -f "$pidfile" ]] && kill -0 "$(cat "$pidfile")" 2>/dev/null; then
+        echo "Worker déjà actif sur le port $port"
+    else
+        PORT="$port" nohup "$PYTHON" main.py >"$RUN_DIR/worker-$port.log" 2>&1 &
+        echo $! >"$pidfile"
+        echo "Worker démarré sur le port $port (pid $(cat "$pidfile"))"
+    fi
+    echo "server $UPSTREAM_HOST:$port max_fails=3 fail_timeout=10s;" >> "$UPSTREAM_TMP"
+done
+mv -f "$UPSTREAM_TMP" "$UPSTREAM_CONF"
+
+for ((i = 0; i < WORKERS; i++)); do
+    port=$((BASE_PORT + i))
+    for _ in $(seq 1 300); do
+        curl -fs "http://127.0.0.1:$port/metrics" >/dev/null 2>&1 && break
+        sleep 0.2
+    done
+done
+
+if [[ "${ECOCODE_NGINX_RELOAD:-1}" != "1" ]]; then
+    echo "Upstream écrit dans $UPSTREAM_CONF : (re)charger nginx avec nginx/nginx.conf"
+elif [[ -n "$NGINX_CONTAINER" ]]; then
+    docker exec "$NGINX_CONTAINER" nginx -s reload && echo "nginx ($NGINX_CONTAINER) rechargé : upstream ecocode ($WORKERS workers)"
+elif command -v nginx >/dev/null && pgrep -x nginx >/dev/null; then
+    nginx -s reload && echo "nginx rechargé : upstream ecocode ($WORKERS workers)"
+else
+    echo "Upstream écrit dans $UPSTREAM_CONF : (re)charger nginx avec nginx/nginx.conf"
+fi
@@ -0,0 +1,20 @@
+#!/usr/bin/env bash
+# Arrête les workers démarrés par scripts/start_services.sh (SIGTERM puis SIGKILL après 15 s)
+set -euo pipefail
+
+RUN_DIR="${ECOCODE_RUN_DIR:-$HOME/.cache/ecocode/run}"
+
+shopt -s nullglob
+for pidfile in "$RUN_DIR"/worker-*.pid; do
+    pid="$(cat "$pidfile")"
+    if kill -0 "$pid" 2>/dev/null; then
+        kill -TERM "$pid"
+        for _ in $(seq 1 150); do
+            kill -0 "$pid" 2>/dev/null || break
+            sleep 0.1
+        done
+        kill -0 "$pid" 2>/dev/null && kill -KILL "$pid"
+        echo "Worker $pid arrêté ($(basename "$pidfile" .pid))"
+    fi
+    rm -f "$pidfile"
+done
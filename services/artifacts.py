@@ -0,0 +1,211 @@
+"""
+Sorties des programmes mesurés : capture bornée (tête + anneau de queue) et artefacts complets sur disque
+Seuls les premiers et derniers octets remontent dans la réponse MCP ; le flux complet n'est écrit sur
+disque qu'au premier dépassement et se relit ensuite par pages (outil get_execution_output, route /artifacts).
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = Path(os.path.expanduser(os.getenv("ARTIFACT_DIR", "~/.cache/ecocode/artifacts")))
+ARTIFACT_TTL = int(os.getenv("ARTIFACT_TTL", "86400"))
+# Au-delà, même l'artefact est tronqué (reste sous SANDBOX_FSIZE_MB pour les fichiers écrits par les runners)
+ARTIFACT_MAX_MB = int(os.getenv("ARTIFACT_MAX_MB", "64"))
+OUTPUT_HEAD_KB = int(os.getenv("OUTPUT_HEAD_KB", "16"))
+OUTPUT_TAIL_KB = int(os.getenv("OUTPUT_TAIL_KB", "48"))
+ARTIFACT_PAGE_BYTES = 65536
+# Lecture d'un artefact en ressource MCP (d'un seul tenant) : au-delà, get_execution_output pagine
+ARTIFACT_RESOURCE_MAX_KB = int(os.getenv("ARTIFACT_RESOURCE_MAX_KB", "4096"))
+
+_ID = re.compile(r"^[a-z]+-[0-9a-f]{32}$")
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def prune(now: Optional[float] = None):
+    """Supprime les artefacts expirés (au plus une fois par minute)"""
+    global _last_prune
+    now = now or time.time()
+    with _prune_lock:
+        if now - _last_prune < 60:
+            return
+        _last_prune = now
+    try:
+        entries = list(os.scandir(ARTIFACT_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > ARTIFACT_TTL:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def new_artifact(kind: str) -> tuple:
+    """Identifiant et chemin d'un nouvel artefact"""
+    prune()
+    ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+    artifact_id = f"{kind}-{uuid4().hex}"
+    return artifact_id, ARTIFACT_DIR / f"{artifact_id}.log"
+
+
+def save_artifact(kind: str, content: str) -> str:
+    """Artefact adressé par son contenu : un même contenu déchargé plusieurs fois n'est écrit qu'une fois"""
+    prune()
+    data = content.encode("utf-8")
+    artifact_id = f"{kind}-{hashlib.sha256(data).hexdigest()[:32]}"
+    path = ARTIFACT_DIR / f"{artifact_id}.log"
+    try:
+        os.utime(path)
+        return artifact_id
+    except OSError:
+        pass
+    ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return artifact_id
+
+
+def artifact_path(artifact_id: str) -> Optional[Path]:
+    if not _ID.match(artifact_id):
+        return None
+    path = ARTIFACT_DIR / f"{artifact_id}.log"
+    return path if path.is_file() else None
+
+
+def read_artifact(artifact_id: str, offset: int = 0, limit: int = ARTIFACT_PAGE_BYTES) -> dict:
+    """Page [offset, offset + limit) d'un artefact ; next_offset vaut None à la fin"""
+    path = artifact_path(artifact_id)
+    if path is None:
+        return {"status": "error", "message": f"Artefact inconnu ou expiré : {artifact_id}"}
+    limit = max(1, min(limit, ARTIFACT_RESOURCE_MAX_KB * 1024))
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, offset))
+        data = f.read(limit)
+    end = max(0, offset) + len(data)
+    return {
+        "status": "success",
+        "artifact_id": artifact_id,
+        "size": size,
+        "offset": offset,
+        "content": data.decode("utf-8", errors="replace"),
+        "next_offset": end if end < size else None,
+    }
+
+
+def read_resource(artifact_id: str) -> str:
+    """Contenu d'un artefact pour une ressource MCP, borné à ARTIFACT_RESOURCE_MAX_KB"""
+    page = read_artifact(artifact_id, 0, ARTIFACT_RESOURCE_MAX_KB * 1024)
+    if page["status"] == "error":
+        raise ValueError(page["message"])
+    if page["next_offset"] is not None:
+        return page["content"] + (f"\n[... {page['size'] - page['next_offset']} octets restants : "
+                                  f"get_execution_output(artifact_id='{artifact_id}', offset={page['next_offset']}) ...]\n")
+    return page["content"]
+
+
+class OutputCapture:
+    """Tête + anneau de queue bornés ; au premier dépassement, le flux complet est déversé dans un artefact"""
+
+    def __init__(self, kind: str = "output", head_bytes: Optional[int] = None, tail_bytes: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.kind = kind
+        self.head_limit = OUTPUT_HEAD_KB * 1024 if head_bytes is None else head_bytes
+        self.tail_limit = OUTPUT_TAIL_KB * 1024 if tail_bytes is None else tail_bytes
+        self.max_bytes = ARTIFACT_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.artifact_id = None
+        self.artifact_bytes = 0
+        self._spill = None
+        self._spill_attempted = False
+
+    def _open_spill(self):
+        self._spill_attempted = True
+        try:
+            self.artifact_id, path = new_artifact(self.kind)
+            self._spill = open(path, "wb")
+        except OSError as e:
+            logger.warning("Artefact de sortie non créé : %s", e)
+            self.artifact_id, self._spill = None, None
+            return
+        # Rien n'a encore été écarté : tête + queue forment exactement le début du flux
+        self._write_spill(bytes(self.head))
+        self._write_spill(bytes(self.tail))
+
+    def _write_spill(self, chunk: bytes):
+        room = self.max_bytes - self.artifact_bytes
+        if self._spill is not None and room > 0:
+            self._spill.write(chunk[:room])
+            self.artifact_bytes += min(len(chunk), room)
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        if not self._spill_attempted and self.total + len(chunk) > self.head_limit + self.tail_limit:
+            self._open_spill()
+        self.total += len(chunk)
+        if self._spill is not None:
+            self._write_spill(chunk)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self.tail += chunk[-self.tail_limit:] if self.tail_limit else b""
+            excess = len(self.tail) - self.tail_limit
+            if excess > 0:
+                del self.tail[:excess]
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def tail_bytes(self, size: int = 4096) -> bytes:
+        return bytes((self.head + self.tail)[-size:])
+
+    def text(self) -> str:
+        if not self.omitted:
+            return (self.head + self.tail).decode("utf-8", errors="replace")
+        where = f"sortie complète : artefact {self.artifact_id}" if self.artifact_id else "sortie complète indisponible"
+        marker = f"\n[... {self.omitted} octets omis sur {self.total}, {where} ...]\n"
+        return self.head.decode("utf-8", errors="replace") + marker + self.tail.decode("utf-8", errors="replace")
+
+    def summary(self) -> dict:
+        return {
+            "bytes": self.total,
+            "truncated": self.omitted > 0,
+            "omitted_bytes": self.omitted,
+            "artifact_id": self.artifact_id,
+            "artifact_complete": self.artifact_id is not None and self.artifact_bytes == self.total,
+        }
+
+
+def capture_file(path, kind: str = "output", chunk_size: int = 65536) -> OutputCapture:
+    """Relit un fichier de sortie écrit par un runner à travers une capture bornée"""
+    capture = OutputCapture(kind)
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                capture.write(chunk)
+    except OSError:
+        pass
+    capture.close()
+    return capture
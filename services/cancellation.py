@@ -0,0 +1,134 @@
+"""
+Annulation et échéance propagées à tout le travail lancé par un outil
+L'échéance de safe_execute (ou d'un travail asynchrone) est posée dans un contextvar : sandbox, git et appels
+HTTP bornent leurs délais par le temps restant. Le code bloquant passe par run_blocking : si la tâche est
+annulée (timeout, client déconnecté), les callbacks on_cancel du thread tuent ses processus, puis on attend
+la fin du thread pour que les répertoires temporaires ne soient supprimés qu'après la mort du runner.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from services.metrics import Counter, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Attente maximale du thread après annulation (ses processus tués, il rend la main bien avant)
+CANCEL_GRACE_S = float(os.getenv("CANCEL_GRACE_S", "10"))
+
+CANCELLATIONS_TOTAL = Counter(
+    "ecocode_cancellations_total",
+    "Travaux arrêtés par une annulation ou une échéance (runner, git, scanner, thread)",
+    ("kind",),
+)
+REGISTRY.append(CANCELLATIONS_TOTAL)
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("ecocode_deadline", default=None)
+_token: contextvars.ContextVar[Optional["CancelToken"]] = contextvars.ContextVar("ecocode_cancel_token", default=None)
+
+
+class CancelToken:
+    """Annulation vue depuis un thread : chaque callback enregistré est appelé une fois, à l'annulation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Enregistre callback (appelé tout de suite si déjà annulé) ; renvoie la fonction de désenregistrement"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.exception("Erreur pendant l'annulation : %s", e)
+
+
+@contextmanager
+def deadline(timeout: Optional[float]):
+    """Échéance du bloc ; une échéance englobante plus proche reste en vigueur"""
+    current = _deadline.get()
+    new = time.monotonic() + timeout if timeout else None
+    if current is not None and (new is None or current < new):
+        new = current
+    reset = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(reset)
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Secondes avant l'échéance courante, bornées par default (default s'il n'y a pas d'échéance)"""
+    current = _deadline.get()
+    if current is None:
+        return default
+    # Au moins 10 ms : les clients HTTP refusent un délai nul, l'appel échoue alors aussitôt
+    left = max(0.01, current - time.monotonic())
+    return left if default is None else min(left, default)
+
+
+def cancelled() -> bool:
+    """Vrai si la tâche qui a lancé ce thread (run_blocking) a été annulée"""
+    token = _token.get()
+    return token is not None and token.cancelled
+
+
+@contextmanager
+def on_cancel(callback: Callable[[], None]):
+    """Dans un thread lancé par run_blocking : callback appelé si la tâche appelante est annulée pendant le bloc"""
+    token = _token.get()
+    if token is None:
+        yield
+        return
+    unregister = token.on_cancel(callback)
+    try:
+        yield
+    finally:
+        unregister()
+
+
+async def run_blocking(func: Callable, *args, release: Optional[Callable] = None, **kwargs):
+    """asyncio.to_thread annulable : l'annulation déclenche les callbacks on_cancel du thread et attend sa fin
+
+    release : appelé avec le résultat si le thread aboutit malgré l'annulation (ex: libérer un verrou acquis)
+    """
+    token = CancelToken()
+    context = contextvars.copy_context()
+    context.run(_token.set, token)
+    future = asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        token.cancel()
+        CANCELLATIONS_TOTAL.inc("thread")
+        await asyncio.wait([future], timeout=CANCEL_GRACE_S)
+        if not future.done():
+            logger.warning("%s toujours en cours %.0fs après l'annulation", getattr(func, "__name__", func), CANCEL_GRACE_S)
+        elif not future.cancelled() and future.exception() is None and release is not None:
+            release(future.result())
+        raise
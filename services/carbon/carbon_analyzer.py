@@ -1,332 +1,608 @@
 """
 Service de calcul d'impact carbone pour code Python
 """
+import asyncio
+import csv
+import os
 import tempfile
-import subprocess
 import json
+import time
 from pathlib import Path
-from codecarbon import EmissionsTracker
+from typing import List, Optional
 import ast
-import requests
+from services.progress import report_stage
+from services.metrics import track_stage
+from services.carbon.sandbox import run_sandboxed_async, sandbox_limits
+from services.carbon.energy_model import extract_features, predict_energy_batch, record_sample
+from services.ingestion import scan_repository, ingestion_summary
+from services.history import record_analysis
+from services.artifacts import ARTIFACT_MAX_MB, capture_file
+from services.carbon.memory import MEMORY_PROFILER, MEMORY_TOP_SITES, memory_recommendations, read_memory_profile
+from services.workspaces import checkout_async
+from services.carbon import scheduler
 
+ENERGY_BACKENDS = ("codecarbon", "direct")
+ANALYSIS_MODES = ("measure", "predict", "hybrid")
+# Modèle de repli du backend direct : part de TDP par cœur logique, corrigée par un facteur mesuré (RAPL / modèle)
+DIRECT_CPU_TDP_W = float(os.getenv("DIRECT_CPU_TDP_W", "85"))
+DIRECT_CPU_CALIBRATION = float(os.getenv("DIRECT_CPU_CALIBRATION", "1.0"))
+DIRECT_RAM_W_PER_GB = float(os.getenv("DIRECT_RAM_W_PER_GB", "0.375"))
+CARBON_INTENSITY_G_PER_KWH = float(os.getenv("CARBON_INTENSITY_G_PER_KWH", "475"))
+BATCH_RUNNER_WORKERS = int(os.getenv("BATCH_RUNNER_WORKERS", str(os.cpu_count() or 1)))
+# Marge CPU / durée du runner batch en plus des budgets par fichier (démarrage de l'interpréteur, de codecarbon)
+BATCH_RUNNER_STARTUP_S = int(os.getenv("BATCH_RUNNER_STARTUP_S", "30"))
 
-async def analyze_carbon_impact(code: str, filename: str = "analysis.py") -> dict:
-    """Analyse l'impact carbone d'un code Python"""
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        file_path = temp_path / filename
-        file_path.write_text(code)
-        
-        runner_script = f"""
+# Lecture des compteurs RAPL (Intel et AMD via le driver powercap), injectée dans les runners
+RAPL_READER = """
+import glob, os
+
+def read_rapl():
+    zones = {}
+    for zone in glob.glob("/sys/class/powercap/intel-rapl:*"):
+        try:
+            with open(os.path.join(zone, "name")) as f:
+                name = f.read().strip()
+            with open(os.path.join(zone, "energy_uj")) as f:
+                energy = int(f.read())
+            with open(os.path.join(zone, "max_energy_range_uj")) as f:
+                max_range = int(f.read())
+        except (OSError, ValueError):
+            continue
+        zones[os.path.basename(zone)] = (name, energy, max_range)
+    return zones
+
+def rapl_delta_j(before, after):
+    cpu_j, dram_j = 0.0, 0.0
+    for zone, (name, energy, max_range) in after.items():
+        if zone not in before:
+            continue
+        delta = energy - before[zone][1]
+        if delta < 0:
+            delta += max_range
+        if name.startswith("package"):
+            cpu_j += delta / 1e6
+        elif name == "dram":
+            dram_j += delta / 1e6
+    return cpu_j, dram_j
+"""
+
+
+def _memory_hooks(temp_path: Path, file_path: Path, profile_memory: bool) -> tuple:
+    """Code à injecter autour de l'exécution mesurée pour le profil tracemalloc (vide si désactivé)"""
+    if not profile_memory:
+        return "", "", ""
+    start = "profiler = MemoryProfiler()\nprofiler.start()"
+    stop = f"profiler.stop({str(file_path)!r}, {str(temp_path / 'memory_profile.json')!r}, {MEMORY_TOP_SITES})"
+    return MEMORY_PROFILER, start, stop
+
+
+def _codecarbon_runner(temp_path: Path, file_path: Path, profile_memory: bool = False) -> str:
+    """La mesure est écrite par codecarbon dans emissions.csv : la sortie standard reste au programme mesuré"""
+    setup, start, stop = _memory_hooks(temp_path, file_path, profile_memory)
+    return setup + f"""
 from codecarbon import EmissionsTracker
 import sys
-sys.path.append('{temp_path}')
+sys.path.append({str(temp_path)!r})
 
 tracker = EmissionsTracker(
     project_name="code_analysis",
-    output_dir="{temp_path}",
+    output_dir={str(temp_path)!r},
     save_to_file=True,
     log_level="ERROR"
 )
 
 tracker.start()
+{start}
+try:
+    exec(compile(open({str(file_path)!r}).read(), {str(file_path)!r}, "exec"), {{"__name__": "__main__", "__file__": {str(file_path)!r}}})
+except Exception as e:
+    print(f"Execution error: {{e}}")
+finally:
+    tracker.stop()
+    {stop}
+"""
+
+
+def _direct_runner(temp_path: Path, file_path: Path, profile_memory: bool = False) -> str:
+    """La mesure est écrite dans carbon_result.json : la sortie standard, bornée, reste au programme mesuré"""
+    setup, start, stop = _memory_hooks(temp_path, file_path, profile_memory)
+    return RAPL_READER + setup + f"""
+import json, resource, sys, time
+sys.path.append({str(temp_path)!r})
+{start}
+
+rapl_before = read_rapl()
+cpu_start = time.process_time()
+wall_start = time.perf_counter()
 try:
-    exec(open('{file_path}').read())
+    exec(compile(open({str(file_path)!r}).read(), {str(file_path)!r}, "exec"), {{"__name__": "__main__", "__file__": {str(file_path)!r}}})
 except Exception as e:
     print(f"Execution error: {{e}}")
 finally:
-    emissions = tracker.stop()
-    print(f"CARBON_RESULT:{{emissions}}")
+    measure = {{
+        "duration_s": time.perf_counter() - wall_start,
+        "cpu_time_s": time.process_time() - cpu_start,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "rapl": rapl_delta_j(rapl_before, read_rapl()) if rapl_before else None,
+    }}
+    {stop}
+    with open({str(temp_path / "carbon_result.json")!r}, "w") as f:
+        json.dump(measure, f)
 """
+
+
+def _batch_runner(temp_path: Path, manifest_path: Path, backend: str, limits: dict) -> str:
+    """Un interpréteur chaud exécute plusieurs fichiers à la suite, chacun mesuré séparément
+
+    La sortie de chaque fichier va dans son item_dir/stdout.log (plafonné à ARTIFACT_MAX_MB, sous RLIMIT_FSIZE),
+    les mesures dans results.jsonl : aucune des deux ne transite par le pipe stdout du runner.
+    Chaque fichier a son budget CPU (RLIMIT_CPU souple, SIGXCPU) et durée (SIGALRM) : un fichier qui boucle
+    est interrompu et le runner passe au suivant.
+    """
+    if backend == "direct":
+        setup, start, stop, teardown = "", "rapl_before = read_rapl()", """
+    measure["rapl"] = rapl_delta_j(rapl_before, read_rapl()) if rapl_before else None""", ""
+    else:
+        setup = f"""
+from codecarbon import EmissionsTracker
+tracker = EmissionsTracker(project_name="batch_analysis", output_dir={str(temp_path)!r}, save_to_file=False, log_level="ERROR")
+tracker.start()"""
+        start = 'tracker.start_task(str(item["index"]))'
+        stop = """
+    data = tracker.stop_task()
+    measure["codecarbon"] = {
+        "emissions_kg": float(data.emissions),
+        "energy_kwh": float(data.energy_consumed),
+        "duration_s": float(data.duration),
+        "cpu_energy": float(data.cpu_energy),
+        "ram_energy": float(data.ram_energy),
+        "backend": "codecarbon",
+    }"""
+        teardown = "tracker.stop()"
+    return RAPL_READER + f"""
+import contextlib, io, json, os, resource, signal, sys, time
+sys.path.append({str(temp_path)!r})
+items = json.load(open({str(manifest_path)!r}))
+
+class ItemLimit(BaseException):
+    pass
+
+def item_limit(signum, frame):
+    raise ItemLimit("cpu_limit" if signum == signal.SIGXCPU else "wall_timeout")
+
+def disarm():
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_soft, cpu_hard))
+
+signal.signal(signal.SIGXCPU, item_limit)
+signal.signal(signal.SIGALRM, item_limit)
+cpu_soft, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+
+class CappedOutput(io.TextIOBase):
+    def __init__(self, path, limit):
+        self.file = open(path, "wb")
+        self.left = limit
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.left > 0:
+            data = text.encode("utf-8", errors="replace")[:self.left]
+            self.file.write(data)
+            self.left -= len(data)
+        return len(text)
+
+    def close(self):
+        self.file.close()
+
+results = open({str(temp_path / "results.jsonl")!r}, "a")
+{setup}
+results.write(json.dumps({{"ready": True}}) + "\\n")
+results.flush()
+for item in items:
+    output = CappedOutput(os.path.join(os.path.dirname(item["path"]), "stdout.log"), {ARTIFACT_MAX_MB * 1024 * 1024})
+    {start}
+    termination = None
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    # Le budget CPU se compte en secondes entières sur le processus : limite souple relevée fichier par fichier
+    cpu_item = min(int(cpu_start) + 1 + {limits["cpu_seconds"]}, cpu_soft if cpu_soft != resource.RLIM_INFINITY else 1 << 62)
+    try:
+        try:
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_item, cpu_hard))
+            signal.setitimer(signal.ITIMER_REAL, {limits["wall_seconds"]}, 1.0)
+            with contextlib.redirect_stdout(output):
+                exec(compile(open(item["path"]).read(), item["path"], "exec"), {{"__name__": "__main__", "__file__": item["path"]}})
+        except MemoryError:
+            termination = "memory_limit"
+        except (Exception, SystemExit) as e:
+            output.write(f"Execution error: {{e}}\\n")
+        finally:
+            disarm()
+    except ItemLimit as e:
+        disarm()
+        termination = str(e)
+    output.close()
+    measure = {{
+        "duration_s": time.perf_counter() - wall_start,
+        "cpu_time_s": time.process_time() - cpu_start,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "termination": termination,
+    }}{stop}
+    results.write(json.dumps({{"index": item["index"], "measure": measure}}) + "\\n")
+    results.flush()
+{teardown}
+"""
+
+
+def direct_energy(measure: dict) -> dict:
+    """Convertit une mesure brute (RAPL ou temps CPU) au schéma carbon_impact (énergies en kWh)"""
+    if measure.get("rapl"):
+        cpu_j, ram_j = measure["rapl"]
+        backend = "rapl"
+    else:
+        cpu_j, ram_j = 0.0, 0.0
+        backend = "cpu_model"
+    if backend == "cpu_model" or cpu_j <= 0:
+        cpu_j = measure["cpu_time_s"] * DIRECT_CPU_TDP_W / (os.cpu_count() or 1) * DIRECT_CPU_CALIBRATION
+        backend = "cpu_model"
+    if ram_j <= 0:
+        ram_j = measure["max_rss_kb"] / 1024 ** 2 * DIRECT_RAM_W_PER_GB * measure["duration_s"]
+    cpu_kwh = cpu_j / 3.6e6
+    ram_kwh = ram_j / 3.6e6
+    energy_kwh = cpu_kwh + ram_kwh
+    return {
+        "emissions_kg": energy_kwh * CARBON_INTENSITY_G_PER_KWH / 1000,
+        "energy_kwh": energy_kwh,
+        "duration_s": measure["duration_s"],
+        "cpu_energy": cpu_kwh,
+        "ram_energy": ram_kwh,
+        "backend": backend,
+    }
+
+
+def _read_direct_result(temp_path: Path) -> Optional[dict]:
+    try:
+        return direct_energy(json.loads((temp_path / "carbon_result.json").read_text()))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _read_codecarbon_result(temp_path: Path) -> Optional[dict]:
+    emissions_file = temp_path / "emissions.csv"
+    if not emissions_file.exists():
+        return None
+    # Une ligne par run : le module csv suffit et évite de charger pandas pendant la requête
+    with open(emissions_file, newline="") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        return None
+    row = {k: v for k, v in rows[-1].items() if v not in ("", None)}
+    return {
+        "emissions_kg": float(row.get("emissions", 0)),
+        "energy_kwh": float(row.get("energy_consumed", 0)),
+        "duration_s": float(row.get("duration", 0)),
+        "cpu_energy": float(row.get("cpu_energy", 0)),
+        "ram_energy": float(row.get("ram_energy", 0)),
+        "backend": "codecarbon",
+    }
+
+
+async def analyze_carbon_impact(code: str, filename: str = "analysis.py", limits: Optional[dict] = None,
+                                backend: str = "codecarbon", profile_memory: bool = False) -> dict:
+    """Analyse l'impact carbone d'un code Python (exécuté sous limites CPU/mémoire/durée, voir sandbox.py)
+
+    backend="codecarbon" : EmissionsTracker complet (plusieurs secondes de démarrage)
+    backend="direct" : compteurs RAPL ou modèle temps CPU × TDP, quasi sans surcoût
+    profile_memory=True : profil tracemalloc (pic, sites d'allocation, blocs par fonction), mesure ralentie
+    """
+    if backend not in ENERGY_BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (attendu : {', '.join(ENERGY_BACKENDS)})")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        file_path = temp_path / Path(filename).name
+        file_path.write_text(code)
+        
+        if backend == "direct":
+            runner_script = _direct_runner(temp_path, file_path, profile_memory)
+        else:
+            runner_script = _codecarbon_runner(temp_path, file_path, profile_memory)
         
         runner_path = temp_path / "runner.py"
         runner_path.write_text(runner_script)
         
-        result = subprocess.run([
-            "python", str(runner_path)
-        ], capture_output=True, text=True, timeout=600)
-        
-        emissions_file = temp_path / "emissions.csv"
-        carbon_data = {"emissions_kg": 0, "energy_kwh": 0, "duration_s": 0}
+        await report_stage("measuring", f"Exécution mesurée de {filename}")
+        with track_stage("carbon_runner"):
+            result = await run_sandboxed_async(["python", str(runner_path)], str(temp_path), limits or sandbox_limits())
         
-        if emissions_file.exists():
-            import pandas as pd
-            df = pd.read_csv(emissions_file)
-            if not df.empty:
-                row = df.iloc[-1]
-                carbon_data = {
-                    "emissions_kg": float(row.get("emissions", 0)),
-                    "energy_kwh": float(row.get("energy_consumed", 0)),
-                    "duration_s": float(row.get("duration", 0)),
-                    "cpu_energy": float(row.get("cpu_energy", 0)),
-                    "ram_energy": float(row.get("ram_energy", 0))
-                }
+        if backend == "direct":
+            carbon_data = _read_direct_result(temp_path)
+        else:
+            carbon_data = _read_codecarbon_result(temp_path)
+        if carbon_data is None:
+            carbon_data = {"emissions_kg": 0, "energy_kwh": 0, "duration_s": 0, "backend": backend}
+        memory = read_memory_profile(temp_path, code, file_path) if profile_memory else None
         
+        await report_stage("complexity", f"Analyse statique de {filename}")
         complexity_score = analyze_code_complexity(code)
+        # Le surcoût de tracemalloc fausserait l'échantillon d'apprentissage du modèle d'énergie
+        if result["resource_usage"]["termination"] is None and not profile_memory:
+            record_sample(extract_features(code, complexity_score), carbon_data)
         
-        return {
+        analysis = {
             "filename": filename,
             "carbon_impact": carbon_data,
             "complexity_analysis": complexity_score,
-            "execution_output": result.stdout,
-            "recommendations": generate_carbon_recommendations(complexity_score, carbon_data)
+            "execution_output": result["stdout"],
+            "output_capture": result["output_capture"],
+            "resource_usage": result["resource_usage"],
+            "recommendations": generate_carbon_recommendations(complexity_score, carbon_data, result["resource_usage"], memory)
         }
+        if profile_memory:
+            analysis["memory_profile"] = memory
+        return analysis
 
 
-def analyze_code_complexity(code: str) -> dict:
-    """Analyse statique de la complexité du code"""
-    try:
-        tree = ast.parse(code)
-        
-        loops = 0
-        nested_loops = 0
-        recursions = 0
-        
-        class ComplexityVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.loop_depth = 0
-                self.max_depth = 0
-                
-            def visit_For(self, node):
-                nonlocal loops, nested_loops
-                loops += 1
-                self.loop_depth += 1
-                self.max_depth = max(self.max_depth, self.loop_depth)
-                if self.loop_depth > 1:
-                    nested_loops += 1
-                self.generic_visit(node)
-                self.loop_depth -= 1
-                
-            def visit_While(self, node):
-                nonlocal loops, nested_loops
-                loops += 1
-                self.loop_depth += 1
-                self.max_depth = max(self.max_depth, self.loop_depth)
-                if self.loop_depth > 1:
-                    nested_loops += 1
-                self.generic_visit(node)
-                self.loop_depth -= 1
-                
-            def visit_FunctionDef(self, node):
-                nonlocal recursions
-                for child in ast.walk(node):
-                    if isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
-                        if child.func.id == node.name:
-                            recursions += 1
-                self.generic_visit(node)
-        
-        visitor = ComplexityVisitor()
-        visitor.visit(tree)
-        
-        return {
-            "total_loops": loops,
-            "nested_loops": nested_loops,
-            "max_nesting_depth": visitor.max_depth,
-            "recursive_functions": recursions,
-            "complexity_score": loops + (nested_loops * 2) + (recursions * 1.5)
-        }
-        
-    except Exception:
-        return {"complexity_score": 0, "error": "Parse failed"}
+def _batch_limits(limits: dict, items: int) -> dict:
+    """Limites du runner : budgets CPU et durée de chaque fichier cumulés, plus le démarrage"""
+    return {
+        **limits,
+        "cpu_seconds": limits["cpu_seconds"] * items + BATCH_RUNNER_STARTUP_S,
+        "wall_seconds": limits["wall_seconds"] * items + BATCH_RUNNER_STARTUP_S,
+    }
 
 
-def generate_carbon_recommendations(complexity: dict, carbon: dict) -> list:
-    """Génère des recommandations d'optimisation"""
-    recommendations = []
-    
-    if complexity.get("nested_loops", 0) > 0:
-        recommendations.append({
-            "type": "HIGH",
-            "message": f"{complexity['nested_loops']} boucles imbriquées détectées - considérez vectorisation ou algorithmes plus efficaces",
-            "impact": "Réduction potentielle de 20-80% de la consommation"
-        })
-    
-    if complexity.get("complexity_score", 0) > 10:
-        recommendations.append({
-            "type": "MEDIUM", 
-            "message": "Code complexe - profiling recommandé",
-            "impact": "Optimisation ciblée possible"
-        })
-        
-    if carbon.get("energy_kwh", 0) > 0.001:
-        recommendations.append({
-            "type": "MEDIUM",
-            "message": "Consommation énergétique élevée détectée",
-            "impact": f"Émissions: {carbon['emissions_kg']:.6f} kg CO2"
-        })
-    
-    return recommendations
+def _read_batch_results(run_path: Path, temp_path: Path) -> tuple:
+    ready, measures = False, {}
+    results_path = run_path / "results.jsonl"
+    lines = results_path.read_text().splitlines() if results_path.exists() else []
+    for line in lines:
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            continue
+        if payload.get("ready"):
+            ready = True
+            continue
+        capture = capture_file(temp_path / f"item_{payload['index']}" / "stdout.log", "stdout")
+        payload["output"] = capture.text()
+        payload["output_capture"] = {"stdout": capture.summary()}
+        measures[payload["index"]] = payload
+    return ready, measures
 
 
-async def analyze_github_carbon(repo_url: str) -> dict:
-    """Analyse l'impact carbone d'un repo GitHub"""
-    import git
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        repo_path = Path(temp_dir) / "repo"
-        git.Repo.clone_from(repo_url, repo_path)
-        
-        py_files = list(repo_path.rglob("*.py"))
-        
-        results = []
-        total_carbon = {"emissions_kg": 0, "energy_kwh": 0}
-        
-        for py_file in py_files[:5]:
-            if py_file.stat().st_size > 1000000:
-                continue
-                
-            code = py_file.read_text(encoding='utf-8', errors='ignore')
-            result = await analyze_carbon_impact(code, py_file.name)
-            results.append(result)
-            
-            carbon_data = result["carbon_impact"]
-            total_carbon["emissions_kg"] += carbon_data.get("emissions_kg", 0)
-            total_carbon["energy_kwh"] += carbon_data.get("energy_kwh", 0)
-        
-        return {
-            "repo_url": repo_url,
-            "total_carbon_impact": total_carbon,
-            "file_analyses": results,
-            "summary": f"Analysé {len(results)} fichiers Python"
-        }
-    
-"""
-Service de calcul d'impact carbone pour code Python
-"""
-import tempfile
-import subprocess
-import json
-from pathlib import Path
-from codecarbon import EmissionsTracker
-import ast
-import requests
-
+async def _run_batch_chunk(chunk: List[dict], backend: str, limits: Optional[dict]) -> tuple:
+    """Mesures du lot et resource_usage de chaque fichier (termination propre au fichier)
 
-async def analyze_carbon_impact(code: str, filename: str = "analysis.py") -> dict:
-    """Analyse l'impact carbone d'un code Python"""
-    
+    Si le runner meurt (mémoire, boucle dans du code natif, os._exit), le fichier en cours est marqué avec la
+    cause et les suivants sont relancés dans un nouveau runner ; un runner qui ne démarre pas n'exécute rien.
+    """
+    limits = limits or sandbox_limits()
+    item_limits = {"cpu_seconds": limits["cpu_seconds"], "wall_seconds": limits["wall_seconds"]}
+    measures, usages = {}, {}
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_path = Path(temp_dir)
-        file_path = temp_path / filename
-        file_path.write_text(code)
-        
-        runner_script = f"""
-from codecarbon import EmissionsTracker
-import sys
-sys.path.append('{temp_path}')
+        paths = {}
+        for item in chunk:
+            item_dir = temp_path / f"item_{item['index']}"
+            item_dir.mkdir()
+            paths[item["index"]] = item_dir / Path(item["filename"]).name
+            paths[item["index"]].write_text(item["code"])
 
-tracker = EmissionsTracker(
-    project_name="code_analysis",
-    output_dir="{temp_path}",
-    save_to_file=True,
-    log_level="ERROR"
-)
+        pending, attempt = list(chunk), 0
+        while pending:
+            run_path = temp_path / f"run_{attempt}"
+            run_path.mkdir()
+            manifest_path = run_path / "manifest.json"
+            manifest_path.write_text(json.dumps([{"index": item["index"], "path": str(paths[item["index"]])} for item in pending]))
+            runner_path = run_path / "batch_runner.py"
+            runner_path.write_text(_batch_runner(run_path, manifest_path, backend, item_limits))
 
-tracker.start()
-try:
-    exec(open('{file_path}').read())
-except Exception as e:
-    print(f"Execution error: {{e}}")
-finally:
-    emissions = tracker.stop()
-    print(f"CARBON_RESULT:{{emissions}}")
-"""
-        
-        runner_path = temp_path / "runner.py"
-        runner_path.write_text(runner_script)
-        
-        result = subprocess.run([
-            "python", str(runner_path)
-        ], capture_output=True, text=True, timeout=600)
-        
-        emissions_file = temp_path / "emissions.csv"
-        carbon_data = {"emissions_kg": 0, "energy_kwh": 0, "duration_s": 0}
-        
-        if emissions_file.exists():
-            import pandas as pd
-            df = pd.read_csv(emissions_file)
-            if not df.empty:
-                row = df.iloc[-1]
-                carbon_data = {
-                    "emissions_kg": float(row.get("emissions", 0)),
-                    "energy_kwh": float(row.get("energy_consumed", 0)),
-                    "duration_s": float(row.get("duration", 0)),
-                    "cpu_energy": float(row.get("cpu_energy", 0)),
-                    "ram_energy": float(row.get("ram_energy", 0))
-                }
-        
-        complexity_score = analyze_code_complexity(code)
-        
-        return {
-            "filename": filename,
+            with track_stage("carbon_runner"):
+                result = await run_sandboxed_async(["python", str(runner_path)], str(run_path),
+                                                   _batch_limits(limits, len(pending)))
+            runner_usage = {**result["resource_usage"], "item_limits": item_limits, "runner_attempt": attempt}
+            ready, run_measures = _read_batch_results(run_path, temp_path)
+            for index, payload in run_measures.items():
+                measures[index] = payload
+                usages[index] = {**runner_usage, "termination": payload["measure"].get("termination")}
+
+            pending = [item for item in pending if item["index"] not in run_measures]
+            if not pending:
+                break
+            attempt += 1
+            cause = runner_usage["termination"] or ("runner_exit" if ready else "runner_failed")
+            if not ready:
+                for item in pending:
+                    usages[item["index"]] = {**runner_usage, "termination": "not_run", "cause": cause}
+                break
+            culprit, pending = pending[0], pending[1:]
+            capture = capture_file(temp_path / f"item_{culprit['index']}" / "stdout.log", "stdout")
+            measures[culprit["index"]] = {"output": capture.text(), "output_capture": {"stdout": capture.summary()}}
+            usages[culprit["index"]] = {**runner_usage, "termination": cause}
+    return measures, usages
+
+
+BATCH_TERMINATIONS = {
+    "cpu_limit": "budget CPU du fichier dépassé",
+    "wall_timeout": "durée maximale du fichier dépassée",
+    "memory_limit": "limite mémoire atteinte",
+    "runner_exit": "le fichier a terminé l'interpréteur",
+    "not_run": "runner du lot arrêté avant l'exécution",
+}
+
+
+def batch_error(termination: str, resource_usage: dict) -> str:
+    reason = BATCH_TERMINATIONS.get(termination, termination)
+    if termination == "not_run":
+        reason += f" ({resource_usage.get('cause')})"
+    return f"Mesure impossible : {reason}"
+
+
+async def analyze_carbon_batch(items: List[dict], backend: str = "direct", limits: Optional[dict] = None,
+                               workers: Optional[int] = None) -> List[dict]:
+    """Mesure un lot de fichiers {code, filename} sur un pool d'interpréteurs chauds (un processus par worker)
+
+    Un fichier interrompu ou jamais exécuté renvoie une mesure nulle avec "error" : à exclure du scoring.
+    """
+    if backend not in ENERGY_BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (attendu : {', '.join(ENERGY_BACKENDS)})")
+    indexed = [{"index": i, **item} for i, item in enumerate(items)]
+    workers = max(1, min(workers or BATCH_RUNNER_WORKERS, len(indexed)))
+    chunks = [indexed[w::workers] for w in range(workers)]
+    
+    await report_stage("measuring", f"{len(items)} fichiers sur {workers} runner(s)")
+    chunk_results = await asyncio.gather(*(_run_batch_chunk(chunk, backend, limits) for chunk in chunks))
+    
+    measures, usages = {}, {}
+    for chunk_measures, chunk_usages in chunk_results:
+        measures.update(chunk_measures)
+        usages.update(chunk_usages)
+    
+    await report_stage("complexity", f"Analyse statique de {len(items)} fichiers")
+    results = []
+    for item in indexed:
+        complexity_score = analyze_code_complexity(item["code"])
+        payload = measures.get(item["index"], {})
+        item_usage = usages[item["index"]]
+        measure = payload.get("measure")
+        if measure is None:
+            carbon_data = {"emissions_kg": 0, "energy_kwh": 0, "duration_s": 0, "backend": backend}
+        else:
+            carbon_data = measure["codecarbon"] if backend == "codecarbon" else direct_energy(measure)
+            item_usage = {**item_usage, "item_cpu_s": round(measure["cpu_time_s"], 6)}
+        if item_usage["termination"] is None:
+            record_sample(extract_features(item["code"], complexity_score), carbon_data)
+        result = {
+            "filename": item["filename"],
             "carbon_impact": carbon_data,
             "complexity_analysis": complexity_score,
-            "execution_output": result.stdout,
-            "recommendations": generate_carbon_recommendations(complexity_score, carbon_data)
+            "execution_output": payload.get("output", ""),
+            "output_capture": payload.get("output_capture", {}),
+            "resource_usage": item_usage,
+            "recommendations": generate_carbon_recommendations(complexity_score, carbon_data, item_usage)
         }
+        if item_usage["termination"] is not None:
+            result["error"] = batch_error(item_usage["termination"], item_usage)
+        results.append(result)
+    return results
+
+
+def predict_carbon_impact(code: str, filename: str = "analysis.py", backend: str = "codecarbon") -> dict:
+    """Estimation statique de l'impact carbone, sans exécuter le code (même schéma qu'analyze_carbon_impact)"""
+    complexity_score = analyze_code_complexity(code)
+    prediction = predict_energy_batch([code], CARBON_INTENSITY_G_PER_KWH, backend)[0]
+    carbon_data = {
+        "emissions_kg": prediction.get("predicted_emissions_kg", 0),
+        "energy_kwh": prediction.get("predicted_energy_kwh", 0),
+        "duration_s": 0,
+        "backend": "prediction",
+    }
+    return {
+        "filename": filename,
+        "carbon_impact": carbon_data,
+        "complexity_analysis": complexity_score,
+        "prediction": prediction,
+        "recommendations": generate_carbon_recommendations(complexity_score, carbon_data)
+    }
+
+
+async def analyze_carbon_hybrid(code: str, filename: str = "analysis.py", backend: str = "codecarbon") -> dict:
+    """Estimation statique, puis mesure si l'ordonnanceur la retient (point d'entrée exécutable, budget restant)"""
+    predicted = await asyncio.to_thread(predict_carbon_impact, code, filename, backend)
+    plan = await asyncio.to_thread(
+        scheduler.plan_measurements, scheduler.rank_files([filename], [code], [predicted["prediction"]]), backend, 1,
+    )
+    entry = plan["files"][0]
+    if entry["decision"] != "planned":
+        return {**predicted, "measurement": {"decision": "skipped", "reason": entry["reason"]}}
+    await report_stage("measuring", entry["reason"])
+    analysis = await analyze_carbon_impact(code, filename, backend=backend)
+    return {
+        **analysis,
+        "prediction": predicted["prediction"],
+        "measurement": {"decision": "measured", "reason": entry["reason"], "estimated_cost": entry["estimated_cost"]},
+    }
 
 
 def analyze_code_complexity(code: str) -> dict:
     """Analyse statique de la complexité du code"""
-    try:
-        tree = ast.parse(code)
-        
-        loops = 0
-        nested_loops = 0
-        recursions = 0
-        
-        class ComplexityVisitor(ast.NodeVisitor):
-            def __init__(self):
-                self.loop_depth = 0
-                self.max_depth = 0
-                
-            def visit_For(self, node):
-                nonlocal loops, nested_loops
-                loops += 1
-                self.loop_depth += 1
-                self.max_depth = max(self.max_depth, self.loop_depth)
-                if self.loop_depth > 1:
-                    nested_loops += 1
-                self.generic_visit(node)
-                self.loop_depth -= 1
-                
-            def visit_While(self, node):
-                nonlocal loops, nested_loops
-                loops += 1
-                self.loop_depth += 1
-                self.max_depth = max(self.max_depth, self.loop_depth)
-                if self.loop_depth > 1:
-                    nested_loops += 1
-                self.generic_visit(node)
-                self.loop_depth -= 1
-                
-            def visit_FunctionDef(self, node):
-                nonlocal recursions
-                for child in ast.walk(node):
-                    if isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
-                        if child.func.id == node.name:
-                            recursions += 1
-                self.generic_visit(node)
-        
-        visitor = ComplexityVisitor()
-        visitor.visit(tree)
-        
-        return {
-            "total_loops": loops,
-            "nested_loops": nested_loops,
-            "max_nesting_depth": visitor.max_depth,
-            "recursive_functions": recursions,
-            "complexity_score": loops + (nested_loops * 2) + (recursions * 1.5)
-        }
-        
-    except Exception:
-        return {"complexity_score": 0, "error": "Parse failed"}
+    with track_stage("ast_analysis"):
+        try:
+            tree = ast.parse(code)
+
+            loops = 0
+            nested_loops = 0
+            recursions = 0
+
+            class ComplexityVisitor(ast.NodeVisitor):
+                def __init__(self):
+                    self.loop_depth = 0
+                    self.max_depth = 0
+
+                def visit_For(self, node):
+                    nonlocal loops, nested_loops
+                    loops += 1
+                    self.loop_depth += 1
+                    self.max_depth = max(self.max_depth, self.loop_depth)
+                    if self.loop_depth > 1:
+                        nested_loops += 1
+                    self.generic_visit(node)
+                    self.loop_depth -= 1
+
+                def visit_While(self, node):
+                    nonlocal loops, nested_loops
+                    loops += 1
+                    self.loop_depth += 1
+                    self.max_depth = max(self.max_depth, self.loop_depth)
+                    if self.loop_depth > 1:
+                        nested_loops += 1
+                    self.generic_visit(node)
+                    self.loop_depth -= 1
+
+                def visit_FunctionDef(self, node):
+                    nonlocal recursions
+                    for child in ast.walk(node):
+                        if isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
+                            if child.func.id == node.name:
+                                recursions += 1
+                    self.generic_visit(node)
+
+            visitor = ComplexityVisitor()
+            visitor.visit(tree)
+
+            return {
+                "total_loops": loops,
+                "nested_loops": nested_loops,
+                "max_nesting_depth": visitor.max_depth,
+                "recursive_functions": recursions,
+                "complexity_score": loops + (nested_loops * 2) + (recursions * 1.5)
+            }
+
+        except Exception:
+            return {"complexity_score": 0, "error": "Parse failed"}
 
 
-def generate_carbon_recommendations(complexity: dict, carbon: dict) -> list:
+def generate_carbon_recommendations(complexity: dict, carbon: dict, resource_usage: Optional[dict] = None,
+                                    memory: Optional[dict] = None) -> list:
     """Génère des recommandations d'optimisation"""
     recommendations = []
+    resource_usage = resource_usage or {}
+
+    if resource_usage.get("termination"):
+        recommendations.append({
+            "type": "HIGH",
+            "message": f"Exécution interrompue par le sandbox ({resource_usage['termination']}) - mesure incomplète",
+            "impact": "Réduire la taille des données ou relancer avec des limites plus larges"
+        })
+    elif resource_usage.get("retry_recommended"):
+        recommendations.append({
+            "type": "LOW",
+            "message": "Machine chargée pendant la mesure (préemptions fréquentes) - mesure peu fiable",
+            "impact": "Relancer l'analyse pour confirmer les chiffres"
+        })
     
     if complexity.get("nested_loops", 0) > 0:
         recommendations.append({
@@ -348,40 +624,113 @@ def generate_carbon_recommendations(complexity: dict, carbon: dict) -> list:
             "message": "Consommation énergétique élevée détectée",
             "impact": f"Émissions: {carbon['emissions_kg']:.6f} kg CO2"
         })
+
+    if memory:
+        recommendations.extend(memory_recommendations(memory))
     
     return recommendations
 
 
-async def analyze_github_carbon(repo_url: str) -> dict:
-    """Analyse l'impact carbone d'un repo GitHub"""
-    import git
+async def analyze_github_carbon(repo_url: str, mode: str = "hybrid", measure_top: int = 5,
+                                backend: str = "codecarbon", exclude_tests: Optional[bool] = None,
+                                commit: Optional[str] = None, time_budget_s: Optional[float] = None,
+                                energy_budget_kwh: Optional[float] = None) -> dict:
+    """Analyse l'impact carbone d'un repo GitHub (HEAD distant, ou commit)
+
+    mode="measure" : exécute les fichiers choisis par l'ordonnanceur (scheduler.py), sans rapporter les estimations
+    mode="predict" : estimation statique de tous les fichiers, sans exécution
+    mode="hybrid" : estimation de tous les fichiers puis mesure des fichiers choisis par l'ordonnanceur
+    Les mesures s'arrêtent à measure_top fichiers ou à l'épuisement du budget temps / énergie.
+    """
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Mode inconnu : {mode} (attendu : {', '.join(ANALYSIS_MODES)})")
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        repo_path = Path(temp_dir) / "repo"
-        git.Repo.clone_from(repo_url, repo_path)
-        
-        py_files = list(repo_path.rglob("*.py"))
+    await report_stage("cloning", repo_url)
+    async with checkout_async(repo_url, commit) as workspace:
+        repo_path = workspace["path"]
+        commit = workspace["commit"]
+        
+        with track_stage("file_read"):
+            scan = await asyncio.to_thread(scan_repository, repo_path, exclude_tests=exclude_tests)
+        py_files = scan["paths"]
+        ingestion = ingestion_summary(scan)
+        await report_stage("reading", f"{len(py_files)} fichiers Python retenus, {ingestion['files_skipped']} écartés")
+        
+        codes = scan["contents"]
+        
+        await report_stage("predicting", f"Estimation statique de {len(codes)} fichiers")
+        predictions = await asyncio.to_thread(predict_energy_batch, codes, CARBON_INTENSITY_G_PER_KWH, backend)
+        file_predictions = []
+        if mode != "measure":
+            ranked = sorted(
+                (i for i, p in enumerate(predictions) if "predicted_energy_kwh" in p),
+                key=lambda i: predictions[i]["predicted_energy_kwh"],
+                reverse=True,
+            )
+            for rank, i in enumerate(ranked, 1):
+                prediction = {k: v for k, v in predictions[i].items() if k != "features"}
+                file_predictions.append({"path": scan["paths"][i], "rank": rank, **prediction})
+                record_analysis(codes[i], scan["paths"][i], prediction=prediction, repository=repo_url, commit=commit)
         
         results = []
         total_carbon = {"emissions_kg": 0, "energy_kwh": 0}
-        
-        for py_file in py_files[:5]:
-            if py_file.stat().st_size > 1000000:
-                continue
+        schedule = None
+        
+        if mode != "predict":
+            plan = await asyncio.to_thread(
+                scheduler.plan_measurements, scheduler.rank_files(py_files, codes, predictions),
+                backend, measure_top, time_budget_s, energy_budget_kwh,
+            )
+            await report_stage("scheduling", f"{len(plan['selected'])} fichiers retenus sur {len(py_files)}, "
+                                             f"~{plan['estimated']['duration_s']:.1f}s estimées")
+            budget_time = plan["budget"]["time_s"]
+            budget_energy = plan["budget"]["energy_kwh"] or float("inf")
+            started = time.monotonic()
+            for entry in plan["selected"]:
+                # Le plan repose sur des estimations : le budget réel déjà consommé peut exclure les suivants
+                elapsed = time.monotonic() - started
+                if elapsed + entry["estimated_cost"]["duration_s"] > budget_time:
+                    entry["decision"] = "skipped"
+                    entry["reason"] = f"Budget temps consommé par les mesures précédentes ({elapsed:.1f}s réelles sur {budget_time:.1f}s)"
+                    continue
+                if total_carbon["energy_kwh"] + entry["estimated_cost"]["energy_kwh"] > budget_energy:
+                    entry["decision"] = "skipped"
+                    entry["reason"] = f"Budget énergie consommé par les mesures précédentes ({total_carbon['energy_kwh']:.2e} kWh réels)"
+                    continue
+                i = entry["index"]
+                result = await analyze_carbon_impact(codes[i], os.path.basename(py_files[i]), backend=backend)
+                result["path"] = scan["paths"][i]
+                results.append(result)
+                record_analysis(codes[i], scan["paths"][i], carbon=result, repository=repo_url, commit=commit)
+                entry["decision"] = "measured"
+                entry["measured_duration_s"] = round(time.monotonic() - started - elapsed, 3)
                 
-            code = py_file.read_text(encoding='utf-8', errors='ignore')
-            result = await analyze_carbon_impact(code, py_file.name)
-            results.append(result)
-            
-            carbon_data = result["carbon_impact"]
-            total_carbon["emissions_kg"] += carbon_data.get("emissions_kg", 0)
-            total_carbon["energy_kwh"] += carbon_data.get("energy_kwh", 0)
+                carbon_data = result["carbon_impact"]
+                total_carbon["emissions_kg"] += carbon_data.get("emissions_kg", 0)
+                total_carbon["energy_kwh"] += carbon_data.get("energy_kwh", 0)
+            schedule = {
+                "budget": plan["budget"],
+                "estimated": plan["estimated"],
+                "spent": {"duration_s": round(time.monotonic() - started, 3), "energy_kwh": total_carbon["energy_kwh"]},
+                "files": [
+                    {key: entry[key] for key in ("path", "rank", "value", "decision", "reason", "signals", "estimated_cost")}
+                    | ({"measured_duration_s": entry["measured_duration_s"]} if "measured_duration_s" in entry else {})
+                    for entry in plan["files"]
+                ],
+            }
         
         return {
             "repo_url": repo_url,
+            "commit": commit,
+            "workspace_reused": workspace["reused"],
+            "mode": mode,
             "total_carbon_impact": total_carbon,
+            "predicted_total_energy_kwh": sum(p["predicted_energy_kwh"] for p in file_predictions),
+            "file_predictions": file_predictions,
             "file_analyses": results,
-            "summary": f"Analysé {len(results)} fichiers Python"
+            "schedule": schedule,
+            "ingestion": ingestion,
+            "summary": f"Estimé {len(file_predictions)} fichiers, mesuré {len(results)} fichiers Python"
         }
 
 
@@ -0,0 +1,136 @@
+"""
+Mesure différentielle A/B : version de référence et candidate exécutées en alternance dans le même runner chaud
+Les paires alternent l'ordre (AB, BA, AB…) pour annuler la dérive thermique / fréquence ; l'écart est jugé
+par un test de permutation apparié (inversion des signes) et un intervalle bootstrap.
+"""
+import itertools
+import os
+from typing import Optional
+
+from services.progress import report_stage
+from services.carbon.carbon_analyzer import ENERGY_BACKENDS, _run_batch_chunk, analyze_code_complexity, direct_energy
+
+DIFF_ROUNDS = int(os.getenv("DIFF_ROUNDS", "10"))
+DIFF_WARMUP_ROUNDS = int(os.getenv("DIFF_WARMUP_ROUNDS", "1"))
+# Écart relatif en dessous duquel une différence, même significative, est jugée négligeable
+DIFF_MIN_EFFECT = float(os.getenv("DIFF_MIN_EFFECT", "0.02"))
+PERMUTATIONS = 20000
+BOOTSTRAP = 5000
+
+METRICS = {
+    "energy_kwh": lambda carbon, measure: carbon["energy_kwh"],
+    "cpu_time_s": lambda carbon, measure: measure["cpu_time_s"],
+    "duration_s": lambda carbon, measure: measure["duration_s"],
+}
+
+
+def paired_test(baseline: list, candidate: list, seed: int = 0) -> dict:
+    """Écart moyen candidate - référence, p-value bilatérale (inversion des signes) et IC 95 % bootstrap"""
+    import numpy as np
+
+    diffs = np.asarray(candidate, dtype=float) - np.asarray(baseline, dtype=float)
+    n = len(diffs)
+    observed = abs(diffs.mean())
+    rng = np.random.default_rng(seed)
+    if n <= 14:
+        # Distribution exacte : les 2^n affectations de signes
+        signs = np.array(list(itertools.product((1.0, -1.0), repeat=n)))
+    else:
+        signs = rng.choice((1.0, -1.0), size=(PERMUTATIONS, n))
+    null = np.abs((signs * diffs).mean(axis=1))
+    # Tolérance relative : les permutations égales à l'observé (aux arrondis près) comptent comme extrêmes
+    p_value = float((null >= observed * (1 - 1e-9)).mean())
+    boot = diffs[rng.integers(0, n, size=(BOOTSTRAP, n))].mean(axis=1)
+    base_mean = float(np.mean(baseline))
+    return {
+        "baseline_mean": base_mean,
+        "candidate_mean": float(np.mean(candidate)),
+        "delta": float(diffs.mean()),
+        "delta_pct": round(float(diffs.mean()) / base_mean * 100, 2) if base_mean else None,
+        "ci95": [float(np.percentile(boot, 2.5)), float(np.percentile(boot, 97.5))],
+        "p_value": round(p_value, 5),
+        "candidate_faster_pairs": int((diffs < 0).sum()),
+        "pairs": n,
+    }
+
+
+def verdict(test: dict, alpha: float, min_effect: float = DIFF_MIN_EFFECT) -> str:
+    if test["p_value"] >= alpha:
+        return "no_significant_difference"
+    if test["delta_pct"] is not None and abs(test["delta_pct"]) < min_effect * 100:
+        return "negligible"
+    return "improved" if test["delta"] < 0 else "regressed"
+
+
+async def analyze_carbon_diff(baseline_code: str, candidate_code: str, filename: str = "analysis.py",
+                              rounds: Optional[int] = None, backend: str = "direct", alpha: float = 0.05,
+                              limits: Optional[dict] = None) -> dict:
+    """Compare l'énergie et le temps de deux versions d'un code (AB / BA alternés, même interpréteur chaud)"""
+    if backend not in ENERGY_BACKENDS:
+        raise ValueError(f"Backend inconnu : {backend} (attendu : {', '.join(ENERGY_BACKENDS)})")
+    rounds = max(2, rounds or DIFF_ROUNDS)
+    versions = {"baseline": baseline_code, "candidate": candidate_code}
+    schedule = []
+    for pair in range(DIFF_WARMUP_ROUNDS + rounds):
+        order = ("baseline", "candidate") if pair % 2 == 0 else ("candidate", "baseline")
+        schedule.extend((pair, version) for version in order)
+    chunk = [
+        {"index": i, "code": versions[version], "filename": filename}
+        for i, (_, version) in enumerate(schedule)
+    ]
+
+    await report_stage("measuring", f"{rounds} paires A/B alternées (+{DIFF_WARMUP_ROUNDS} de chauffe)")
+    measures, usages = await _run_batch_chunk(chunk, backend, limits)
+
+    samples = {version: {metric: {} for metric in METRICS} for version in versions}
+    outputs = {}
+    for i, (pair, version) in enumerate(schedule):
+        payload = measures.get(i)
+        # Exécution interrompue (budget du fichier, runner tué) : mesure partielle, écartée
+        if payload is None or usages[i]["termination"] is not None:
+            continue
+        outputs.setdefault(version, payload["output"])
+        if pair < DIFF_WARMUP_ROUNDS:
+            continue
+        measure = payload["measure"]
+        carbon = measure["codecarbon"] if backend == "codecarbon" else direct_energy(measure)
+        for metric, extract in METRICS.items():
+            samples[version][metric][pair] = extract(carbon, measure)
+
+    # Seules les paires complètes comptent : un échec d'un côté écarte la paire entière
+    pairs = sorted(set(samples["baseline"]["energy_kwh"]) & set(samples["candidate"]["energy_kwh"]))
+    result = {
+        "filename": filename,
+        "backend": backend,
+        "rounds": rounds,
+        "pairs_measured": len(pairs),
+        "schedule": "".join("A" if version == "baseline" else "B" for _, version in schedule),
+        "resource_usage": usages[len(schedule) - 1],
+        "interrupted_runs": sum(1 for usage in usages.values() if usage["termination"] is not None),
+        "outputs_match": outputs.get("baseline") == outputs.get("candidate") if len(outputs) == 2 else None,
+        "complexity": {
+            "baseline": analyze_code_complexity(baseline_code),
+            "candidate": analyze_code_complexity(candidate_code),
+        },
+    }
+    if len(pairs) < 2:
+        result["verdict"] = "inconclusive"
+        result["message"] = "Moins de deux paires mesurées : exécution en échec ou interrompue"
+        return result
+
+    await report_stage("statistics", f"Test apparié sur {len(pairs)} paires")
+    result["metrics"] = {
+        metric: paired_test([samples["baseline"][metric][p] for p in pairs], [samples["candidate"][metric][p] for p in pairs])
+        for metric in METRICS
+    }
+    energy = result["metrics"]["energy_kwh"]
+    result["verdict"] = verdict(energy, alpha)
+    # Énergie de référence nulle (codecarbon sur un extrait court) : pas de variation relative
+    delta = f"{energy['delta_pct']:+.2f} %" if energy["delta_pct"] is not None else f"{energy['delta']:+.3e} kWh (n/a %)"
+    result["summary"] = (
+        f"Énergie {delta} (p={energy['p_value']}, IC95 {energy['ci95'][0]:.3e}"
+        f" / {energy['ci95'][1]:.3e} kWh) sur {len(pairs)} paires : {result['verdict']}"
+    )
+    if result["outputs_match"] is False:
+        result["warning"] = "Les sorties des deux versions diffèrent : vérifier que l'optimisation conserve le comportement"
+    return result
@@ -0,0 +1,257 @@
+"""
+Prédiction statique de l'énergie d'un code Python à partir de caractéristiques AST
+Le modèle est une régression ridge sur log10(énergie), entraînée sur nos propres mesures.
+"""
+import ast
+import collections
+import json
+import logging
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+ENERGY_MODEL_SAMPLES = Path(os.path.expanduser(os.getenv("ENERGY_MODEL_SAMPLES", "~/.cache/ecocode/energy_samples.jsonl")))
+ENERGY_MODEL_MIN_SAMPLES = int(os.getenv("ENERGY_MODEL_MIN_SAMPLES", "20"))
+ENERGY_MODEL_RIDGE = float(os.getenv("ENERGY_MODEL_RIDGE", "1.0"))
+# Fenêtre d'entraînement : dernières mesures retenues par backend (le fichier est compacté au-delà)
+ENERGY_MODEL_MAX_SAMPLES = int(os.getenv("ENERGY_MODEL_MAX_SAMPLES", "5000"))
+# Réentraînement par lots : après ce nombre de nouvelles mesures, ou après ce délai s'il y en a eu
+ENERGY_MODEL_REFIT_SAMPLES = int(os.getenv("ENERGY_MODEL_REFIT_SAMPLES", "50"))
+ENERGY_MODEL_REFIT_S = float(os.getenv("ENERGY_MODEL_REFIT_S", "600"))
+
+# Un modèle par backend : codecarbon inclut le surcoût du tracker, le backend direct ne mesure que le processus
+MODEL_BACKENDS = ("codecarbon", "direct")
+DIRECT_BACKENDS = ("direct", "rapl", "cpu_model")
+
+FEATURES = (
+    "lines", "loops", "nested_loops", "max_nesting_depth", "recursive_functions",
+    "calls", "functions", "comprehensions", "imports", "has_main", "complexity_score",
+)
+ENERGY_CLASSES = ("A", "B", "C", "D", "E")
+# Seuils par défaut (kWh) tant qu'il n'y a pas assez de mesures pour calibrer par quantiles
+DEFAULT_THRESHOLDS = (1e-7, 1e-6, 1e-5, 1e-4)
+
+
+def extract_features(code: str, complexity: Optional[dict] = None) -> Optional[dict]:
+    """Caractéristiques AST d'un module (None si le code ne se parse pas)"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    if complexity is None:
+        from services.carbon.carbon_analyzer import analyze_code_complexity
+        complexity = analyze_code_complexity(code)
+
+    calls = functions = comprehensions = imports = has_main = 0
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            calls += 1
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions += 1
+        elif isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            comprehensions += 1
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports += 1
+        elif isinstance(node, ast.If) and "__main__" in ast.unparse(node.test):
+            has_main = 1
+
+    return {
+        "lines": code.count("\n") + 1,
+        "loops": complexity.get("total_loops", 0),
+        "nested_loops": complexity.get("nested_loops", 0),
+        "max_nesting_depth": complexity.get("max_nesting_depth", 0),
+        "recursive_functions": complexity.get("recursive_functions", 0),
+        "calls": calls,
+        "functions": functions,
+        "comprehensions": comprehensions,
+        "imports": imports,
+        "has_main": has_main,
+        "complexity_score": complexity.get("complexity_score", 0),
+    }
+
+
+def model_backend(backend: Optional[str]) -> str:
+    """Modèle entraîné sur les mesures d'un backend (rapl et cpu_model sont les deux sources du backend direct)"""
+    return "direct" if backend in DIRECT_BACKENDS else "codecarbon"
+
+
+_samples_lock = threading.Lock()
+# Lignes du fichier d'échantillons (compté au premier ajout) et mesures ajoutées depuis le dernier entraînement
+_sample_lines = None
+_pending_samples = 0
+
+
+def record_sample(features: Optional[dict], carbon_data: dict):
+    """Ajoute une mesure réelle au jeu d'entraînement"""
+    global _sample_lines, _pending_samples
+    energy = carbon_data.get("energy_kwh", 0)
+    if not features or energy <= 0:
+        return
+    sample = {
+        "features": features,
+        "energy_kwh": energy,
+        "backend": carbon_data.get("backend"),
+        "recorded_at": time.time(),
+    }
+    try:
+        with _samples_lock:
+            ENERGY_MODEL_SAMPLES.parent.mkdir(parents=True, exist_ok=True)
+            if _sample_lines is None:
+                _sample_lines = _count_lines()
+            with open(ENERGY_MODEL_SAMPLES, "a", encoding="utf-8") as f:
+                f.write(json.dumps(sample) + "\n")
+            _sample_lines += 1
+            _pending_samples += 1
+            # Compaction quand le fichier dépasse d'une fenêtre la taille utile : coût amorti sur ENERGY_MODEL_MAX_SAMPLES ajouts
+            if _sample_lines > (len(MODEL_BACKENDS) + 1) * ENERGY_MODEL_MAX_SAMPLES:
+                _sample_lines = _compact()
+    except OSError as e:
+        logger.warning("Échantillon énergétique non enregistré : %s", e)
+
+
+def _count_lines() -> int:
+    if not ENERGY_MODEL_SAMPLES.exists():
+        return 0
+    with open(ENERGY_MODEL_SAMPLES, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def _compact() -> int:
+    """Réécrit le fichier avec la seule fenêtre d'entraînement de chaque backend (remplacement atomique)"""
+    samples = [s for window in load_samples().values() for s in window]
+    samples.sort(key=lambda s: s.get("recorded_at", 0))
+    tmp = ENERGY_MODEL_SAMPLES.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(s) + "\n" for s in samples)
+    os.replace(tmp, ENERGY_MODEL_SAMPLES)
+    return len(samples)
+
+
+def load_samples() -> dict:
+    """Dernières mesures de chaque backend, au plus ENERGY_MODEL_MAX_SAMPLES chacun"""
+    windows = {backend: collections.deque(maxlen=ENERGY_MODEL_MAX_SAMPLES) for backend in MODEL_BACKENDS}
+    if not ENERGY_MODEL_SAMPLES.exists():
+        return {backend: [] for backend in MODEL_BACKENDS}
+    with open(ENERGY_MODEL_SAMPLES, encoding="utf-8") as f:
+        for line in f:
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                continue
+            windows[model_backend(sample.get("backend"))].append(sample)
+    return {backend: list(window) for backend, window in windows.items()}
+
+
+def _transform(rows):
+    """log1p des compteurs : les tailles de code varient de plusieurs ordres de grandeur"""
+    import numpy as np
+    return np.log1p(np.asarray(rows, dtype=float))
+
+
+class EnergyModel:
+    """Régression ridge log-énergie ~ caractéristiques AST, classes calibrées par quantiles"""
+
+    def __init__(self):
+        self.weights = None
+        self.mean = None
+        self.scale = None
+        self.residual_std = None
+        self.thresholds = DEFAULT_THRESHOLDS
+        self.samples = 0
+
+    def fit(self, samples: List[dict]) -> "EnergyModel":
+        import numpy as np
+        self.samples = len(samples)
+        if len(samples) < ENERGY_MODEL_MIN_SAMPLES:
+            return self
+        X = _transform([[s["features"].get(f, 0) for f in FEATURES] for s in samples])
+        y = np.log10([s["energy_kwh"] for s in samples])
+        self.mean = X.mean(axis=0)
+        self.scale = X.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        Z = np.hstack([np.ones((len(X), 1)), (X - self.mean) / self.scale])
+        penalty = ENERGY_MODEL_RIDGE * np.eye(Z.shape[1])
+        penalty[0, 0] = 0
+        self.weights = np.linalg.solve(Z.T @ Z + penalty, Z.T @ y)
+        self.residual_std = float(np.std(y - Z @ self.weights))
+        self.thresholds = tuple(float(t) for t in 10 ** np.quantile(y, [0.2, 0.4, 0.6, 0.8]))
+        return self
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    def predict_log_energy(self, feature_rows: List[dict]):
+        """log10(kWh) prédit pour un lot de fichiers, en une seule multiplication matricielle"""
+        import numpy as np
+        X = _transform([[row.get(f, 0) for f in FEATURES] for row in feature_rows])
+        if not self.trained:
+            # A priori grossier tant que le modèle n'est pas calibré : l'énergie croît avec la complexité statique
+            complexity = np.asarray([row.get("complexity_score", 0) for row in feature_rows], dtype=float)
+            return -7.0 + 0.25 * complexity + 0.5 * X[:, FEATURES.index("lines")] / math.log(10)
+        Z = np.hstack([np.ones((len(X), 1)), (X - self.mean) / self.scale])
+        return Z @ self.weights
+
+    def energy_class(self, energy_kwh: float) -> str:
+        for label, threshold in zip(ENERGY_CLASSES, self.thresholds):
+            if energy_kwh < threshold:
+                return label
+        return ENERGY_CLASSES[-1]
+
+
+_models = None
+_models_mtime = None
+_models_fitted_at = 0.0
+_model_lock = threading.Lock()
+
+
+def _refit_due(mtime: Optional[float]) -> bool:
+    """Premier entraînement, ou fichier modifié et assez de nouvelles mesures (ou délai écoulé)"""
+    if _models is None:
+        return True
+    if mtime == _models_mtime:
+        return False
+    return _pending_samples >= ENERGY_MODEL_REFIT_SAMPLES or time.monotonic() - _models_fitted_at >= ENERGY_MODEL_REFIT_S
+
+
+def get_model(backend: str = "codecarbon") -> EnergyModel:
+    """Modèle du backend, réentraîné par lots sur la fenêtre des dernières mesures (pas à chaque mesure)"""
+    global _models, _models_mtime, _models_fitted_at, _pending_samples
+    mtime = ENERGY_MODEL_SAMPLES.stat().st_mtime if ENERGY_MODEL_SAMPLES.exists() else None
+    with _model_lock:
+        if _refit_due(mtime):
+            samples = load_samples()
+            _models = {name: EnergyModel().fit(samples[name]) for name in MODEL_BACKENDS}
+            _models_mtime, _models_fitted_at, _pending_samples = mtime, time.monotonic(), 0
+        return _models[model_backend(backend)]
+
+
+def predict_energy_batch(codes: List[str], carbon_intensity_g_per_kwh: float = 475,
+                         backend: str = "codecarbon") -> List[dict]:
+    """Estime énergie, émissions et classe énergétique pour un lot de codes, sans rien exécuter"""
+    model = get_model(backend)
+    features = [extract_features(code) for code in codes]
+    valid = [i for i, f in enumerate(features) if f is not None]
+    predictions = [{"error": "Parse failed"} for _ in codes]
+    if not valid:
+        return predictions
+    log_energy = model.predict_log_energy([features[i] for i in valid])
+    spread = model.residual_std if model.trained else None
+    for i, value in zip(valid, log_energy):
+        energy = float(10 ** value)
+        predictions[i] = {
+            "predicted_energy_kwh": energy,
+            "predicted_emissions_kg": energy * carbon_intensity_g_per_kwh / 1000,
+            "energy_class": model.energy_class(energy),
+            "interval_kwh": [float(10 ** (value - spread)), float(10 ** (value + spread))] if spread else None,
+            "model": "ridge" if model.trained else "prior",
+            "model_backend": model_backend(backend),
+            "training_samples": model.samples,
+            "features": features[i],
+        }
+    return predictions
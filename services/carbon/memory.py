@@ -0,0 +1,179 @@
+"""
+Profil mémoire optionnel du code mesuré (tracemalloc) : pic tracé, sites d'allocation au pic, blocs par fonction
+Le runner prend un instantané à chaque nouveau palier de mémoire tracée : les sites rapportés sont ceux
+du pic, pas ceux encore vivants en fin d'exécution.
+"""
+import ast
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+MEMORY_TOP_SITES = int(os.getenv("MEMORY_TOP_SITES", "10"))
+# Pic mémoire tracé au-delà duquel une recommandation est émise
+MEMORY_HIGH_MB = float(os.getenv("MEMORY_HIGH_MB", "100"))
+# Site d'allocation qui construit une liste et retient au moins cette taille au pic
+MEMORY_LIST_SITE_MB = float(os.getenv("MEMORY_LIST_SITE_MB", "10"))
+
+# Injecté dans les runners : nouvel instantané dès que la mémoire tracée dépasse de 50 % celle du précédent
+MEMORY_PROFILER = """
+import json as _json, threading as _threading, tracemalloc as _tracemalloc
+
+class MemoryProfiler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_bytes = 0
+        self.snapshots = 0
+        self.done = _threading.Event()
+
+    def start(self):
+        _tracemalloc.start(1)
+        self.thread = _threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def capture(self, current):
+        self.snapshot = None
+        self.snapshot = _tracemalloc.take_snapshot()
+        self.snapshot_bytes = current
+        self.snapshots += 1
+
+    def watch(self):
+        while not self.done.wait(self.interval):
+            current = _tracemalloc.get_traced_memory()[0]
+            if current > self.snapshot_bytes * 1.5 + 65536:
+                self.capture(current)
+
+    def stop(self, file_path, output_path, top):
+        self.done.set()
+        self.thread.join()
+        current, peak = _tracemalloc.get_traced_memory()
+        if current >= self.snapshot_bytes:
+            self.capture(current)
+        _tracemalloc.stop()
+        # Un seul regroupement par ligne (coûteux sur des millions de blocs), puis tri en Python
+        sites, user_lines = [], {}
+        for stat in self.snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            if frame.filename == file_path:
+                user_lines[frame.lineno] = [stat.size, stat.count]
+            if frame.filename not in (__file__, _threading.__file__, _tracemalloc.__file__):
+                sites.append(stat)
+        with open(output_path, "w") as f:
+            _json.dump({
+                "peak_bytes": peak,
+                "final_bytes": current,
+                "snapshot_bytes": self.snapshot_bytes,
+                "snapshots": self.snapshots,
+                "top_sites": [
+                    {"file": stat.traceback[0].filename, "line": stat.traceback[0].lineno, "size": stat.size, "count": stat.count}
+                    for stat in sites[:top]
+                ],
+                "user_lines": user_lines,
+            }, f)
+"""
+
+
+def _functions(tree: ast.AST) -> list:
+    """(début, fin, nom qualifié) des fonctions, les plus internes en dernier"""
+    spans = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{prefix}{child.name}"
+                if not isinstance(child, ast.ClassDef):
+                    spans.append((child.lineno, child.end_lineno, name))
+                visit(child, name + ".")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+    return spans
+
+
+def _list_building_lines(tree: ast.AST) -> set:
+    """Lignes qui matérialisent une liste entière : compréhensions, list(...), sorted(...)"""
+    lines = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ListComp):
+            lines.add(node.lineno)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("list", "sorted") and node.args:
+            lines.add(node.lineno)
+    return lines
+
+
+def read_memory_profile(temp_path: Path, code: str, file_path: Path) -> Optional[dict]:
+    """Profil brut du runner enrichi : sites du fichier analysé avec leur source et agrégat par fonction"""
+    try:
+        raw = json.loads((temp_path / "memory_profile.json").read_text())
+    except (OSError, ValueError):
+        return None
+    source = code.splitlines()
+    try:
+        tree = ast.parse(code)
+        functions, list_lines = _functions(tree), _list_building_lines(tree)
+    except SyntaxError:
+        functions, list_lines = [], set()
+
+    def function_at(line: int) -> str:
+        owner = "<module>"
+        for start, end, name in functions:
+            if start <= line <= end:
+                owner = name
+        return owner
+
+    user_sites, per_function = [], {}
+    for line, (size, count) in raw["user_lines"].items():
+        line = int(line)
+        function = function_at(line)
+        user_sites.append({
+            "line": line,
+            "function": function,
+            "size_kb": round(size / 1024, 1),
+            "blocks": count,
+            "source": source[line - 1].strip() if 0 < line <= len(source) else None,
+            "builds_list": line in list_lines,
+        })
+        totals = per_function.setdefault(function, {"function": function, "size_kb": 0.0, "blocks": 0})
+        totals["size_kb"] = round(totals["size_kb"] + size / 1024, 1)
+        totals["blocks"] += count
+    user_sites.sort(key=lambda site: site["size_kb"], reverse=True)
+
+    def location(site: dict) -> dict:
+        inside = site["file"] == str(file_path)
+        return {
+            "location": f"{file_path.name if inside else site['file']}:{site['line']}",
+            "size_kb": round(site["size"] / 1024, 1),
+            "blocks": site["count"],
+        }
+
+    return {
+        "peak_traced_kb": round(raw["peak_bytes"] / 1024, 1),
+        "final_traced_kb": round(raw["final_bytes"] / 1024, 1),
+        "profiled_at_kb": round(raw["snapshot_bytes"] / 1024, 1),
+        "top_sites": [location(site) for site in raw["top_sites"]],
+        "code_sites": user_sites[:MEMORY_TOP_SITES],
+        "by_function": sorted(per_function.values(), key=lambda f: f["size_kb"], reverse=True),
+        "note": "Mesures énergie / temps gonflées par tracemalloc ; blocs = allocations vivantes au pic",
+    }
+
+
+def memory_recommendations(memory: dict) -> list:
+    recommendations = []
+    peak_mb = memory["peak_traced_kb"] / 1024
+    if peak_mb > MEMORY_HIGH_MB:
+        heaviest = memory["by_function"][0]["function"] if memory["by_function"] else None
+        recommendations.append({
+            "type": "HIGH",
+            "message": f"Pic mémoire de {peak_mb:.0f} Mo" + (f", surtout dans {heaviest}" if heaviest else ""),
+            "impact": "La mémoire allouée coûte de l'énergie (RAM, GC, cache) : traiter les données par morceaux",
+        })
+    for site in memory["code_sites"]:
+        if site["builds_list"] and site["size_kb"] / 1024 >= MEMORY_LIST_SITE_MB:
+            recommendations.append({
+                "type": "MEDIUM",
+                "message": f"Ligne {site['line']} ({site['function']}) : liste de {site['size_kb'] / 1024:.0f} Mo matérialisée - `{site['source']}`",
+                "impact": "Un générateur (expression génératrice, itérateur) éviterait de garder toute la liste en mémoire",
+            })
+    return recommendations
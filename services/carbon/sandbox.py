@@ -0,0 +1,235 @@
+"""
+Exécution isolée du code mesuré : rlimits (ou cgroup v2 si délégué) et comptabilité getrusage
+Les sorties sont lues au fil de l'eau dans des captures bornées (voir services/artifacts.py).
+Annulation ou échéance de l'appel (services/cancellation.py) : tout le groupe de processus est tué.
+"""
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+from uuid import uuid4
+
+from services.artifacts import OutputCapture
+from services.cancellation import CANCELLATIONS_TOTAL, on_cancel, remaining, run_blocking
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "300"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "4096"))
+SANDBOX_WALL_SECONDS = int(os.getenv("SANDBOX_WALL_SECONDS", "600"))
+SANDBOX_FSIZE_MB = int(os.getenv("SANDBOX_FSIZE_MB", "100"))
+# RLIMIT_NPROC compte tous les processus de l'utilisateur : désactivé (0) par défaut, pids.max le remplace en cgroup
+SANDBOX_NPROC = int(os.getenv("SANDBOX_NPROC", "0"))
+SANDBOX_PIDS_MAX = int(os.getenv("SANDBOX_PIDS_MAX", "64"))
+# Répertoire cgroup v2 délégué et accessible en écriture (ex: /sys/fs/cgroup/ecocode.slice)
+SANDBOX_CGROUP_ROOT = os.getenv("SANDBOX_CGROUP_ROOT", "")
+
+
+def sandbox_limits(**overrides) -> dict:
+    """Limites par défaut (variables d'environnement), surchargées appel par appel"""
+    limits = {
+        "cpu_seconds": SANDBOX_CPU_SECONDS,
+        "memory_mb": SANDBOX_MEMORY_MB,
+        "wall_seconds": SANDBOX_WALL_SECONDS,
+        "fsize_mb": SANDBOX_FSIZE_MB,
+        "nproc": SANDBOX_NPROC,
+        "pids_max": SANDBOX_PIDS_MAX,
+    }
+    limits.update({k: v for k, v in overrides.items() if v is not None})
+    return limits
+
+
+def _create_cgroup(limits: dict) -> Optional[Path]:
+    if not SANDBOX_CGROUP_ROOT:
+        return None
+    root = Path(SANDBOX_CGROUP_ROOT)
+    if not (root / "cgroup.controllers").exists() or not os.access(root, os.W_OK):
+        return None
+    path = root / f"run_{uuid4().hex[:12]}"
+    try:
+        path.mkdir()
+        (path / "memory.max").write_text(str(limits["memory_mb"] * 1024 * 1024))
+        (path / "memory.swap.max").write_text("0")
+        (path / "pids.max").write_text(str(limits["pids_max"]))
+        return path
+    except OSError as e:
+        logger.warning("cgroup indisponible, repli sur les rlimits : %s", e)
+        _remove_cgroup(path)
+        return None
+
+
+def _remove_cgroup(path: Optional[Path]):
+    if path is None:
+        return
+    try:
+        path.rmdir()
+    except OSError:
+        pass
+
+
+def _read_cgroup_stats(path: Path) -> dict:
+    stats = {}
+    try:
+        events = dict(line.split() for line in (path / "memory.events").read_text().splitlines())
+        stats["oom_kills"] = int(events.get("oom_kill", 0))
+        peak = path / "memory.peak"
+        if peak.exists():
+            stats["memory_peak_kb"] = int(peak.read_text()) // 1024
+        cpu = dict(line.split() for line in (path / "cpu.stat").read_text().splitlines())
+        stats["nr_throttled"] = int(cpu.get("nr_throttled", 0))
+    except (OSError, ValueError):
+        pass
+    return stats
+
+
+# Processus intermédiaire : entre dans le cgroup ou pose les rlimits, puis exec du programme (même pid).
+# Pas de preexec_fn : du Python exécuté entre fork et exec peut bloquer quand le serveur a des threads.
+_LIMITER = """
+import os, resource, sys
+cgroup, memory, nproc, cpu, fsize = sys.argv[1], *map(int, sys.argv[2:6])
+if cgroup:
+    with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+        f.write(str(os.getpid()))
+else:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    if nproc:
+        resource.setrlimit(resource.RLIMIT_NPROC, (nproc, nproc))
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+os.execvp(sys.argv[6], sys.argv[6:])
+"""
+
+
+def _limited(args: List[str], limits: dict, cgroup: Optional[Path]) -> List[str]:
+    """args précédés du processus intermédiaire qui applique les limites avant exec"""
+    return [
+        sys.executable, "-I", "-S", "-c", _LIMITER,
+        str(cgroup or ""), str(limits["memory_mb"] * 1024 * 1024), str(limits["nproc"]),
+        str(limits["cpu_seconds"]), str(limits["fsize_mb"] * 1024 * 1024),
+        *args,
+    ]
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _drain(stream, capture: OutputCapture):
+    try:
+        for chunk in iter(lambda: stream.read(65536), b""):
+            capture.write(chunk)
+    finally:
+        capture.close()
+        stream.close()
+
+
+def _termination(status: int, timed_out: bool, cancelled: bool, cgroup_stats: dict, limits: dict, cpu_used: float,
+                 output_tail: bytes) -> Optional[str]:
+    if cancelled:
+        return "cancelled"
+    if timed_out:
+        return "wall_timeout"
+    # Sous RLIMIT_AS, le dépassement se traduit par un MemoryError côté Python (éventuellement rattrapé par le runner)
+    if cgroup_stats.get("oom_kills") or b"MemoryError" in output_tail:
+        return "memory_limit"
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        if sig == signal.SIGXCPU or (sig == signal.SIGKILL and cpu_used >= limits["cpu_seconds"]):
+            return "cpu_limit"
+        return f"signal:{signal.Signals(sig).name}"
+    return None
+
+
+def run_sandboxed(args: List[str], cwd: Optional[str] = None, limits: Optional[dict] = None) -> dict:
+    """Lance args sous limites et renvoie sorties (bornées), code retour et consommation (bloquant, via asyncio.to_thread)"""
+    limits = limits or sandbox_limits()
+    cgroup = _create_cgroup(limits)
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        _limited(args, limits, cgroup),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+    stdout, stderr = OutputCapture("stdout"), OutputCapture("stderr")
+    readers = [
+        threading.Thread(target=_drain, args=(proc.stdout, stdout), daemon=True),
+        threading.Thread(target=_drain, args=(proc.stderr, stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out, cancelled = threading.Event(), threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        _kill_group(proc.pid)
+
+    def on_cancelled():
+        cancelled.set()
+        CANCELLATIONS_TOTAL.inc("runner")
+        _kill_group(proc.pid)
+
+    # L'échéance de l'appel (safe_execute) raccourcit la limite de durée du sandbox
+    timer = threading.Timer(remaining(limits["wall_seconds"]), on_timeout)
+    timer.start()
+    try:
+        with on_cancel(on_cancelled):
+            # WNOWAIT laisse l'enfant zombie : son pid, donc l'id du groupe, ne peut pas être réattribué d'ici le killpg
+            os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    finally:
+        timer.cancel()
+    wall = time.monotonic() - started
+    # Les petits-enfants orphelins gardent les pipes ouverts : on nettoie tout le groupe avant de récolter l'enfant
+    _kill_group(proc.pid)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+
+    cgroup_stats = _read_cgroup_stats(cgroup) if cgroup is not None else {}
+    _remove_cgroup(cgroup)
+
+    cpu_used = usage.ru_utime + usage.ru_stime
+    termination = _termination(status, timed_out.is_set(), cancelled.is_set(), cgroup_stats, limits, cpu_used,
+                               stdout.tail_bytes() + stderr.tail_bytes())
+    contended = usage.ru_nivcsw > max(50, usage.ru_nvcsw) and wall > 0 and cpu_used / wall < 0.8
+    resource_usage = {
+        "user_cpu_s": round(usage.ru_utime, 6),
+        "sys_cpu_s": round(usage.ru_stime, 6),
+        "wall_s": round(wall, 6),
+        "max_rss_kb": usage.ru_maxrss,
+        "voluntary_ctx_switches": usage.ru_nvcsw,
+        "involuntary_ctx_switches": usage.ru_nivcsw,
+        "limited_by": "cgroup" if cgroup is not None else "rlimit",
+        # pids.max n'existe qu'en cgroup : ne pas l'annoncer sous rlimits
+        "limits": limits if cgroup is not None else {k: v for k, v in limits.items() if k != "pids_max"},
+        "termination": termination,
+        "throttled": contended or cgroup_stats.get("nr_throttled", 0) > 0,
+        **cgroup_stats,
+    }
+    resource_usage["retry_recommended"] = termination is None and resource_usage["throttled"]
+
+    return {
+        "returncode": proc.returncode,
+        "stdout": stdout.text(),
+        "stderr": stderr.text(),
+        "output_capture": {"stdout": stdout.summary(), "stderr": stderr.summary()},
+        "timed_out": timed_out.is_set(),
+        "resource_usage": resource_usage,
+    }
+
+
+async def run_sandboxed_async(args: List[str], cwd: Optional[str] = None, limits: Optional[dict] = None) -> dict:
+    """run_sandboxed depuis une coroutine : l'annulation tue le groupe de processus avant de rendre la main"""
+    return await run_blocking(run_sandboxed, args, cwd, limits)
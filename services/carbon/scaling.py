@@ -0,0 +1,294 @@
+"""
+Complexité empirique : une fonction est exécutée dans le sandbox à des tailles d'entrée croissantes
+(géométriques) et son temps / son énergie sont ajustés en log-log contre n, jusqu'à épuisement du budget.
+"""
+import json
+import math
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from services.progress import report_stage
+from services.metrics import track_stage
+from services.carbon.sandbox import run_sandboxed_async, sandbox_limits
+from services.carbon.carbon_analyzer import RAPL_READER, analyze_code_complexity, direct_energy
+
+SCALING_TIME_BUDGET_S = float(os.getenv("SCALING_TIME_BUDGET_S", "20"))
+# Durée minimale d'une mesure : les petites tailles sont répétées jusqu'à la dépasser
+SCALING_MIN_MEASURE_S = float(os.getenv("SCALING_MIN_MEASURE_S", "0.02"))
+SCALING_MAX_REPEATS = 10000
+
+# Classes candidates : log g(n), pour comparer les modèles t = a·g(n) dans l'espace logarithmique
+GROWTH_CLASSES = {
+    "O(1)": lambda n: 0.0,
+    "O(log n)": lambda n: math.log(math.log2(n) + 1),
+    "O(n)": lambda n: math.log(n),
+    "O(n log n)": lambda n: math.log(n) + math.log(math.log2(n) + 1),
+    "O(n^2)": lambda n: 2 * math.log(n),
+    "O(n^3)": lambda n: 3 * math.log(n),
+    "O(2^n)": lambda n: n * math.log(2),
+}
+
+SCALING_RUNNER = RAPL_READER + '''
+import contextlib, inspect, json, math, os, random, resource, string, sys, time
+
+config = json.load(open(sys.argv[1]))
+sys.path.append(os.path.dirname(config["file_path"]))
+results = open(config["result_path"], "a")
+devnull = open(os.devnull, "w")
+
+
+def emit(record):
+    results.write(json.dumps(record) + "\\n")
+    results.flush()
+
+
+namespace = {"__name__": "__scaling__", "__file__": config["file_path"]}
+try:
+    with contextlib.redirect_stdout(devnull):
+        exec(compile(open(config["file_path"]).read(), config["file_path"], "exec"), namespace)
+        if config["generator"]:
+            exec(compile(config["generator"], "<input_generator>", "exec"), namespace)
+except Exception as e:
+    emit({"error": f"Chargement du code impossible : {e!r}"})
+    sys.exit(0)
+
+func = namespace.get(config["function"])
+if not callable(func):
+    emit({"error": f"Fonction introuvable : {config['function']}"})
+    sys.exit(0)
+
+INT_NAMES = {"n", "k", "m", "size", "count", "length", "limit", "depth", "num", "number", "steps", "times"}
+LIST_NAMES = {"data", "items", "arr", "array", "lst", "values", "xs", "nums", "numbers", "seq", "sequence", "elements"}
+STR_NAMES = {"s", "text", "string", "word", "chars"}
+BUILDERS = {
+    "int": lambda n, rng: n,
+    "list": lambda n, rng: [rng.randint(0, n) for _ in range(n)],
+    "str": lambda n, rng: "".join(rng.choice(string.ascii_lowercase) for _ in range(n)),
+    "dict": lambda n, rng: {i: rng.randint(0, n) for i in range(n)},
+    "set": lambda n, rng: set(range(n)),
+}
+
+
+def infer(param):
+    annotation = param.annotation
+    name = annotation if isinstance(annotation, str) else getattr(annotation, "__name__", str(annotation))
+    name = name.split("[")[0].lower().replace("typing.", "")
+    if name in BUILDERS:
+        return name
+    if param.default is not inspect.Parameter.empty and type(param.default).__name__ in BUILDERS:
+        return type(param.default).__name__
+    for kind, names in (("int", INT_NAMES), ("list", LIST_NAMES), ("str", STR_NAMES)):
+        if param.name.lower() in names:
+            return kind
+    return None
+
+
+if config["generator"]:
+    make_input = namespace.get("make_input")
+    if not callable(make_input):
+        emit({"error": "input_generator doit définir make_input(n)"})
+        sys.exit(0)
+    emit({"inputs": "make_input"})
+else:
+    params = [p for p in inspect.signature(func).parameters.values()
+              if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) and p.default is inspect.Parameter.empty]
+    if not params:
+        emit({"error": "Aucun paramètre de taille à faire varier : fournir input_generator"})
+        sys.exit(0)
+    kinds = {p.name: infer(p) for p in params}
+    unknown = [name for name, kind in kinds.items() if kind is None]
+    if unknown:
+        emit({"error": f"Type d'entrée non déductible pour {', '.join(unknown)} : fournir input_generator"})
+        sys.exit(0)
+    emit({"inputs": kinds})
+
+    def make_input(n):
+        rng = random.Random(n)
+        return tuple(BUILDERS[kind](n, rng) for kind in kinds.values())
+
+
+def build(n):
+    args = make_input(n)
+    return args if isinstance(args, tuple) else (args,)
+
+
+def measure_calls(batch):
+    rapl_before = read_rapl()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(devnull):
+        for args in batch:
+            func(*args)
+    return {
+        "duration_s": time.perf_counter() - wall_start,
+        "cpu_time_s": time.process_time() - cpu_start,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "rapl": rapl_delta_j(rapl_before, read_rapl()) if rapl_before else None,
+    }
+
+
+started = time.perf_counter()
+n, previous = config["start_size"], None
+while True:
+    try:
+        measure = measure_calls([build(n)])
+        repeats = 1
+        if measure["duration_s"] < config["min_measure_s"]:
+            # Petites tailles : entrées fraîches pour chaque appel (les fonctions qui trient sur place faussent sinon)
+            repeats = min(config["max_repeats"], math.ceil(config["min_measure_s"] / max(measure["duration_s"], 1e-7)))
+            measure = measure_calls([build(n) for _ in range(repeats)])
+    except Exception as e:
+        emit({"n": n, "error": repr(e)})
+        break
+    per_call = measure["duration_s"] / repeats
+    emit({"n": n, "repeats": repeats, "measure": measure})
+
+    next_n = max(n + 1, int(n * config["growth_factor"]))
+    if next_n > config["max_size"]:
+        emit({"stop": "max_size"})
+        break
+    # Coût prévu de la taille suivante, à la pente observée (au moins linéaire), plus la calibration
+    slope = 1.0
+    if previous is not None and previous[1] > 0 and per_call > 0:
+        slope = max(1.0, math.log(per_call / previous[1]) / math.log(n / previous[0]))
+    expected = per_call * (next_n / n) ** slope * 2
+    if time.perf_counter() - started + expected > config["time_budget_s"]:
+        emit({"stop": "time_budget", "next_size": next_n, "expected_s": expected})
+        break
+    previous = (n, per_call)
+    n = next_n
+'''
+
+
+def _fit_loglog(sizes: list, values: list) -> dict:
+    """Pente log-log (moindres carrés) et meilleure classe de croissance au sens des résidus logarithmiques"""
+    import numpy as np
+
+    logn = np.log(np.asarray(sizes, dtype=float))
+    logv = np.log(np.asarray(values, dtype=float))
+    slope, intercept = np.polyfit(logn, logv, 1)
+    predicted = slope * logn + intercept
+    total = float(((logv - logv.mean()) ** 2).sum())
+    r2 = 1 - float(((logv - predicted) ** 2).sum()) / total if total > 0 else 1.0
+
+    fits = {}
+    for name, log_g in GROWTH_CLASSES.items():
+        if name == "O(2^n)" and max(sizes) > 2048:
+            continue
+        g = np.array([log_g(n) for n in sizes])
+        log_a = float((logv - g).mean())
+        fits[name] = (float(((logv - g - log_a) ** 2).mean()), log_a)
+    best = min(fits, key=lambda name: fits[name][0])
+    return {
+        "slope": round(float(slope), 3),
+        "r2": round(r2, 4),
+        "growth_class": best,
+        "residuals": {name: round(err, 5) for name, (err, _) in fits.items()},
+        "_log_a": fits[best][1],
+    }
+
+
+def _extrapolate(log_a: float, growth_class: str, target: int) -> Optional[float]:
+    try:
+        return math.exp(log_a + GROWTH_CLASSES[growth_class](target))
+    except OverflowError:
+        return None
+
+
+async def analyze_scaling(code: str, function_name: str, input_generator: Optional[str] = None,
+                          filename: str = "analysis.py", start_size: int = 8, growth_factor: float = 2.0,
+                          max_size: int = 10 ** 7, time_budget_s: Optional[float] = None,
+                          target_size: int = 10 ** 6) -> dict:
+    """Mesure function_name(entrée de taille n) pour n géométrique et en déduit la classe de croissance"""
+    if growth_factor <= 1:
+        raise ValueError("growth_factor doit être > 1")
+    time_budget_s = time_budget_s or SCALING_TIME_BUDGET_S
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        file_path = temp_path / Path(filename).name
+        file_path.write_text(code)
+        result_path = temp_path / "scaling.jsonl"
+        config_path = temp_path / "scaling.json"
+        config_path.write_text(json.dumps({
+            "file_path": str(file_path),
+            "result_path": str(result_path),
+            "function": function_name,
+            "generator": input_generator,
+            "start_size": max(1, start_size),
+            "growth_factor": growth_factor,
+            "max_size": max_size,
+            "time_budget_s": time_budget_s,
+            "min_measure_s": SCALING_MIN_MEASURE_S,
+            "max_repeats": SCALING_MAX_REPEATS,
+        }))
+        runner_path = temp_path / "scaling_runner.py"
+        runner_path.write_text(SCALING_RUNNER)
+
+        await report_stage("measuring", f"{function_name}(n) de n={start_size} à {max_size} (budget {time_budget_s:.0f}s)")
+        # Marge au-delà du budget : la dernière taille lancée peut le dépasser, le sandbox coupe alors
+        limits = sandbox_limits(wall_seconds=int(time_budget_s * 2 + 10), cpu_seconds=int(time_budget_s * 2 + 10))
+        with track_stage("carbon_runner"):
+            run = await run_sandboxed_async(["python", str(runner_path), str(config_path)], str(temp_path), limits)
+        records = [json.loads(line) for line in result_path.read_text().splitlines()] if result_path.exists() else []
+
+    points, inputs, stop, errors = [], None, None, []
+    for record in records:
+        if "inputs" in record:
+            inputs = record["inputs"]
+        elif "stop" in record:
+            stop = record
+        elif "error" in record:
+            errors.append(record)
+        elif "measure" in record:
+            measure, repeats = record["measure"], record["repeats"]
+            energy = direct_energy(measure)
+            points.append({
+                "n": record["n"],
+                "repeats": repeats,
+                "time_s": measure["duration_s"] / repeats,
+                "cpu_time_s": measure["cpu_time_s"] / repeats,
+                "energy_kwh": energy["energy_kwh"] / repeats,
+                "energy_backend": energy["backend"],
+            })
+    if stop is None and run["resource_usage"]["termination"]:
+        stop = {"stop": run["resource_usage"]["termination"]}
+
+    result = {
+        "function": function_name,
+        "inputs": inputs,
+        "points": points,
+        "stopped_by": (stop or {}).get("stop"),
+        "errors": errors,
+        "static_complexity": analyze_code_complexity(code),
+        "resource_usage": run["resource_usage"],
+    }
+    usable = [p for p in points if p["time_s"] > 0 and p["energy_kwh"] > 0]
+    if len(usable) < 3:
+        result["growth_class"] = None
+        result["message"] = errors[0]["error"] if errors else "Moins de trois tailles mesurées : augmenter le budget ou réduire start_size"
+        return result
+
+    await report_stage("fitting", f"Ajustement log-log sur {len(usable)} tailles")
+    sizes = [p["n"] for p in usable]
+    time_fit = _fit_loglog(sizes, [p["time_s"] for p in usable])
+    energy_fit = _fit_loglog(sizes, [p["energy_kwh"] for p in usable])
+    growth_class = time_fit["growth_class"]
+    # L'énergie est extrapolée avec la classe retenue pour le temps (mesure la plus fine), son coefficient propre
+    energy_log_a = sum(math.log(p["energy_kwh"]) - GROWTH_CLASSES[growth_class](p["n"]) for p in usable) / len(usable)
+    result.update({
+        "growth_class": time_fit["growth_class"],
+        "time_fit": {k: v for k, v in time_fit.items() if not k.startswith("_")},
+        "energy_fit": {k: v for k, v in energy_fit.items() if not k.startswith("_")},
+        "target_size": target_size,
+        "extrapolated": {
+            "time_s": _extrapolate(time_fit["_log_a"], growth_class, target_size),
+            "energy_kwh": _extrapolate(energy_log_a, growth_class, target_size),
+        },
+        "summary": (
+            f"{function_name} : croissance {time_fit['growth_class']} (pente log-log {time_fit['slope']}, "
+            f"R² {time_fit['r2']}) sur n = {sizes[0]}…{sizes[-1]}"
+        ),
+    })
+    return result
@@ -0,0 +1,195 @@
+"""
+Choix des fichiers d'un repository à mesurer : classement par valeur attendue puis dépense d'un budget
+Signaux : point d'entrée exécutable, complexité statique, fan-in des imports internes, taille, énergie prédite.
+Les fichiers sont pris du haut du classement tant que leur coût estimé tient dans le budget temps / énergie ;
+chaque fichier reçoit la raison de sa sélection ou de son exclusion.
+"""
+import ast
+import math
+import os
+from typing import Dict, List, Optional
+
+from services.cancellation import remaining
+from services.carbon.sandbox import SANDBOX_WALL_SECONDS
+
+SCHEDULE_TIME_BUDGET_S = float(os.getenv("SCHEDULE_TIME_BUDGET_S", "120"))
+# 0 : pas de plafond d'énergie
+SCHEDULE_ENERGY_BUDGET_KWH = float(os.getenv("SCHEDULE_ENERGY_BUDGET_KWH", "0"))
+# Démarrage d'un runner (interpréteur + instrumentation), ajouté au temps d'exécution prédit
+RUNNER_OVERHEAD_S = {
+    "direct": float(os.getenv("SCHEDULE_DIRECT_OVERHEAD_S", "0.2")),
+    "codecarbon": float(os.getenv("SCHEDULE_CODECARBON_OVERHEAD_S", "6")),
+}
+# Puissance CPU d'un cœur (W), pour convertir l'énergie prédite en durée
+SCHEDULE_CORE_POWER_W = float(os.getenv("SCHEDULE_CORE_POWER_W", str(float(os.getenv("DIRECT_CPU_TDP_W", "85")) / (os.cpu_count() or 1))))
+
+SCORE_WEIGHTS = {
+    "entry_point": 3.0,
+    "complexity": 2.0,
+    "predicted_energy": 1.5,
+    "fan_in": 1.5,
+    "size": 1.0,
+}
+
+
+def module_names(path: str) -> List[str]:
+    """Noms importables d'un fichier : chemin pointé et ses suffixes (dispositions src/, sous-dossiers)"""
+    parts = path[:-3].replace(os.sep, "/").split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+
+def _imported_modules(tree: ast.AST, path: str) -> set:
+    """Modules importés, imports relatifs résolus par rapport au paquet du fichier"""
+    package = path[:-3].replace(os.sep, "/").split("/")[:-1]
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1] if node.level <= len(package) + 1 else []
+                prefix = ".".join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ""
+            if prefix:
+                names.add(prefix)
+            # from paquet import module
+            names.update(f"{prefix}.{alias.name}" if prefix else alias.name for alias in node.names)
+    return names
+
+
+def _entry_point(tree: ast.AST) -> Optional[str]:
+    """Ce que l'exécution du fichier fait réellement, au-delà des définitions"""
+    for node in tree.body:
+        if isinstance(node, ast.If) and "__main__" in ast.unparse(node.test):
+            return "main_guard"
+    for node in tree.body:
+        if isinstance(node, (ast.Expr, ast.Assign, ast.AugAssign, ast.AnnAssign)) and any(
+            isinstance(child, ast.Call) for child in ast.walk(node)
+        ):
+            return "module_code"
+        if isinstance(node, (ast.For, ast.While, ast.With, ast.AsyncWith, ast.AsyncFor, ast.Try)):
+            return "module_code"
+    return None
+
+
+def _normalized(values: List[float]) -> List[float]:
+    top = max(values, default=0)
+    return [value / top if top > 0 else 0.0 for value in values]
+
+
+def rank_files(paths: List[str], codes: List[str], predictions: List[dict]) -> List[dict]:
+    """Fichiers classés par valeur attendue de mesure décroissante, avec leurs signaux"""
+    trees, entries = [], []
+    for path, code in zip(paths, codes):
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError):
+            tree = None
+        trees.append(tree)
+        entries.append(_entry_point(tree) if tree is not None else None)
+
+    owners: Dict[str, int] = {}
+    for i, path in enumerate(paths):
+        for name in module_names(path):
+            owners.setdefault(name, i)
+    importers: List[set] = [set() for _ in paths]
+    for i, tree in enumerate(trees):
+        if tree is None:
+            continue
+        for name in _imported_modules(tree, paths[i]):
+            owner = owners.get(name)
+            if owner is not None and owner != i:
+                importers[owner].add(i)
+
+    complexity = [p.get("features", {}).get("complexity_score", 0) for p in predictions]
+    energy = [p.get("predicted_energy_kwh", 0.0) for p in predictions]
+    signals = {
+        "entry_point": [1.0 if entry else 0.0 for entry in entries],
+        "complexity": _normalized([math.log1p(c) for c in complexity]),
+        # Échelle logarithmique : les prédictions s'étalent sur plusieurs ordres de grandeur
+        "predicted_energy": _normalized([max(0.0, math.log10(e) + 12) if e > 0 else 0.0 for e in energy]),
+        "fan_in": _normalized([math.log1p(len(i)) for i in importers]),
+        "size": _normalized([math.log1p(code.count("\n") + 1) for code in codes]),
+    }
+    ranked = []
+    for i, path in enumerate(paths):
+        value = sum(SCORE_WEIGHTS[name] * signals[name][i] for name in SCORE_WEIGHTS)
+        ranked.append({
+            "index": i,
+            "path": path,
+            "value": round(value, 3),
+            "signals": {
+                "entry_point": entries[i],
+                "complexity_score": complexity[i],
+                "fan_in": len(importers[i]),
+                "lines": codes[i].count("\n") + 1,
+                "predicted_energy_kwh": energy[i] or None,
+            },
+            "parse_error": trees[i] is None,
+        })
+    ranked.sort(key=lambda f: f["value"], reverse=True)
+    for rank, entry in enumerate(ranked, 1):
+        entry["rank"] = rank
+    return ranked
+
+
+def estimate_cost(entry: dict, backend: str) -> dict:
+    """Durée et énergie attendues d'une mesure : démarrage du runner + exécution prédite, bornées par le sandbox"""
+    energy = entry["signals"]["predicted_energy_kwh"] or 0.0
+    run_s = energy * 3.6e6 / SCHEDULE_CORE_POWER_W if SCHEDULE_CORE_POWER_W > 0 else 0.0
+    return {
+        "duration_s": round(min(RUNNER_OVERHEAD_S.get(backend, 1.0) + run_s, SANDBOX_WALL_SECONDS), 3),
+        "energy_kwh": energy,
+    }
+
+
+def plan_measurements(ranked: List[dict], backend: str, max_files: int, time_budget_s: Optional[float] = None,
+                      energy_budget_kwh: Optional[float] = None) -> dict:
+    """Parcourt le classement du haut vers le bas et retient les fichiers dont le coût estimé tient dans le budget"""
+    # L'échéance de l'outil en cours plafonne le budget : rien n'est planifié au-delà
+    time_budget_s = remaining(SCHEDULE_TIME_BUDGET_S if time_budget_s is None else time_budget_s)
+    energy_budget_kwh = SCHEDULE_ENERGY_BUDGET_KWH if energy_budget_kwh is None else energy_budget_kwh
+    time_left, energy_left = time_budget_s, energy_budget_kwh or math.inf
+    selected = []
+    for entry in ranked:
+        cost = estimate_cost(entry, backend)
+        entry["estimated_cost"] = cost
+        if entry["parse_error"]:
+            decision = ("skipped", "Fichier non analysable (erreur de syntaxe)")
+        elif entry["signals"]["entry_point"] is None:
+            decision = ("skipped", "Que des définitions : l'exécuter ne mesurerait que l'import du module")
+        elif len(selected) >= max_files:
+            decision = ("skipped", f"Nombre maximal de fichiers mesurés atteint ({max_files})")
+        elif cost["duration_s"] > time_left:
+            decision = ("skipped", f"Durée estimée {cost['duration_s']:.1f}s > budget restant {time_left:.1f}s")
+        elif cost["energy_kwh"] > energy_left:
+            decision = ("skipped", f"Énergie estimée {cost['energy_kwh']:.2e} kWh > budget restant {energy_left:.2e} kWh")
+        else:
+            time_left -= cost["duration_s"]
+            energy_left -= cost["energy_kwh"]
+            selected.append(entry)
+            decision = ("planned", _why_selected(entry))
+        entry["decision"], entry["reason"] = decision
+    return {
+        "budget": {"time_s": round(time_budget_s, 1), "energy_kwh": energy_budget_kwh or None, "max_files": max_files},
+        "estimated": {
+            "duration_s": round(sum(e["estimated_cost"]["duration_s"] for e in selected), 3),
+            "energy_kwh": sum(e["estimated_cost"]["energy_kwh"] for e in selected),
+        },
+        "selected": selected,
+        "files": ranked,
+    }
+
+
+def _why_selected(entry: dict) -> str:
+    signals = entry["signals"]
+    parts = [f"rang {entry['rank']} (valeur {entry['value']})"]
+    parts.append("bloc __main__" if signals["entry_point"] == "main_guard" else "code exécuté à l'import")
+    if signals["complexity_score"]:
+        parts.append(f"complexité {signals['complexity_score']:g}")
+    if signals["fan_in"]:
+        parts.append(f"importé par {signals['fan_in']} fichier(s)")
+    return ", ".join(parts)
@@ -1,13 +1,31 @@
 import os
+import asyncio
+import random
 import time
-import requests
+from typing import Dict, List, Optional
+
+import httpx
 from dotenv import load_dotenv
-import os
+
+from services.progress import report_stage
+from services.codeclimate import cache
 
 load_dotenv()
 
 qlty_api_url = os.getenv("QLTY_API_URL", "")
-qlty_api_token = os.getenv("QLTY_TOKEN", "") 
+qlty_api_token = os.getenv("QLTY_TOKEN", "")
+
+QLTY_MAX_CONNECTIONS = int(os.getenv("QLTY_MAX_CONNECTIONS", "10"))
+QLTY_CONCURRENCY = int(os.getenv("QLTY_CONCURRENCY", "8"))
+QLTY_PAGE_SIZE = int(os.getenv("QLTY_PAGE_SIZE", "100"))
+QLTY_TIMEOUT = float(os.getenv("QLTY_TIMEOUT", "30"))
+QLTY_MAX_RETRIES = int(os.getenv("QLTY_MAX_RETRIES", "3"))
+# Statuts transitoires repris avec backoff exponentiel (1 s, 2 s, 4 s…) ou selon Retry-After
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop = None
+
 
 def get_header(qlty_api_token):
     headers = {
@@ -16,45 +34,143 @@ def get_header(qlty_api_token):
     }
     return headers
 
-def get_project_metrics(qlty_api_token, owner, project):
-    url = f"{qlty_api_url}/gh/{owner}/projects/{project}/metrics"
-    r = requests.get(url, headers=get_header(qlty_api_token))
-    r.raise_for_status()
-    return r.json()
 
-def list_project_issues(qlty_api_token, owner, project):
-    url = f"{qlty_api_url}/gh/{owner}/projects/{project}/issues"
-    r = requests.get(url, headers=get_header(qlty_api_token))
-    r.raise_for_status()
-    return r.json()
+def get_client() -> httpx.AsyncClient:
+    """Client HTTP partagé (pool keep-alive), recréé si la boucle asyncio a changé"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=QLTY_MAX_CONNECTIONS, max_keepalive_connections=QLTY_MAX_CONNECTIONS),
+            timeout=QLTY_TIMEOUT,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def _get(url: str, qlty_api_token, params: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+    """GET avec reprise sur 429/5xx (Retry-After respecté) ; un 304 est renvoyé tel quel"""
+    client = get_client()
+    for attempt in range(QLTY_MAX_RETRIES + 1):
+        r = await client.get(url, headers={**get_header(qlty_api_token), **(headers or {})}, params=params)
+        if r.status_code == 304:
+            return r
+        if r.status_code not in RETRY_STATUSES or attempt == QLTY_MAX_RETRIES:
+            r.raise_for_status()
+            return r
+        retry_after = r.headers.get("Retry-After", "")
+        await asyncio.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+
+
+async def _collect_pages(r: httpx.Response, qlty_api_token) -> dict:
+    """Suit links.next depuis la première page jusqu'à la dernière et concatène les `data`"""
+    body = r.json()
+    data = list(body.get("data", []))
+    pages = 1
+    next_link = (body.get("links") or {}).get("next")
+    while next_link:
+        r = await _get(str(r.url.join(next_link)), qlty_api_token)
+        page = r.json()
+        data.extend(page.get("data", []))
+        pages += 1
+        next_link = (page.get("links") or {}).get("next")
+    body["data"] = data
+    body.pop("links", None)
+    body["pages"] = pages
+    return body
+
+
+async def _get_cached_collection(resource: str, qlty_api_token, owner, project) -> dict:
+    """Collection paginée servie depuis le cache, revalidée par une seule requête conditionnelle sur la 1re page
+
+    Une nouvelle analyse modifie la première page (et son ETag) : un 304 sur celle-ci vaut pour toute la collection.
+    L'API ne sert que le dernier état du projet : pas de clé par commit, toute entrée finit revalidée.
+    """
+    key = cache.cache_key(resource, owner, project)
+    entry = cache.get(key)
+    if entry is not None and cache.is_fresh(entry):
+        cache.record(resource, "hit")
+        return entry["body"]
 
-def get_file_metrics(filepath: str, qlty_api_token, owner, project):
+    url = f"{qlty_api_url}/gh/{owner}/projects/{project}/{resource}"
+    r = await _get(url, qlty_api_token, {"page[size]": QLTY_PAGE_SIZE}, headers=cache.validators(entry))
+    if r.status_code == 304 and entry is not None:
+        cache.touch(key, entry)
+        cache.record(resource, "revalidated")
+        return entry["body"]
+
+    body = await _collect_pages(r, qlty_api_token)
+    cache.put(key, body, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+    cache.record(resource, "miss")
+    return body
+
+
+async def get_project_metrics(qlty_api_token, owner, project):
+    return await _get_cached_collection("metrics", qlty_api_token, owner, project)
+
+
+async def list_project_issues(qlty_api_token, owner, project):
+    return await _get_cached_collection("issues", qlty_api_token, owner, project)
+
+
+async def get_project_data(qlty_api_token, owner, project) -> Dict[str, dict]:
+    """Metrics et issues en parallèle ; une erreur sur les issues n'annule pas les metrics"""
+    metrics, issues = await asyncio.gather(
+        get_project_metrics(qlty_api_token, owner, project),
+        list_project_issues(qlty_api_token, owner, project),
+        return_exceptions=True,
+    )
+    if isinstance(metrics, BaseException):
+        raise metrics
+    return {"metrics": metrics, "issues": issues}
+
+
+async def get_file_metrics(filepath: str, qlty_api_token, owner, project):
     url = f"{qlty_api_url}/gh/{owner}/projects/{project}/files"
-    r = requests.get(url, headers=get_header(qlty_api_token), params={"path": filepath})
-    r.raise_for_status()
+    r = await _get(url, qlty_api_token, {"path": filepath})
     return r.json()
 
-def get_analysis_status(analysis_id: str, qlty_api_token, owner, project):
+
+async def get_files_metrics(filepaths: List[str], qlty_api_token, owner, project,
+                            concurrency: int = QLTY_CONCURRENCY) -> Dict[str, dict]:
+    """get_file_metrics sur de nombreux chemins, au plus `concurrency` requêtes simultanées"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(path):
+        async with semaphore:
+            try:
+                return path, await get_file_metrics(path, qlty_api_token, owner, project)
+            except httpx.HTTPError as e:
+                return path, {"error": str(e)}
+
+    return dict(await asyncio.gather(*(fetch(path) for path in filepaths)))
+
+
+async def get_analysis_status(analysis_id: str, qlty_api_token, owner, project):
     """
     Récupère le statut d'une analyse déclenchée.
     """
     url = f"{qlty_api_url}/gh/{owner}/projects/{project}/analyses/{analysis_id}"
-    r = requests.get(url, headers=get_header(qlty_api_token))
-    r.raise_for_status()
+    r = await _get(url, qlty_api_token)
     return r.json()
 
-def wait_for_analysis_completion(analysis_id: str, timeout: int = 180):
+
+async def wait_for_analysis_completion(analysis_id: str, qlty_api_token, owner, project, timeout: int = 180,
+                                       initial_delay: float = 1.0, max_delay: float = 15.0):
     """
-    Attend la fin d'une analyse avec polling.
+    Attend la fin d'une analyse avec polling non bloquant et backoff exponentiel.
     """
-    start = time.time()
-    while time.time() - start < timeout:
-        status = get_analysis_status(analysis_id)
+    start = time.monotonic()
+    delay = initial_delay
+    while time.monotonic() - start < timeout:
+        status = await get_analysis_status(analysis_id, qlty_api_token, owner, project)
         state = status.get("state", status.get("status", "unknown"))
-        print(f"⏳ Analyse {analysis_id}: {state}")
+        await report_stage("qlty", f"Analyse {analysis_id}: {state}")
         if state in ["completed", "finished", "success"]:
             return status
         elif state in ["failed", "error", "cancelled"]:
             raise RuntimeError(f"Analyse échouée: {state}")
-        time.sleep(5)
+        remaining = timeout - (time.monotonic() - start)
+        await asyncio.sleep(max(0.0, min(delay * random.uniform(0.8, 1.2), remaining)))
+        delay = min(max_delay, delay * 2)
     raise TimeoutError("Analyse non terminée dans le délai imparti")
@@ -0,0 +1,108 @@
+"""
+Cache persistant des réponses qlty, revalidé par ETag / Last-Modified une fois le TTL écoulé
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from services.metrics import Counter, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QLTY_CACHE_DIR = Path(os.path.expanduser(os.getenv("QLTY_CACHE_DIR", "~/.cache/ecocode/qlty")))
+# Durée pendant laquelle une entrée est servie sans aucune requête ; au-delà, requête conditionnelle
+QLTY_CACHE_TTL = int(os.getenv("QLTY_CACHE_TTL", "300"))
+
+QLTY_CACHE_TOTAL = Counter(
+    "ecocode_qlty_cache_total",
+    "Accès au cache qlty (hit : servi localement, revalidated : 304, miss : téléchargement complet)",
+    ("resource", "outcome"),
+)
+REGISTRY.append(QLTY_CACHE_TOTAL)
+
+_memory = {}
+_lock = threading.Lock()
+_stats = {"hit": 0, "revalidated": 0, "miss": 0}
+
+
+def cache_key(resource: str, owner: str, project: str) -> str:
+    return f"{owner}/{project}:{resource}"
+
+
+def _path(key: str) -> Path:
+    return QLTY_CACHE_DIR / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+
+def get(key: str) -> Optional[dict]:
+    """Entrée {body, etag, last_modified, stored_at} ou None"""
+    with _lock:
+        entry = _memory.get(key)
+    if entry is not None:
+        return entry
+    try:
+        entry = json.loads(_path(key).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        _memory[key] = entry
+    return entry
+
+
+def put(key: str, body: dict, etag: Optional[str] = None, last_modified: Optional[str] = None) -> dict:
+    entry = {"body": body, "etag": etag, "last_modified": last_modified, "stored_at": time.time()}
+    with _lock:
+        _memory[key] = entry
+    try:
+        QLTY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Cache qlty non persisté : %s", e)
+    return entry
+
+
+def touch(key: str, entry: dict):
+    """Réponse 304 : l'entrée reste valable pour un nouveau TTL"""
+    put(key, entry["body"], entry.get("etag"), entry.get("last_modified"))
+
+
+def is_fresh(entry: dict, ttl: int = None) -> bool:
+    ttl = QLTY_CACHE_TTL if ttl is None else ttl
+    return time.time() - entry["stored_at"] < ttl
+
+
+def validators(entry: Optional[dict]) -> dict:
+    """En-têtes de requête conditionnelle pour une entrée expirée"""
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def record(resource: str, outcome: str):
+    QLTY_CACHE_TOTAL.inc(resource, outcome)
+    with _lock:
+        _stats[outcome] += 1
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    total = sum(stats.values())
+    stats["requests"] = total
+    stats["hit_rate"] = round((stats["hit"] + stats["revalidated"]) / total, 4) if total else 0.0
+    return stats
+
+
+def clear():
+    with _lock:
+        _memory.clear()
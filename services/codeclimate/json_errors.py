@@ -1,4 +1,6 @@
-from services.codeclimate.api.client import get_project_metrics, list_project_issues
+from services.codeclimate.api.client import get_project_data
+from services.codeclimate.cache import cache_stats
+import asyncio
 import json
 from dotenv import load_dotenv
 import os
@@ -7,25 +9,23 @@ load_dotenv()
 
 qlty_api_url = os.getenv("QLTY_API_URL", "")
 qlty_api_token = os.getenv("QLTY_TOKEN", "") 
+# Export JSON optionnel ; les données vivent dans le cache qlty (QLTY_CACHE_DIR)
+qlty_export_file = os.getenv("QLTY_EXPORT_FILE", "")
 
 
-def main(owner, project):
-    # try:
-    if True:
-        metrics = get_project_metrics(qlty_api_token, owner, project)
-        print(f"✅ Metrics globales récupérées : {len(metrics.get('data', []))} items")
-    # except Exception as e:
-    #     print("❌ Erreur lors de la récupération des metrics :", e)
-    #     metrics = {}
+async def main(owner, project):
+    # Metrics et issues récupérées en parallèle, toutes pages comprises, via le cache conditionnel
+    project_data = await get_project_data(qlty_api_token, owner, project)
+    metrics = project_data["metrics"]
+    print(f"✅ Metrics globales récupérées : {len(metrics.get('data', []))} items")
 
-    # Récupération des issues
-    try:
-        issues = list_project_issues(qlty_api_token, owner, project)
+    issues = project_data["issues"]
+    if isinstance(issues, BaseException):
+        print("❌ Erreur lors de la récupération des issues :", issues)
+        issues = {}
+    else:
         issue_count = len(issues.get("data", [])) if issues else 0
         print(f"✅ Issues récupérées : {issue_count}")
-    except Exception as e:
-        print("❌ Erreur lors de la récupération des issues :", e)
-        issues = {}
 
     # Génération du JSON
     project_data = {
@@ -33,11 +33,13 @@ def main(owner, project):
         "issues": issues
     }
 
-    filename = "qlty_project_data.json"
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(project_data, f, indent=2)
-    print(f"✅ JSON projet généré : {filename}")
+    if qlty_export_file:
+        with open(qlty_export_file, "w", encoding="utf-8") as f:
+            json.dump(project_data, f, separators=(",", ":"))
+        print(f"✅ JSON projet généré : {qlty_export_file}")
+    project_data["cache"] = cache_stats()
     return project_data
 
 if __name__ == "__main__":
-    main()
+    import sys
+    asyncio.run(main(sys.argv[1], sys.argv[2]))
@@ -1,12 +1,19 @@
 import os
 import requests
 import json
-import shutil
 from dotenv import load_dotenv
+from services.progress import report_stage_threadsafe
+from services.metrics import track_stage
+from services.ingestion import scan_repository, ingestion_summary
+from services.workspaces import WorkspaceError, checkout
+from services.cancellation import remaining
 
 load_dotenv()
 
 mistral_api_key = os.getenv("MISTRAL_API_KEY")
+mistral_api_url = os.getenv("MISTRAL_API_URL", "https://api.mistral.ai/v1/chat/completions")
+MISTRAL_TIMEOUT = int(os.getenv("MISTRAL_TIMEOUT", "120"))
+_session = requests.Session()
 # oui
 
 
@@ -85,34 +92,50 @@ The prompt is :
 {prompt}
 """
 
-def clone_repo(repo):
+def normalize_repo(repo):
+    """URL https://github.com/owner/project canonique à partir d'une URL partielle"""
+    repo = repo.strip()
     prefix = "https://github.com/"
     if prefix not in repo:
-        repo = prefix + repo.replace("github.com/", "")
-    if repo[-1] == "/":
-        repo = repo[:-1]
-    try:
-        shutil.rmtree(repo.split("/")[-1])
-    except:
-        pass
-    os.system(f"git clone {repo}")
-    return repo.split("/")[-1]
-
-def retrieve_python_files(repo):
-    return_str = ""
-    for root, subdirs, files in os.walk(repo):
-        if ".git" not in root:
-            for file in files:
-                if file[-3:]==".py":
-                    path_file = os.path.join(root, file)
-                    return_str += f"###### BEGIN OF {path_file}\n"
-                    with open(os.path.join(root, file)) as file:
-                        return_str += file.read()
-                    return_str += f"\n###### END OF {path_file}\n"
-    return return_str
+        repo = prefix + repo.replace("http://", "").replace("github.com/", "")
+    repo = repo.rstrip("/")
+    if repo.endswith(".git"):
+        repo = repo[:-4]
+    return repo
+
+def repo_name(repo):
+    return normalize_repo(repo).split("/")[-1]
+
+def collect_python_files(repo, label=None):
+    """Concatène les fichiers Python retenus par la couche d'ingestion ; renvoie aussi le décompte des exclusions
+
+    label remplace le chemin de la copie de travail dans les en-têtes vus par le LLM (nom court du repo)
+    """
+    parts = []
+    with track_stage("file_read"):
+        scan = scan_repository(repo)
+        for rel, content in zip(scan["paths"], scan["contents"]):
+            path_file = os.path.join(label or repo, rel)
+            parts.append(f"###### BEGIN OF {path_file}\n")
+            parts.append(content)
+            parts.append(f"\n###### END OF {path_file}\n")
+    return "".join(parts), ingestion_summary(scan)
+
+def retrieve_python_files(repo, label=None):
+    return collect_python_files(repo, label)[0]
+
+def read_reported_file(workspace_path, name, path):
+    """Contenu du fichier désigné par le LLM (name/chemin), confiné à la copie de travail"""
+    rel = path[len(name) + 1:] if path.startswith(f"{name}/") else path
+    root = os.path.realpath(workspace_path)
+    target = os.path.realpath(os.path.join(root, rel))
+    if not target.startswith(root + os.sep) or not os.path.isfile(target):
+        return None
+    with open(target, encoding="utf-8", errors="replace") as file:
+        return file.read()
 
 def curl_response(prompt):
-    url= "https://api.mistral.ai/v1/chat/completions"
+    url = mistral_api_url
     headers = {
         "Content-Type": "application/json", 
         "Authorization": f"Bearer {mistral_api_key}"
@@ -122,7 +145,8 @@ def curl_response(prompt):
         "messages": [{ "role": "user",  "content": f"{prompt}"}]
     })
 
-    r = requests.post(url, data=payload, headers=headers)
+    with track_stage("mistral"):
+        r = _session.post(url, data=payload, headers=headers, timeout=remaining(MISTRAL_TIMEOUT))
 
     return r
 
@@ -130,32 +154,35 @@ def all_together(prompt):
     return_info = {"repo_name": False, "suceed": False, "notes": None}
 
     prompt = github_prompt(prompt)
+    report_stage_threadsafe("llm", "Recherche du repository dans le prompt")
     r = curl_response(prompt)
     repo = r.json()["choices"][0]["message"]["content"]
     if r.status_code == 200 and repo != "None": 
         return_info["repo_name"] = True
-        name = clone_repo(repo)
-        if os.path.exists(name):
-            all_codes = retrieve_python_files(name)
-            prompt = analyse_prompt(all_codes)
-            r = curl_response(prompt)
-            if r.status_code == 200:
-                analysis = r.json()["choices"][0]["message"]["content"]
-                with open("response", "w+") as file:
-                    file.write(analysis)
-                return_info["suceed"] = True
-                return_info["notes"] = analysis
-                path = analysis.split(":")[-1].replace(" ", "").replace("\n", "").replace("*", "").replace("`", "")
-                return_info["file"] = {
-                    "path": path,
-                    "content": open(path).read()
-                }
-
-            else:
-                return_info["notes"] = f"{r.status_code} error when analyzing the codes"
-        else:
-            return_info["notes"] = "The repo seems to exists but couldn't be downloaded"
-        shutil.rmtree(name)
+        report_stage_threadsafe("cloning", repo)
+        name = repo_name(repo)
+        try:
+            with checkout(normalize_repo(repo)) as workspace:
+                return_info["commit"] = workspace["commit"]
+                report_stage_threadsafe("reading", f"Lecture des fichiers Python de {name}@{workspace['commit'][:12]}")
+                all_codes, return_info["ingestion"] = collect_python_files(workspace["path"], label=name)
+                prompt = analyse_prompt(all_codes)
+                report_stage_threadsafe("llm", f"Analyse de {len(all_codes)} caractères de code")
+                r = curl_response(prompt)
+                if r.status_code == 200:
+                    analysis = r.json()["choices"][0]["message"]["content"]
+                    return_info["suceed"] = True
+                    return_info["notes"] = analysis
+                    path = analysis.split(":")[-1].replace(" ", "").replace("\n", "").replace("*", "").replace("`", "")
+                    return_info["file"] = {
+                        "path": path,
+                        "content": read_reported_file(workspace["path"], name, path)
+                    }
+
+                else:
+                    return_info["notes"] = f"{r.status_code} error when analyzing the codes"
+        except WorkspaceError as e:
+            return_info["notes"] = f"The repo seems to exists but couldn't be downloaded ({e})"
 
     elif repo == "None":
         return_info["notes"] = "No repo found in prompt"
@@ -175,21 +202,20 @@ if __name__ == "__main__":
     repo = r.json()["choices"][0]["message"]["content"]
     print(repo)
     if r.status_code == 200 and repo != "None": 
-        name = clone_repo(repo)
-        if os.path.exists(name):
-            all_codes = retrieve_python_files(name)
-            with open("prompt") as file:
-                end_prompt = file.read()
-            prompt = f"""Here are the codes of a repositery : 
+        try:
+            with checkout(normalize_repo(repo)) as workspace:
+                all_codes = retrieve_python_files(workspace["path"], label=repo_name(repo))
+                with open("prompt") as file:
+                    end_prompt = file.read()
+                prompt = f"""Here are the codes of a repositery : 
     {all_codes}
 
     Now do this task :
     {end_prompt}
     """
-            r = curl_response(prompt)
-            if r.status_code == 200:
-                with open("response", "w+") as file:
-                    file.write(r.json()["choices"][0]["message"]["content"])
-        else:
+                r = curl_response(prompt)
+                if r.status_code == 200:
+                    with open("response", "w+") as file:
+                        file.write(r.json()["choices"][0]["message"]["content"])
+        except WorkspaceError:
             print("Your repo is not public")
-
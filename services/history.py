@@ -0,0 +1,354 @@
+"""
+Historique des analyses (SQLite) : chaque résultat carbone, complexité, SonarQube et score est conservé
+Écritures groupées par un thread dédié (les outils ne bloquent jamais) ; les tendances sont lues dans des
+agrégats horaires tenus à jour dans la même transaction que les lignes brutes.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from services.metrics import Counter, Gauge, REGISTRY
+from services.singleflight import normalize_code
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB = Path(os.path.expanduser(os.getenv("HISTORY_DB", "~/.cache/ecocode/history.db")))
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") == "1"
+HISTORY_QUEUE_SIZE = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+HISTORY_BATCH = int(os.getenv("HISTORY_BATCH", "2000"))
+
+HISTORY_ROWS = Counter("ecocode_history_rows_total", "Lignes d'historique écrites ou perdues (file pleine, erreur)", ("outcome",))
+HISTORY_PENDING = Gauge("ecocode_history_pending", "Lignes d'historique en attente d'écriture")
+REGISTRY.extend([HISTORY_ROWS, HISTORY_PENDING])
+
+# Métrique principale agrégée pour chaque nature de résultat
+KIND_METRICS = {
+    "carbon": "energy_kwh",
+    "prediction": "energy_kwh",
+    "complexity": "complexity_score",
+    "eco_score": "eco_score",
+    "sonar": "issues",
+}
+# Ligne d'agrégat comptant les analyses (appels de record_analysis), quel que soit le nombre de résultats
+RUN_KIND = "run"
+ROLLUP_SECONDS = 3600
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    repository TEXT,
+    path TEXT,
+    content_hash TEXT,
+    commit_sha TEXT,
+    energy_kwh REAL,
+    emissions_kg REAL,
+    duration_s REAL,
+    complexity_score REAL,
+    eco_score REAL,
+    grade TEXT,
+    issues INTEGER,
+    backend TEXT,
+    payload TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_hash ON analyses (content_hash, recorded_at);
+-- '' = tous les dépôts / tous les fichiers : une ligne brute alimente le fichier, le dépôt et le nom de fichier
+CREATE TABLE IF NOT EXISTS analysis_rollups (
+    repository TEXT NOT NULL,
+    path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    value_sum REAL NOT NULL,
+    emissions_sum REAL NOT NULL,
+    PRIMARY KEY (repository, path, kind, hour)
+) WITHOUT ROWID;
+"""
+COLUMNS = ("recorded_at", "kind", "repository", "path", "content_hash", "commit_sha", "energy_kwh", "emissions_kg",
+           "duration_s", "complexity_score", "eco_score", "grade", "issues", "backend", "payload")
+INSERT = f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+UPSERT_ROLLUP = """
+INSERT INTO analysis_rollups (repository, path, kind, hour, n, value_sum, emissions_sum) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (repository, path, kind, hour) DO UPDATE SET
+    n = n + excluded.n, value_sum = value_sum + excluded.value_sum, emissions_sum = emissions_sum + excluded.emissions_sum
+"""
+_INDEX = {column: i for i, column in enumerate(COLUMNS)}
+
+
+def connect(path: Path = None) -> sqlite3.Connection:
+    path = path or HISTORY_DB
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def content_hash(code: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(normalize_code(code).encode()).hexdigest() if code else None
+
+
+def _rollup_keys(row: tuple) -> set:
+    """(dépôt, fichier) alimentés par une ligne ; hors dépôt, le fichier est identifié par son contenu
+
+    Les extraits ad hoc portent souvent le nom par défaut (analysis.py) : regroupés par nom, des codes sans
+    rapport formeraient une seule tendance.
+    """
+    repository = row[_INDEX["repository"]] or ""
+    if not repository:
+        code_hash = row[_INDEX["content_hash"]]
+        return {("", f"sha256:{code_hash}")} if code_hash else set()
+    path = row[_INDEX["path"]] or ""
+    return {(repository, path), ("", path), (repository, "")}
+
+
+def rollup(rows: List[tuple]) -> List[tuple]:
+    """Pré-agrège un lot de lignes brutes par (dépôt, fichier, nature, heure) avant l'upsert"""
+    sums = collections.defaultdict(lambda: [0, 0.0, 0.0])
+    runs = collections.defaultdict(set)
+    for row in rows:
+        kind = row[_INDEX["kind"]]
+        hour = int(row[_INDEX["recorded_at"]] // ROLLUP_SECONDS) * ROLLUP_SECONDS
+        keys = _rollup_keys(row)
+        # Les lignes d'un même appel partagent recorded_at : une analyse compte une fois, pas une par résultat
+        run = (row[_INDEX["recorded_at"]], row[_INDEX["content_hash"]], row[_INDEX["path"]])
+        for key in keys:
+            runs[(*key, RUN_KIND, hour)].add(run)
+        value = row[_INDEX[KIND_METRICS[kind]]]
+        if value is None:
+            continue
+        for key in keys:
+            acc = sums[(*key, kind, hour)]
+            acc[0] += 1
+            acc[1] += value
+            acc[2] += row[_INDEX["emissions_kg"]] or 0.0
+    return [(*key, *acc) for key, acc in sums.items()] + [(*key, len(ids), 0.0, 0.0) for key, ids in runs.items()]
+
+
+class HistoryStore:
+    """File bornée + thread écrivain : une transaction par lot de lignes (group commit)"""
+
+    def __init__(self, path: Path = None, queue_size: int = HISTORY_QUEUE_SIZE, batch: int = HISTORY_BATCH):
+        self.path = path or HISTORY_DB
+        self.batch = batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            batches = [self._queue.get()]
+            rows = list(batches[0])
+            while len(rows) < self.batch:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                rows.extend(batches[-1])
+            try:
+                with conn:
+                    conn.executemany(INSERT, rows)
+                    conn.executemany(UPSERT_ROLLUP, rollup(rows))
+                HISTORY_ROWS.inc("written", amount=len(rows))
+            except sqlite3.Error as e:
+                logger.warning("Historique non enregistré (%d lignes) : %s", len(rows), e)
+                HISTORY_ROWS.inc("error", amount=len(rows))
+            finally:
+                HISTORY_PENDING.dec(amount=len(rows))
+                for _ in batches:
+                    self._queue.task_done()
+
+    def add(self, rows: List[tuple]):
+        """Met les lignes d'une analyse en file sans jamais bloquer l'appelant ; perdues si la file est pleine"""
+        if not HISTORY_ENABLED or not rows:
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(rows)
+            HISTORY_PENDING.inc(amount=len(rows))
+        except queue.Full:
+            HISTORY_ROWS.inc("dropped", amount=len(rows))
+
+    def flush(self):
+        """Attend l'écriture de toutes les lignes en file"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def reader(self) -> sqlite3.Connection:
+        """Connexion de lecture propre au thread (WAL : les lectures ne bloquent pas l'écrivain)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+
+store = HistoryStore()
+
+
+def _row(kind: str, recorded_at: float, path: Optional[str], code_hash: Optional[str], repository: Optional[str],
+         commit: Optional[str], payload: Optional[dict] = None, **values) -> tuple:
+    fields = {
+        "recorded_at": recorded_at, "kind": kind, "repository": repository, "path": path,
+        "content_hash": code_hash, "commit_sha": commit,
+        "payload": json.dumps(payload, default=str, separators=(",", ":")) if payload is not None else None,
+        **values,
+    }
+    return tuple(fields.get(column) for column in COLUMNS)
+
+
+def record_analysis(code: Optional[str], path: Optional[str], carbon: Optional[dict] = None,
+                    quality: Optional[dict] = None, eco_score: Optional[dict] = None,
+                    prediction: Optional[dict] = None, repository: Optional[str] = None,
+                    commit: Optional[str] = None, code_hash: Optional[str] = None):
+    """Enregistre les résultats disponibles d'une analyse (une ligne par nature de résultat)"""
+    if not HISTORY_ENABLED:
+        return
+    code_hash = code_hash or content_hash(code)
+    key = (time.time(), path, code_hash, repository, commit)
+    rows = []
+    impact = (carbon or {}).get("carbon_impact") or {}
+    # Estimation statique (mode predict) : enregistrée comme prédiction, pas comme mesure
+    prediction = prediction or (carbon or {}).get("prediction")
+    if impact and "error" not in carbon and impact.get("backend") != "prediction":
+        rows.append(_row("carbon", *key, energy_kwh=impact.get("energy_kwh"), emissions_kg=impact.get("emissions_kg"),
+                         duration_s=impact.get("duration_s"), backend=impact.get("backend")))
+    complexity = (carbon or {}).get("complexity_analysis") or {}
+    if complexity and "error" not in complexity:
+        rows.append(_row("complexity", *key, complexity_score=complexity.get("complexity_score"), payload=complexity))
+    if quality and "issues" in quality and "error" not in quality:
+        rows.append(_row("sonar", *key, issues=len(quality["issues"]),
+                         payload={"total_issues": quality.get("total_issues"), "eco_issues": quality.get("eco_issues")}))
+    if eco_score and "score" in eco_score:
+        rows.append(_row("eco_score", *key, eco_score=eco_score["score"], grade=eco_score.get("grade"),
+                         emissions_kg=eco_score.get("emissions_kg"), complexity_score=eco_score.get("complexity_score")))
+    if prediction and "predicted_energy_kwh" in prediction:
+        rows.append(_row("prediction", *key, energy_kwh=prediction["predicted_energy_kwh"],
+                         emissions_kg=prediction.get("predicted_emissions_kg"), grade=prediction.get("energy_class"),
+                         backend=prediction.get("model")))
+    store.add(rows)
+
+
+POINT_FIELDS = {
+    ("carbon", "value"): "energy_kwh",
+    ("carbon", "emissions"): "emissions_kg",
+    ("prediction", "value"): "predicted_energy_kwh",
+    ("complexity", "value"): "complexity_score",
+    ("eco_score", "value"): "eco_score",
+    ("sonar", "value"): "sonar_issues",
+}
+
+
+def _query_rollups(conn: sqlite3.Connection, width: int, since: float, repository: Optional[str],
+                   path: Optional[str]) -> List[tuple]:
+    return conn.execute(
+        f"""
+        SELECT hour / {width} * {width} AS period, kind, SUM(n), SUM(value_sum) / SUM(n), SUM(emissions_sum) / SUM(n)
+        FROM analysis_rollups
+        WHERE repository = ? AND path = ? AND hour >= ?
+        GROUP BY period, kind
+        """,
+        (repository or "", path or "", int(since // ROLLUP_SECONDS) * ROLLUP_SECONDS),
+    ).fetchall()
+
+
+def _query_version(conn: sqlite3.Connection, width: int, since: float, code_hash: str,
+                   repository: Optional[str], path: Optional[str]) -> List[tuple]:
+    """Historique d'un contenu précis : peu de lignes, lues directement dans la table brute"""
+    where, params = ["content_hash = ?", "recorded_at >= ?"], [code_hash, since]
+    for column, value in (("repository", repository), ("path", path)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    metric = "CASE kind " + " ".join(f"WHEN '{k}' THEN {m}" for k, m in KIND_METRICS.items()) + " END"
+    period = f"CAST(recorded_at / {width} AS INTEGER) * {width}"
+    return conn.execute(
+        f"""
+        SELECT {period} AS period, kind,
+               COUNT({metric}), AVG({metric}), AVG(CASE WHEN {metric} IS NOT NULL THEN COALESCE(emissions_kg, 0) END)
+        FROM analyses
+        WHERE {' AND '.join(where)}
+        GROUP BY period, kind
+        UNION ALL
+        SELECT {period} AS period, '{RUN_KIND}', COUNT(DISTINCT recorded_at), NULL, NULL
+        FROM analyses
+        WHERE {' AND '.join(where)}
+        GROUP BY period
+        """,
+        params * 2,
+    ).fetchall()
+
+
+def trend(repository: Optional[str] = None, path: Optional[str] = None, code_hash: Optional[str] = None,
+          days: float = 30, bucket: str = "day") -> dict:
+    """Énergie, émissions, complexité et score moyens par période pour un fichier, un dépôt ou un contenu"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Période inconnue : {bucket} (attendu : {', '.join(BUCKETS)})")
+    width = BUCKETS[bucket]
+    since = time.time() - days * 86400
+    conn = store.reader()
+    if code_hash:
+        rows = _query_version(conn, width, since, code_hash, repository, path)
+    else:
+        rows = _query_rollups(conn, width, since, repository, path)
+
+    points, runs = {}, {}
+    for period, kind, n, value, emissions in rows:
+        if not n:
+            continue
+        point = points.setdefault(period, {"period": period, "analyses": 0, "measurements": 0, **{f: None for f in POINT_FIELDS.values()}})
+        if kind == RUN_KIND:
+            runs[period] = n
+            continue
+        # Agrégats antérieurs au comptage des analyses : au moins autant d'analyses que de résultats d'une nature
+        point["analyses"] = max(point["analyses"], n)
+        point[POINT_FIELDS[(kind, "value")]] = value
+        if (kind, "emissions") in POINT_FIELDS:
+            point[POINT_FIELDS[(kind, "emissions")]] = emissions
+            point["measurements"] = n
+    for period, n in runs.items():
+        points[period]["analyses"] = n
+    points = [points[period] for period in sorted(points)]
+
+    def change(metric: str) -> Optional[dict]:
+        values = [p[metric] for p in points if p[metric] is not None]
+        if len(values) < 2:
+            return None
+        first, last = values[0], values[-1]
+        return {
+            "first": first,
+            "last": last,
+            "change_pct": round((last - first) / first * 100, 1) if first else None,
+        }
+
+    return {
+        "repository": repository,
+        "path": path,
+        "bucket": bucket,
+        "days": days,
+        "points": points,
+        "energy_trend": change("energy_kwh"),
+        "predicted_energy_trend": change("predicted_energy_kwh"),
+        "eco_score_trend": change("eco_score"),
+        "complexity_trend": change("complexity_score"),
+    }
@@ -0,0 +1,217 @@
+"""
+Sélection des fichiers d'un dépôt à analyser : .gitignore, dossiers vendorisés, code généré, taille, tests
+Partagée par la lecture LLM (github/main.py) et l'analyse carbone de dépôt (carbon_analyzer.py).
+"""
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+INGEST_MAX_FILE_KB = int(os.getenv("INGEST_MAX_FILE_KB", "256"))
+INGEST_EXCLUDE_TESTS = os.getenv("INGEST_EXCLUDE_TESTS", "0") == "1"
+
+# Jamais analysés ni comptés : métadonnées d'outils
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox", ".nox"}
+VENDORED_DIRS = {"node_modules", "site-packages", "dist-packages", "vendor", "vendored", "_vendor", "third_party",
+                 "thirdparty", "external", "build", "dist", ".eggs", "venv", ".venv", "virtualenv"}
+GENERATED_SUFFIXES = ("_pb2.py", "_pb2_grpc.py", "_generated.py", ".gen.py")
+MIGRATION_PATTERN = re.compile(r"(?:^|/)migrations/\d{4}_[^/]*\.py$")
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "Generated by the protocol buffer compiler", "autogenerated", "Autogenerated")
+TEST_PATTERNS = ("test_*.py", "*_test.py", "conftest.py")
+TEST_DIRS = {"test", "tests", "testing"}
+
+SKIP_REASONS = ("gitignore", "vendored", "virtualenv", "generated", "too_large", "tests")
+
+
+def _translate(pattern: str) -> str:
+    """Motif gitignore -> regex sur un chemin relatif en '/'"""
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            out.append("[^" + body[1:] + "]" if body.startswith("!") else "[" + body + "]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str) -> List[Tuple[re.Pattern, bool, bool, bool]]:
+    """Règles (regex, négation, dossier uniquement, ancrée) d'un fichier .gitignore"""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if line:
+            rules.append((re.compile(f"^{_translate(line)}$"), negate, dir_only, anchored))
+    return rules
+
+
+class GitIgnore:
+    """Règles des .gitignore rencontrés pendant le parcours ; la dernière règle qui correspond l'emporte"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.layers = []
+        exclude = root / ".git" / "info" / "exclude"
+        if exclude.is_file():
+            self.layers.append(("", parse_gitignore(exclude.read_text(errors="ignore"))))
+
+    def enter(self, directory: str, rel_dir: str):
+        try:
+            with open(os.path.join(directory, ".gitignore"), errors="ignore") as f:
+                self.layers.append((rel_dir, parse_gitignore(f.read())))
+        except OSError:
+            pass
+
+    def ignored(self, rel: str, is_dir: bool) -> bool:
+        if not self.layers:
+            return False
+        result = False
+        for base, rules in self.layers:
+            if base and not rel.startswith(base + "/"):
+                continue
+            local = rel[len(base) + 1:] if base else rel
+            name = local.rsplit("/", 1)[-1]
+            for regex, negate, dir_only, anchored in rules:
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(local if anchored else name):
+                    result = not negate
+        return result
+
+
+_TEST_NAMES = re.compile("|".join(fnmatch.translate(p) for p in TEST_PATTERNS))
+
+
+def is_test_path(rel: str) -> bool:
+    parts = rel.split("/")
+    return any(p in TEST_DIRS for p in parts[:-1]) or _TEST_NAMES.match(parts[-1]) is not None
+
+
+def scan_repository(root, suffixes: Tuple[str, ...] = (".py",), max_file_kb: Optional[int] = None,
+                    exclude_tests: Optional[bool] = None, respect_gitignore: bool = True) -> dict:
+    """Chemins relatifs retenus (triés, avec leur contenu) et décompte des exclusions par motif
+
+    Les dossiers vendorisés / virtualenvs sont élagués sans être parcourus : ils sont comptés dans
+    `skipped_directories`, les fichiers écartés un à un dans `skipped`. Chaque fichier retenu est lu
+    une seule fois : le contenu sert aussi à détecter les marqueurs de code généré.
+    """
+    root = os.path.normpath(os.fspath(root))
+    max_bytes = (INGEST_MAX_FILE_KB if max_file_kb is None else max_file_kb) * 1024
+    exclude_tests = INGEST_EXCLUDE_TESTS if exclude_tests is None else exclude_tests
+    gitignore = GitIgnore(Path(root)) if respect_gitignore else None
+
+    paths: List[str] = []
+    contents: List[str] = []
+    skipped = {reason: 0 for reason in SKIP_REASONS}
+    skipped_directories = {reason: 0 for reason in SKIP_REASONS}
+    examples = {}
+
+    def skip(counter: dict, reason: str, rel: str):
+        counter[reason] += 1
+        bucket = examples.setdefault(reason, [])
+        if len(bucket) < 5:
+            bucket.append(rel)
+
+    for current, dirs, names in os.walk(root):
+        rel_dir = current[len(root) + 1:].replace(os.sep, "/")
+        prefix = rel_dir + "/" if rel_dir else ""
+        # Virtualenv reconnu à son pyvenv.cfg : détecté depuis la liste déjà lue, sans stat supplémentaire
+        if rel_dir and "pyvenv.cfg" in names:
+            skip(skipped_directories, "virtualenv", prefix)
+            dirs[:] = []
+            continue
+        if gitignore is not None and ".gitignore" in names:
+            gitignore.enter(current, rel_dir)
+
+        kept = []
+        for d in sorted(dirs):
+            rel = prefix + d
+            if d in IGNORED_DIRS:
+                continue
+            if d in VENDORED_DIRS or d.endswith(".egg-info"):
+                skip(skipped_directories, "vendored", rel + "/")
+            elif gitignore is not None and gitignore.ignored(rel, True):
+                skip(skipped_directories, "gitignore", rel + "/")
+            elif exclude_tests and d in TEST_DIRS:
+                skip(skipped_directories, "tests", rel + "/")
+            else:
+                kept.append(d)
+        dirs[:] = kept
+
+        for name in sorted(names):
+            if not name.endswith(suffixes):
+                continue
+            path = os.path.join(current, name)
+            rel = prefix + name
+            if gitignore is not None and gitignore.ignored(rel, False):
+                skip(skipped, "gitignore", rel)
+            elif exclude_tests and is_test_path(rel):
+                skip(skipped, "tests", rel)
+            elif name.endswith(GENERATED_SUFFIXES) or ("migrations/" in rel and MIGRATION_PATTERN.search(rel)):
+                skip(skipped, "generated", rel)
+            else:
+                try:
+                    with open(path, encoding="utf-8", errors="ignore") as f:
+                        if os.fstat(f.fileno()).st_size > max_bytes:
+                            skip(skipped, "too_large", rel)
+                            continue
+                        content = f.read()
+                except OSError:
+                    continue
+                head = content[:1024]
+                if any(marker in head for marker in GENERATED_MARKERS):
+                    skip(skipped, "generated", rel)
+                    continue
+                paths.append(rel)
+                contents.append(content)
+
+    return {
+        "root": root,
+        "paths": paths,
+        "contents": contents,
+        "skipped": {k: v for k, v in skipped.items() if v},
+        "skipped_directories": {k: v for k, v in skipped_directories.items() if v},
+        "examples": examples,
+    }
+
+
+def ingestion_summary(scan: dict) -> dict:
+    """Partie sérialisable d'un scan, à joindre aux réponses des outils"""
+    return {
+        "files_selected": len(scan["paths"]),
+        "files_skipped": sum(scan["skipped"].values()),
+        "skipped": scan["skipped"],
+        "skipped_directories": scan["skipped_directories"],
+        "examples": scan["examples"],
+    }
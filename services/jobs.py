@@ -0,0 +1,173 @@
+"""
+File de travaux asynchrones pour les analyses longues
+Soumission immédiate, exécution par un pool borné de workers, résultats conservés pendant un TTL.
+En déploiement multi-worker, chaque travail est recopié dans l'état partagé : statut et résultat
+se consultent depuis n'importe quel processus derrière l'upstream nginx.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from uuid import uuid4
+
+from services.cancellation import deadline
+from services.metrics import Counter, Gauge, REGISTRY
+from services.progress import progress_scope
+from services.shared import SharedState, shared_state
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "600"))
+
+JOBS_TOTAL = Counter("ecocode_jobs_total", "Travaux asynchrones terminés par type et statut", ("kind", "status"))
+JOBS_QUEUED = Gauge("ecocode_jobs_queued", "Travaux en attente dans la file")
+JOBS_RUNNING = Gauge("ecocode_jobs_running", "Travaux en cours d'exécution")
+REGISTRY.extend([JOBS_TOTAL, JOBS_QUEUED, JOBS_RUNNING])
+
+
+class _JobProgress:
+    """Reçoit les notifications de progression à la place d'un Context MCP"""
+
+    def __init__(self, job: dict, manager: "JobManager"):
+        self.job = job
+        self.manager = manager
+
+    async def report_progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None):
+        self.job["progress"] = {"step": progress, "message": message}
+        await self.manager._persist_async(self.job)
+
+
+class JobManager:
+    """Pool borné de workers asyncio avec conservation des résultats"""
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE,
+                 ttl: int = JOB_RESULT_TTL, timeout: int = JOB_TIMEOUT, shared: Optional[SharedState] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self.shared = shared
+        self.jobs: Dict[str, dict] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def start(self):
+        """Démarre les workers (au premier submit, ou au préchauffage)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _persist(self, job: dict):
+        if self.shared is None:
+            return
+        # Travail non terminé : borné par l'attente maximale dans la file plus son exécution
+        expires_at = job["expires_at"] or time.time() + self.ttl + self.timeout * (1 + self.queue_size // max(1, self.workers))
+        try:
+            self.shared.save_job(job, expires_at)
+        except Exception as e:
+            logger.warning("Travail %s non partagé : %s", job["job_id"], e)
+
+    async def _persist_async(self, job: dict):
+        if self.shared is not None:
+            await asyncio.to_thread(self._persist, job)
+
+    def _lookup(self, job_id: str) -> Optional[dict]:
+        """Travail de ce worker, sinon celui d'un autre worker dans l'état partagé"""
+        job = self.jobs.get(job_id)
+        if job is None and self.shared is not None:
+            try:
+                job = self.shared.load_job(job_id)
+            except Exception as e:
+                logger.warning("État partagé illisible : %s", e)
+        return job
+
+    def _evict_expired(self):
+        now = time.time()
+        for job_id in [j for j, job in self.jobs.items() if job.get("expires_at") and job["expires_at"] < now]:
+            del self.jobs[job_id]
+
+    def submit(self, kind: str, factory: Callable[[], Awaitable[dict]], params: Optional[dict] = None) -> dict:
+        """Place un travail dans la file et renvoie immédiatement son identifiant"""
+        self._evict_expired()
+        self.start()
+        job_id = uuid4().hex
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "progress": None,
+            "result": None,
+            "error": None,
+        }
+        try:
+            self._queue.put_nowait((job, factory))
+        except asyncio.QueueFull:
+            return {"status": "error", "message": f"File d'attente pleine ({self.queue_size} travaux)"}
+        self.jobs[job_id] = job
+        self._persist(job)
+        JOBS_QUEUED.inc()
+        return {"status": "success", "job_id": job_id, "queue_position": self._queue.qsize()}
+
+    async def _worker(self):
+        while True:
+            job, factory = await self._queue.get()
+            JOBS_QUEUED.dec()
+            JOBS_RUNNING.inc()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            await self._persist_async(job)
+            try:
+                with progress_scope(_JobProgress(job, self)), deadline(self.timeout):
+                    job["result"] = await asyncio.wait_for(factory(), timeout=self.timeout)
+                job["status"] = "done"
+            except asyncio.TimeoutError:
+                job["status"] = "failed"
+                job["error"] = f"Timeout après {self.timeout}s"
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = time.time()
+                job["expires_at"] = job["finished_at"] + self.ttl
+                JOBS_RUNNING.dec()
+                JOBS_TOTAL.inc(job["kind"], job["status"])
+                self._queue.task_done()
+                await self._persist_async(job)
+
+    def status(self, job_id: str) -> dict:
+        """Statut d'un travail, sans le résultat"""
+        self._evict_expired()
+        job = self._lookup(job_id)
+        if job is None:
+            return {"status": "error", "message": f"Travail inconnu ou expiré : {job_id}"}
+        now = job["finished_at"] or time.time()
+        return {
+            "status": "success",
+            "job_id": job_id,
+            "kind": job["kind"],
+            "state": job["status"],
+            "progress": job["progress"],
+            "elapsed_s": round(now - (job["started_at"] or job["submitted_at"]), 3),
+            "expires_at": job["expires_at"],
+            "error": job["error"],
+        }
+
+    def result(self, job_id: str) -> dict:
+        """Résultat d'un travail terminé"""
+        status = self.status(job_id)
+        if status["status"] == "error" or status["state"] != "done":
+            return status
+        status["result"] = self._lookup(job_id)["result"]
+        return status
+
+
+job_manager = JobManager(shared=shared_state)
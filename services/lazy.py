@@ -0,0 +1,20 @@
+"""
+Import paresseux des modules de service : le module n'est exécuté qu'au premier accès à un attribut
+"""
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """Renvoie le module sans l'exécuter ; un import classique ailleurs le partage via sys.modules"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"Module introuvable : {name}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
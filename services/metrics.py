@@ -0,0 +1,171 @@
+"""
+Métriques au format Prometheus (compteurs, jauges, histogrammes de latence)
+Pas de dépendance externe : un enregistrement coûte un lock et une recherche dichotomique.
+"""
+import asyncio
+import functools
+import subprocess
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_tool_outcome: ContextVar[Optional[list]] = ContextVar("tool_outcome", default=None)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{n}="{v}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(key, inf)} {count}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+
+TOOL_REQUESTS = Counter("ecocode_tool_requests_total", "Appels d'outils MCP par résultat", ("tool", "outcome"))
+TOOL_IN_FLIGHT = Gauge("ecocode_tool_in_flight", "Appels d'outils MCP en cours", ("tool",))
+TOOL_LATENCY = Histogram("ecocode_tool_duration_seconds", "Durée des appels d'outils MCP", ("tool",))
+STAGE_TOTAL = Counter("ecocode_stage_total", "Exécutions d'étapes internes par résultat", ("stage", "outcome"))
+STAGE_IN_FLIGHT = Gauge("ecocode_stage_in_flight", "Étapes internes en cours", ("stage",))
+STAGE_LATENCY = Histogram("ecocode_stage_duration_seconds", "Durée des étapes internes", ("stage",))
+
+REGISTRY = [TOOL_REQUESTS, TOOL_IN_FLIGHT, TOOL_LATENCY, STAGE_TOTAL, STAGE_IN_FLIGHT, STAGE_LATENCY]
+
+
+def classify_exception(exc: BaseException) -> str:
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, subprocess.TimeoutExpired)):
+        return "timeout"
+    if isinstance(exc, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Mesure une étape interne (clone, mistral, sonar_scanner, ...)"""
+    STAGE_IN_FLIGHT.inc(stage)
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = classify_exception(e)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage)
+        STAGE_IN_FLIGHT.dec(stage)
+        STAGE_TOTAL.inc(stage, outcome)
+
+
+def mark_outcome(outcome: str):
+    """Marque l'appel d'outil courant comme 'error' ou 'timeout' sans lever d'exception"""
+    holder = _tool_outcome.get()
+    if holder is not None and holder[0] == "ok":
+        holder[0] = outcome
+
+
+def track_tool(func):
+    """Décorateur pour les outils MCP asynchrones : compteur, jauge et histogramme"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        holder = ["ok"]
+        token = _tool_outcome.set(holder)
+        TOOL_IN_FLIGHT.inc(name)
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+            if isinstance(result, dict) and result.get("status") == "error":
+                mark_outcome("error")
+            return result
+        except BaseException as e:
+            mark_outcome(classify_exception(e))
+            raise
+        finally:
+            TOOL_LATENCY.observe(time.perf_counter() - started, name)
+            TOOL_IN_FLIGHT.dec(name)
+            TOOL_REQUESTS.inc(name, holder[0])
+            _tool_outcome.reset(token)
+
+    return wrapper
+
+
+def render_metrics() -> str:
+    """Exporte toutes les métriques au format texte Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+"""
+Notifications de progression MCP pour les analyses longues
+Les étapes passent par ctx.report_progress ; le journal (logger services.progress) ne les reprend qu'en debug,
+ou en info hors appel d'outil (scripts, benchmarks). Rien n'est écrit sur stdout, réservé au transport stdio.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_current_reporter: ContextVar[Optional["ProgressReporter"]] = ContextVar("progress_reporter", default=None)
+
+
+class ProgressReporter:
+    """Envoie une notification MCP à chaque étape avec le temps écoulé"""
+
+    def __init__(self, ctx, total: Optional[float] = None):
+        self.ctx = ctx
+        self.total = total
+        self.step = 0
+        self.started = time.monotonic()
+        self.loop = asyncio.get_running_loop()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def report(self, stage: str, message: str = ""):
+        self.step += 1
+        text = format_stage(stage, message, self.elapsed())
+        logger.debug(text)
+        try:
+            await self.ctx.report_progress(self.step, self.total, text)
+        except Exception as e:
+            logger.warning("Notification de progression impossible : %s", e)
+
+
+def format_stage(stage: str, message: str, elapsed: float) -> str:
+    text = f"[{stage}] {message}" if message else f"[{stage}]"
+    return f"{text} (+{elapsed:.1f}s)"
+
+
+@contextmanager
+def progress_scope(ctx, total: Optional[float] = None):
+    """Active un reporter de progression pour l'appel d'outil courant"""
+    reporter = ProgressReporter(ctx, total) if ctx is not None else None
+    token = _current_reporter.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current_reporter.reset(token)
+
+
+async def report_stage(stage: str, message: str = ""):
+    """Signale une étape depuis du code asynchrone"""
+    reporter = _current_reporter.get()
+    if reporter is None:
+        logger.info("[%s] %s", stage, message)
+        return
+    await reporter.report(stage, message)
+
+
+def report_stage_threadsafe(stage: str, message: str = ""):
+    """Signale une étape depuis un thread (ex: asyncio.to_thread)"""
+    reporter = _current_reporter.get()
+    if reporter is None:
+        logger.info("[%s] %s", stage, message)
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is reporter.loop:
+        running.create_task(reporter.report(stage, message))
+    else:
+        asyncio.run_coroutine_threadsafe(reporter.report(stage, message), reporter.loop)
@@ -0,0 +1,104 @@
+"""
+Mise en forme des réponses d'outils : sélection de champs et mode résumé
+En mode summary, les parties volumineuses (contenu de fichier, notes, issues, sortie d'exécution) sont
+déchargées en artefacts et remplacées par un lien vers la ressource MCP ecocode://artifacts/{id}.
+"""
+import json
+from typing import Callable, Iterable, List, Optional
+
+from services.artifacts import save_artifact
+
+RESOURCE_URI = "ecocode://artifacts/{artifact_id}"
+
+# Parties volumineuses de chaque résultat ("*" parcourt une liste)
+HEAVY_FIELDS = {
+    "carbon": ("execution_output",),
+    "sonar": ("issues",),
+    "full_eco": ("carbon_analysis.execution_output", "quality_analysis.issues"),
+    "batch": ("items.*.carbon_analysis.execution_output", "items.*.quality_analysis.issues"),
+    "github": ("notes", "file.content"),
+    "github_carbon": ("file_analyses.*.execution_output", "file_predictions", "schedule.files"),
+}
+# Nature de l'artefact selon le dernier segment du chemin
+ARTIFACT_KINDS = {"execution_output": "stdout", "issues": "issues", "notes": "notes", "content": "file"}
+
+
+def _map_path(data, parts: List[str], fn: Callable):
+    """Copie de data où la valeur au bout de parts est remplacée par fn(valeur) ; seul le chemin est copié"""
+    if not parts:
+        return fn(data)
+    head, rest = parts[0], parts[1:]
+    if head == "*" and isinstance(data, list):
+        return [_map_path(item, rest, fn) for item in data]
+    if isinstance(data, dict) and head in data:
+        return {**data, head: _map_path(data[head], rest, fn)}
+    return data
+
+
+def offload(value, kind: str) -> dict:
+    """Référence vers la ressource contenant value (texte tel quel, le reste en JSON)"""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    artifact_id = save_artifact(kind, text)
+    reference = {"resource": RESOURCE_URI.format(artifact_id=artifact_id), "bytes": len(text.encode("utf-8"))}
+    if isinstance(value, list):
+        reference["items"] = len(value)
+    return reference
+
+
+def summarize(data: dict, heavy: Iterable[str]) -> dict:
+    for path in heavy:
+        parts = path.split(".")
+        kind = ARTIFACT_KINDS.get(parts[-1], "data")
+        data = _map_path(data, parts, lambda value: offload(value, kind) if value else value)
+    return data
+
+
+def select_fields(data, fields: Iterable[str]):
+    """Ne garde que les chemins pointés demandés (ex: eco_score.score, items.*.eco_score)"""
+    selected = {}
+    for path in fields:
+        _merge(selected, _extract(data, path.split(".")))
+    return selected
+
+
+def _extract(data, parts: List[str]):
+    if not parts:
+        return data
+    head, rest = parts[0], parts[1:]
+    if head == "*" and isinstance(data, list):
+        return [_extract(item, rest) for item in data]
+    if isinstance(data, dict) and head in data:
+        return {head: _extract(data[head], rest)}
+    return None
+
+
+def _merge(target, value):
+    if isinstance(target, dict) and isinstance(value, dict):
+        for key, item in value.items():
+            if key in target and isinstance(target[key], (dict, list)):
+                target[key] = _merge(target[key], item)
+            elif item is not None:
+                target[key] = item
+        return target
+    if isinstance(target, list) and isinstance(value, list):
+        return [_merge(a, b) for a, b in zip(target, value)]
+    return value
+
+
+def shape(data: dict, heavy_kind: str, fields: Optional[List[str]] = None, detail: str = "full",
+          root: str = "", keep: Iterable[str] = ("status",)) -> dict:
+    """Applique le mode résumé puis la sélection de champs ; status (et keep) toujours conservés
+
+    root préfixe les chemins volumineux quand le résultat est imbriqué (ex: "result." pour un travail)
+    """
+    if not isinstance(data, dict) or data.get("status") == "error":
+        return data
+    if detail == "summary":
+        data = summarize(data, (root + path for path in HEAVY_FIELDS[heavy_kind]))
+    if fields:
+        projected = select_fields(data, fields)
+        for key in keep:
+            if key in data:
+                projected[key] = data[key]
+        data = projected
+    return data
@@ -0,0 +1,200 @@
+"""
+État partagé entre les workers d'un déploiement multi-processus (scripts/start_services.sh, upstream nginx)
+Base SQLite locale en WAL : travaux asynchrones consultables depuis n'importe quel worker, et baux de
+single-flight pour qu'une même analyse lancée sur deux workers ne s'exécute qu'une fois.
+Désactivé par défaut (ECOCODE_SHARED_STATE=memory) : un processus unique garde tout en mémoire.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+from services.metrics import Counter, REGISTRY
+
+SHARED_STATE = os.getenv("ECOCODE_SHARED_STATE", "memory")
+SHARED_STATE_DB = Path(os.path.expanduser(os.getenv("SHARED_STATE_DB", "~/.cache/ecocode/shared.db")))
+# Un worker mort libère sa clé au plus tard après ce délai sans renouvellement du bail
+FLIGHT_LEASE_S = float(os.getenv("FLIGHT_LEASE_S", "30"))
+# Durée pendant laquelle le résultat reste lisible par les workers qui attendaient la même clé (sondage)
+FLIGHT_RESULT_TTL = float(os.getenv("FLIGHT_RESULT_TTL", "10"))
+FLIGHT_POLL_MAX_S = 0.5
+
+SHARED_FLIGHTS_TOTAL = Counter(
+    "ecocode_shared_flights_total",
+    "Single-flight entre workers (leader : exécuté ici, follower : résultat d'un autre worker, takeover : bail expiré repris)",
+    ("kind", "role"),
+)
+REGISTRY.append(SHARED_FLIGHTS_TOTAL)
+
+WORKER_ID = f"{os.getpid()}-{uuid4().hex[:8]}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    job TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flights (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    lease_until REAL NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 1,
+    result TEXT,
+    done_at REAL
+) WITHOUT ROWID;
+"""
+
+
+class SharedState:
+    """Accès SQLite par thread ; toutes les méthodes sont bloquantes (appelées via asyncio.to_thread)"""
+
+    def __init__(self, path: Path = None):
+        self.path = path or SHARED_STATE_DB
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # Travaux
+
+    def save_job(self, job: dict, expires_at: float):
+        """expires_at borne aussi les travaux non terminés : ceux d'un worker arrêté finissent par disparaître"""
+        self.connection().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, expires_at, job) VALUES (?, ?, ?)",
+            (job["job_id"], expires_at, json.dumps(job, default=str)),
+        )
+
+    def load_job(self, job_id: str) -> Optional[dict]:
+        row = self.connection().execute(
+            "SELECT job FROM jobs WHERE job_id = ? AND expires_at >= ?", (job_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, now: Optional[float] = None):
+        """Supprime travaux et résultats de single-flight expirés (au plus une fois par minute et par worker)"""
+        now = now or time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        conn = self.connection()
+        conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM flights WHERE done_at < ?", (now - FLIGHT_RESULT_TTL,))
+
+    # Single-flight
+
+    def acquire(self, key: str) -> tuple:
+        """("leader" | "takeover", calls) si le bail est pris ici, ("follower", calls) s'il est tenu ailleurs"""
+        now = time.time()
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT lease_until, calls, done_at FROM flights WHERE key = ?", (key,)).fetchone()
+            # Un résultat déjà publié n'est pas resservi : seuls les appels arrivés pendant l'exécution le partagent
+            if row is None or row[2] is not None:
+                conn.execute("INSERT OR REPLACE INTO flights (key, owner, lease_until) VALUES (?, ?, ?)",
+                             (key, WORKER_ID, now + FLIGHT_LEASE_S))
+                return ("leader", 1)
+            lease_until, calls, _ = row
+            if lease_until < now:
+                conn.execute("UPDATE flights SET owner = ?, lease_until = ?, calls = calls + 1 WHERE key = ?",
+                             (WORKER_ID, now + FLIGHT_LEASE_S, key))
+                return ("takeover", calls + 1)
+            conn.execute("UPDATE flights SET calls = calls + 1 WHERE key = ?", (key,))
+            return ("follower", calls + 1)
+        finally:
+            conn.execute("COMMIT")
+
+    def renew(self, key: str) -> bool:
+        cursor = self.connection().execute(
+            "UPDATE flights SET lease_until = ? WHERE key = ? AND owner = ? AND done_at IS NULL",
+            (time.time() + FLIGHT_LEASE_S, key, WORKER_ID),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, key: str, result: Optional[str]) -> int:
+        """Publie le résultat (None : échec ou résultat non sérialisable, la clé est libérée) ; renvoie le nombre d'appels"""
+        conn = self.connection()
+        row = conn.execute("SELECT calls FROM flights WHERE key = ? AND owner = ?", (key, WORKER_ID)).fetchone()
+        if result is None:
+            conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, WORKER_ID))
+        else:
+            conn.execute("UPDATE flights SET result = ?, done_at = ? WHERE key = ? AND owner = ?",
+                         (result, time.time(), key, WORKER_ID))
+        self.prune()
+        return row[0] if row else 1
+
+    def poll(self, key: str) -> Optional[tuple]:
+        """("done", result, calls) une fois publié, ("released", None) si la clé a été libérée, None tant que le leader travaille"""
+        row = self.connection().execute("SELECT result, calls, done_at, lease_until FROM flights WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return ("released", None)
+        result, calls, done_at, lease_until = row
+        if done_at is not None:
+            return ("done", result, calls)
+        if lease_until < time.time():
+            return ("released", None)
+        return None
+
+
+async def shared_flight(state: SharedState, key: str, factory: Callable[[], Awaitable]) -> tuple:
+    """Exécute factory si aucun autre worker ne traite déjà key, sinon attend son résultat : (résultat, appels)"""
+    kind = key.split(":", 1)[0]
+    while True:
+        claim = await asyncio.to_thread(state.acquire, key)
+        if claim[0] in ("leader", "takeover"):
+            SHARED_FLIGHTS_TOTAL.inc(kind, claim[0])
+            return await _lead(state, key, factory)
+
+        delay = 0.02
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, FLIGHT_POLL_MAX_S)
+            polled = await asyncio.to_thread(state.poll, key)
+            if polled is None:
+                continue
+            if polled[0] == "done":
+                SHARED_FLIGHTS_TOTAL.inc(kind, "follower")
+                return json.loads(polled[1]), polled[2]
+            # Leader en échec, mort ou résultat non partageable : nouvelle tentative de prise du bail
+            break
+
+
+async def _lead(state: SharedState, key: str, factory: Callable[[], Awaitable]) -> tuple:
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(FLIGHT_LEASE_S / 3)
+            await asyncio.to_thread(state.renew, key)
+
+    renewer = asyncio.create_task(heartbeat())
+    published = False
+    try:
+        result = await factory()
+        try:
+            payload = json.dumps(result)
+        except (TypeError, ValueError):
+            payload = None
+        calls = await asyncio.to_thread(state.complete, key, payload)
+        published = True
+        return result, calls
+    finally:
+        renewer.cancel()
+        if not published:
+            # Échec ou annulation : la clé est libérée pour les workers en attente
+            await asyncio.shield(asyncio.to_thread(state.complete, key, None))
+
+
+shared_state = SharedState() if SHARED_STATE == "sqlite" else None
@@ -0,0 +1,84 @@
+"""
+Single-flight : les appels identiques simultanés partagent une seule exécution
+"""
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from services.metrics import Counter, REGISTRY
+from services.shared import SharedState, shared_flight, shared_state
+
+COALESCED_TOTAL = Counter("ecocode_singleflight_coalesced_total", "Appels rattachés à une exécution déjà en cours", ("kind",))
+REGISTRY.append(COALESCED_TOTAL)
+
+
+def normalize_code(code: str) -> str:
+    """Ignore les fins de ligne et les espaces en fin de ligne"""
+    return "\n".join(line.rstrip() for line in code.replace("\r\n", "\n").split("\n")).strip("\n")
+
+
+def make_key(kind: str, **params) -> str:
+    """Clé stable d'une requête normalisée"""
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return f"{kind}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.calls = 1
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Regroupe les appels concurrents ayant la même clé, entre workers si un état partagé est fourni"""
+
+    def __init__(self, shared: Optional[SharedState] = None):
+        self._flights: Dict[str, _Flight] = {}
+        self.shared = shared
+
+    async def _run(self, key: str, factory: Callable[[], Awaitable]) -> Tuple[object, int]:
+        if self.shared is None:
+            return await factory(), 1
+        return await shared_flight(self.shared, key, factory)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable]) -> Tuple[object, int]:
+        """Renvoie (résultat, nombre d'appels regroupés sur cette exécution)"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run(key, factory)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            flight.calls += 1
+            COALESCED_TOTAL.inc(key.split(":", 1)[0])
+
+        flight.waiters += 1
+        try:
+            result, shared_calls = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+        # Les appels des autres workers s'ajoutent à ceux regroupés localement
+        return result, flight.calls + shared_calls - 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+def with_coalesced(result, calls: int):
+    """Copie le résultat en y indiquant le nombre d'appels regroupés"""
+    if isinstance(result, dict):
+        return {**result, "coalesced_calls": calls}
+    return {"result": result, "coalesced_calls": calls}
+
+
+singleflight = SingleFlight(shared_state)
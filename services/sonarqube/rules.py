@@ -0,0 +1,192 @@
+"""
+Catalogue des règles SonarQube (api/rules/search) et index règle -> impact écologique
+Le catalogue est téléchargé une fois, gardé sur disque et rafraîchi après SONAR_RULES_TTL ; la
+classification d'une issue est une simple recherche dans l'index. Les clés des règles « eco » servent
+aussi de filtre `rules` sur api/issues/search : le serveur ne renvoie que les issues utiles.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.cancellation import remaining
+from services.metrics import Counter, REGISTRY, track_stage
+
+logger = logging.getLogger(__name__)
+
+SONAR_RULES_CACHE = Path(os.path.expanduser(os.getenv("SONAR_RULES_CACHE", "~/.cache/ecocode/sonar_rules.json")))
+SONAR_RULES_TTL = int(os.getenv("SONAR_RULES_TTL", "86400"))
+SONAR_RULES_LANGUAGES = os.getenv("SONAR_RULES_LANGUAGES", "py")
+# Au-delà, la liste de règles ne tient plus raisonnablement dans l'URL : pas de filtre côté serveur
+SONAR_RULES_FILTER_MAX = int(os.getenv("SONAR_RULES_FILTER_MAX", "300"))
+RULES_PAGE_SIZE = 500
+# Après un échec de téléchargement, délai avant de réessayer (les analyses n'attendent pas un serveur en panne)
+SONAR_RULES_RETRY_S = int(os.getenv("SONAR_RULES_RETRY_S", "300"))
+
+# Catégorie écologique par attribut clean code, puis par tag (le premier trouvé l'emporte)
+ECO_ATTRIBUTES = {
+    "EFFICIENT": "efficiency",
+    "FOCUSED": "complexity",
+    "DISTINCT": "duplication",
+}
+ECO_TAGS = {
+    "eco-design": "efficiency",
+    "ecocode": "efficiency",
+    "performance": "efficiency",
+    "resource": "efficiency",
+    "brain-overload": "complexity",
+    "unused": "dead_code",
+    "redundant": "dead_code",
+}
+# Règles historiquement suivies, classées même si le serveur ne les étiquette pas
+LEGACY_ECO_RULES = {
+    "python:S1066": "complexity",  # Complexité cognitive
+    "python:S3776": "complexity",  # Complexité cyclomatique
+}
+# Catalogue indisponible : ancienne détection par mots-clés du message
+FALLBACK_KEYWORDS = {
+    "performance": "efficiency",
+    "memory": "efficiency",
+    "cpu": "efficiency",
+    "complexity": "complexity",
+    "unused": "dead_code",
+    "duplicate": "duplication",
+}
+
+SONAR_RULES_TOTAL = Counter(
+    "ecocode_sonar_rules_total",
+    "Chargements du catalogue de règles SonarQube (cache, refreshed : téléchargé, stale : serveur injoignable)",
+    ("outcome",),
+)
+REGISTRY.append(SONAR_RULES_TOTAL)
+
+_lock = threading.Lock()
+_catalog: Optional[dict] = None
+_retry_at = 0.0
+
+
+def _rule_entry(rule: dict) -> dict:
+    return {
+        "key": rule["key"],
+        "name": rule.get("name"),
+        "type": rule.get("type"),
+        "tags": sorted(set(rule.get("tags", [])) | set(rule.get("sysTags", []))),
+        "clean_code_attribute": rule.get("cleanCodeAttribute"),
+        "clean_code_category": rule.get("cleanCodeAttributeCategory"),
+        "impacts": rule.get("impacts", []),
+    }
+
+
+def eco_category(rule: dict) -> Optional[str]:
+    """Catégorie écologique d'une règle du catalogue, None si elle n'a pas d'impact écologique"""
+    if rule["key"] in LEGACY_ECO_RULES:
+        return LEGACY_ECO_RULES[rule["key"]]
+    if rule.get("clean_code_attribute") in ECO_ATTRIBUTES:
+        return ECO_ATTRIBUTES[rule["clean_code_attribute"]]
+    for tag in rule.get("tags", []):
+        if tag in ECO_TAGS:
+            return ECO_TAGS[tag]
+    return None
+
+
+def build_index(rules: list) -> Dict[str, Optional[str]]:
+    """Index règle -> catégorie (None : règle connue sans impact écologique)"""
+    index = {rule["key"]: eco_category(rule) for rule in rules}
+    for key, category in LEGACY_ECO_RULES.items():
+        index.setdefault(key, category)
+    return index
+
+
+def fetch_catalog(session, host: str, token: Optional[str]) -> dict:
+    """Télécharge toutes les pages du catalogue pour les langages suivis"""
+    rules, page = [], 1
+    with track_stage("sonar_rules"):
+        while True:
+            response = session.get(
+                f"{host}/api/rules/search",
+                # Pas de paramètre f : la liste des champs acceptés varie selon la version du serveur
+                params={"languages": SONAR_RULES_LANGUAGES, "ps": RULES_PAGE_SIZE, "p": page},
+                auth=(token, "") if token else None,
+                timeout=remaining(30),
+            )
+            if response.status_code != 200:
+                raise Exception(f"Erreur API SonarQube (règles) : {response.status_code}")
+            body = response.json()
+            rules.extend(_rule_entry(rule) for rule in body.get("rules", []))
+            total = body.get("paging", {}).get("total", body.get("total", len(rules)))
+            if not body.get("rules") or len(rules) >= total:
+                break
+            page += 1
+    return {"host": host, "languages": SONAR_RULES_LANGUAGES, "fetched_at": time.time(), "rules": rules}
+
+
+def _with_index(catalog: dict) -> dict:
+    index = build_index(catalog["rules"])
+    eco_keys = sorted(key for key, category in index.items() if category)
+    return {**catalog, "index": index, "eco_rules": eco_keys}
+
+
+def _load_disk(host: str) -> Optional[dict]:
+    try:
+        catalog = json.loads(SONAR_RULES_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if catalog.get("host") != host or catalog.get("languages") != SONAR_RULES_LANGUAGES:
+        return None
+    return catalog
+
+
+def _save_disk(catalog: dict):
+    try:
+        SONAR_RULES_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SONAR_RULES_CACHE.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({k: v for k, v in catalog.items() if k not in ("index", "eco_rules")}), encoding="utf-8")
+        os.replace(tmp, SONAR_RULES_CACHE)
+    except OSError as e:
+        logger.warning("Catalogue de règles non persisté : %s", e)
+
+
+def get_catalog(session, host: str, token: Optional[str]) -> Optional[dict]:
+    """Catalogue indexé : mémoire, puis disque, puis serveur une fois le TTL écoulé (l'ancien reste servi en cas d'échec)"""
+    global _catalog, _retry_at
+    catalog = _catalog
+    if catalog is not None and catalog["host"] == host and time.time() - catalog["fetched_at"] < SONAR_RULES_TTL:
+        return catalog
+    with _lock:
+        if _catalog is None or _catalog["host"] != host:
+            disk = _load_disk(host)
+            _catalog = _with_index(disk) if disk else None
+        if _catalog is not None and time.time() - _catalog["fetched_at"] < SONAR_RULES_TTL:
+            SONAR_RULES_TOTAL.inc("cache")
+            return _catalog
+        if time.time() < _retry_at:
+            SONAR_RULES_TOTAL.inc("stale" if _catalog is not None else "error")
+            return _catalog
+        try:
+            fresh = fetch_catalog(session, host, token)
+        except Exception as e:
+            logger.warning("Catalogue de règles SonarQube indisponible : %s", e)
+            _retry_at = time.time() + SONAR_RULES_RETRY_S
+            SONAR_RULES_TOTAL.inc("stale" if _catalog is not None else "error")
+            return _catalog
+        _save_disk(fresh)
+        _catalog = _with_index(fresh)
+        SONAR_RULES_TOTAL.inc("refreshed")
+        return _catalog
+
+
+def classify(issue: dict, index: Optional[Dict[str, Optional[str]]]) -> Optional[str]:
+    """Catégorie écologique d'une issue : recherche dans l'index, mots-clés seulement pour une règle inconnue"""
+    rule = issue.get("rule", "")
+    if index is not None and rule in index:
+        return index[rule]
+    if rule in LEGACY_ECO_RULES:
+        return LEGACY_ECO_RULES[rule]
+    message = issue.get("message", "").lower()
+    for keyword, category in FALLBACK_KEYWORDS.items():
+        if keyword in message:
+            return category
+    return None
@@ -1,26 +1,59 @@
+import contextvars
+import os
+import weakref
+import httpx
 import requests
 import time
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
+from services.cancellation import remaining
+from services.progress import report_stage
+from services.sonarqube import rules
 
-SONAR_HOST = "https://ollama.lambdah.ovh"
-SONAR_TOKEN = "squ_44a64e04ea7ed4a54789b71def306412f7fcf840"
+SONAR_HOST = os.getenv("SONAR_HOST", "https://ollama.lambdah.ovh")
+SONAR_TOKEN = os.getenv("SONAR_TOKEN")
+# Délai d'un appel HTTP, raccourci par l'échéance de l'outil en cours
+SONAR_HTTP_TIMEOUT = int(os.getenv("SONAR_HTTP_TIMEOUT", "30"))
+
+_session = requests.Session()
+_count_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sonar-count")
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def sonar_auth() -> tuple:
+    """Authentification de l'API SonarQube : SONAR_TOKEN est obligatoire"""
+    if not SONAR_TOKEN:
+        raise RuntimeError("SONAR_TOKEN non défini : renseigner un jeton SonarQube dans l'environnement ou .env")
+    return (SONAR_TOKEN, "")
+
+
+def async_client() -> httpx.AsyncClient:
+    """Client asynchrone partagé par boucle d'événements (keep-alive) ; annuler une requête ferme sa connexion"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(auth=sonar_auth(), timeout=SONAR_HTTP_TIMEOUT)
+    return client
+
+
+def http_session() -> requests.Session:
+    """Session HTTP partagée (pool de connexions keep-alive vers SonarQube)"""
+    return _session
 
 async def wait_for_task(task_id: str, timeout: int = 300) -> bool:
-    """Attend que la tâche SonarQube soit terminée"""
+    """Attend que la tâche SonarQube soit terminée (client asynchrone : une annulation ferme la requête en cours)"""
+    timeout = remaining(timeout)
     start_time = time.time()
     
     while time.time() - start_time < timeout:
         try:
-            response = requests.get(
-                f"{SONAR_HOST}/api/ce/task",
-                params={"id": task_id},
-                auth=(SONAR_TOKEN, "")
-            )
+            response = await async_client().get(f"{SONAR_HOST}/api/ce/task", params={"id": task_id})
             
             if response.status_code == 200:
                 task_data = response.json()
                 status = task_data.get("task", {}).get("status")
+                await report_stage("polling", f"Tâche {task_id} : {status}")
                 
                 if status == "SUCCESS":
                     return True
@@ -35,46 +68,47 @@ async def wait_for_task(task_id: str, timeout: int = 300) -> bool:
     
     return "TIMEOUT"
 
+def _search_issues(params: dict) -> dict:
+    response = _session.get(f"{SONAR_HOST}/api/issues/search", params=params, auth=sonar_auth(),
+                            timeout=remaining(SONAR_HTTP_TIMEOUT))
+    if response.status_code != 200:
+        raise Exception(f"Erreur API SonarQube: {response.status_code} - {response.text}")
+    return response.json()
+
 def get_sonar_issues(project_key: str) -> Dict:
-    """Récupère les issues SonarQube pour un projet"""
-    
-    eco_rules = [
-        "python:S1066",  # Complexité cognitive
-        "python:S3776",  # Complexité cyclomatique
-    ]
+    """Récupère les issues SonarQube d'un projet ayant un impact écologique (catalogue de règles, rules.py)"""
     
     try:
-        response = requests.get(
-            f"{SONAR_HOST}/api/issues/search",
-            params={
-                "componentKeys": project_key
-            },
-            auth=(SONAR_TOKEN, "")
-        )
+        catalog = rules.get_catalog(_session, SONAR_HOST, SONAR_TOKEN)
+        index = catalog["index"] if catalog else None
+        eco_rules = catalog["eco_rules"] if catalog else []
         
-        if response.status_code != 200:
-            raise Exception(f"Erreur API SonarQube: {response.status_code} - {response.text}")
-        
-        all_issues = response.json()
+        if eco_rules and len(eco_rules) <= rules.SONAR_RULES_FILTER_MAX:
+            # Seules les issues des règles eco transitent ; le total du projet vient d'une page d'un élément, en parallèle
+            counting = _count_pool.submit(contextvars.copy_context().run, _search_issues, {"componentKeys": project_key, "ps": 1})
+            all_issues = _search_issues({"componentKeys": project_key, "rules": ",".join(eco_rules), "ps": 500})
+            counted = counting.result()
+            total = counted.get("paging", {}).get("total", counted.get("total", 0))
+        else:
+            all_issues = _search_issues({"componentKeys": project_key, "ps": 500})
+            total = len(all_issues.get("issues", []))
         
         eco_issues = []
         for issue in all_issues.get("issues", []):
-            rule_key = issue.get("rule", "")
-            
-            is_eco = (
-                rule_key in eco_rules or
-                any(keyword in issue.get("message", "").lower() 
-                    for keyword in ["performance", "memory", "cpu", "complexity", "unused", "duplicate"])
-            )
-            
-            if is_eco:
-                eco_issues.append(issue)
+            category = rules.classify(issue, index)
+            if category:
+                eco_issues.append({**issue, "eco_category": category})
         
         return {
-            "total_issues": len(all_issues.get("issues", [])),
+            "total_issues": total,
             "eco_issues": len(eco_issues),
             "issues": eco_issues,
-            "project_key": project_key
+            "project_key": project_key,
+            "rule_catalog": {
+                "rules": len(index) if index else 0,
+                "eco_rules": len(eco_rules),
+                "fetched_at": catalog["fetched_at"] if catalog else None,
+            },
         }
         
     except Exception as e:
@@ -114,6 +148,7 @@ def calculate_eco_score(issues_data: Dict) -> Dict:
             "line": line,
             "severity": severity,
             "eco_impact": impact,
+            "eco_category": issue.get("eco_category"),
             "component": issue.get("component", "")
         })
     
@@ -6,11 +6,18 @@ import tempfile
 import zipfile
 from pathlib import Path
 import json
+import logging
 import re
 from uuid import uuid4
+from typing import List
 import asyncssh
 import os
 from dotenv import load_dotenv
+from services.progress import report_stage
+from services.metrics import track_stage
+from services.cancellation import CANCELLATIONS_TOTAL, run_blocking
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
@@ -25,9 +32,25 @@ if os.getenv("SSH_KEY_PATH"):
     SSH_CONFIG["client_keys"] = [os.getenv("SSH_KEY_PATH")]
     SSH_CONFIG.pop("password", None)
 
+# Fichier known_hosts alternatif, ou "none" pour désactiver la vérification (serveur SSH de test local)
+if os.getenv("SSH_KNOWN_HOSTS"):
+    SSH_CONFIG["known_hosts"] = None if os.getenv("SSH_KNOWN_HOSTS") == "none" else os.getenv("SSH_KNOWN_HOSTS")
+
 SONAR_HOST = os.getenv("SONAR_HOST", "https://ollama.lambdah.ovh") 
 SONAR_TOKEN = os.getenv("SONAR_TOKEN")
 
+_ssh_conn = None
+_ssh_lock = asyncio.Lock()
+
+
+async def get_ssh_connection() -> asyncssh.SSHClientConnection:
+    """Connexion SSH partagée entre les analyses, rouverte si le serveur l'a fermée"""
+    global _ssh_conn
+    async with _ssh_lock:
+        if _ssh_conn is None or _ssh_conn.is_closed():
+            _ssh_conn = await asyncssh.connect(**SSH_CONFIG)
+        return _ssh_conn
+
 
 async def analyze_code_via_ssh(code: str, filename: str = "analysis.py") -> dict:
     """Analyse SonarQube en uploadant le code vers le serveur SSH"""
@@ -61,63 +84,143 @@ sonar.scanner.skipSystemTruststore=true
         return await execute_remote_analysis(archive_path, project_key, filename)
 
 
+async def analyze_batch_via_ssh(items: List[dict]) -> dict:
+    """Analyse SonarQube de plusieurs fichiers en un seul projet : un envoi, un scan, un polling"""
+    
+    with tempfile.TemporaryDirectory() as local_temp:
+        local_path = Path(local_temp)
+        project_dir = local_path / "project"
+        project_dir.mkdir()
+        # Un répertoire par élément : les noms de fichiers peuvent se répéter dans un lot
+        for index, item in enumerate(items):
+            item_dir = project_dir / f"item_{index}"
+            item_dir.mkdir()
+            (item_dir / Path(item["filename"]).name).write_text(item["code"])
+        
+        project_key = f"batch_analysis_{uuid4().hex[:8]}"
+        sonar_props = f"""sonar.projectKey={project_key}
+sonar.projectName=batch_{len(items)}_files
+sonar.projectVersion=1.0
+sonar.sources=.
+sonar.python.file.suffixes=.py
+sonar.python.version=3.8,3.9,3.10,3.11
+sonar.inclusions=**/*.py
+sonar.scm.disabled=true
+sonar.scanner.skipSystemTruststore=true
+"""
+        (project_dir / "sonar-project.properties").write_text(sonar_props)
+        
+        archive_path = local_path / "project.zip"
+        with zipfile.ZipFile(archive_path, 'w') as zf:
+            for file in project_dir.rglob("*"):
+                if file.is_file():
+                    zf.write(file, file.relative_to(project_dir))
+    
+        result = await execute_remote_analysis(archive_path, project_key, f"lot de {len(items)} fichiers")
+    
+    if "error" in result:
+        return result
+    issues = result["issues"]
+    if "error" in issues:
+        return {"error": issues["error"]}
+    
+    per_item = [[] for _ in items]
+    for issue in issues.get("issues", []):
+        match = re.search(r":item_(\d+)/", issue.get("component", ""))
+        if match and int(match.group(1)) < len(items):
+            per_item[int(match.group(1))].append(issue)
+    
+    return {
+        "project_key": project_key,
+        "task_id": result["task_id"],
+        "total_issues": issues.get("total_issues", 0),
+        "items": [
+            {"filename": item["filename"], "issues": per_item[index]}
+            for index, item in enumerate(items)
+        ],
+        "analysis_method": "ssh_remote_batch",
+    }
+
+
+async def _run_scanner(conn: asyncssh.SSHClientConnection, remote_dir: str) -> asyncssh.SSHCompletedProcess:
+    """sonar-scanner dans sa propre session distante : une annulation tue tout son groupe (script + JVM)"""
+    pid_file = f"{remote_dir}.pid"
+    scanner = f"sonar-scanner -Dsonar.host.url={SONAR_HOST} -Dsonar.token={SONAR_TOKEN} -Dsonar.log.level=DEBUG -X"
+    process = await conn.create_process(f"cd {remote_dir} && exec setsid -w sh -c 'echo $$ > {pid_file}; exec {scanner}'")
+    try:
+        return await process.wait()
+    except asyncio.CancelledError:
+        CANCELLATIONS_TOTAL.inc("scanner")
+        await asyncio.shield(_kill_remote(conn, process, pid_file))
+        raise
+
+
+async def _kill_remote(conn: asyncssh.SSHClientConnection, process: asyncssh.SSHClientProcess, pid_file: str):
+    try:
+        process.send_signal("TERM")
+    except (OSError, asyncssh.Error):
+        pass
+    try:
+        # Les serveurs SSH ignorent souvent les signaux de canal : kill explicite du groupe de processus
+        await asyncio.wait_for(conn.run(f"[ -f {pid_file} ] && kill -TERM -$(cat {pid_file})"), timeout=10)
+    except (OSError, asyncssh.Error, asyncio.TimeoutError) as e:
+        logger.warning("Arrêt du scanner distant impossible : %s", e)
+    process.close()
+
+
 async def execute_remote_analysis(archive_path: Path, project_key: str, filename: str) -> dict:
     """Exécute l'analyse sur le serveur distant"""
+    if not SONAR_TOKEN:
+        return {"filename": filename, "error": "SONAR_TOKEN non défini : analyse SonarQube ignorée"}
+    conn = await get_ssh_connection()
+    remote_archive = f"/tmp/sonar_{uuid4().hex}.zip"
+    remote_dir = f"/tmp/sonar_project_{uuid4().hex}"
     try:
-        async with asyncssh.connect(**SSH_CONFIG) as conn:
-            remote_archive = f"/tmp/sonar_{uuid4().hex}.zip"
-            remote_dir = f"/tmp/sonar_project_{uuid4().hex}"
-            
-            cleanup_result = await conn.run(f"rm -rf {remote_dir}")
-            
+        await report_stage("upload", f"Envoi SFTP de {filename}")
+        with track_stage("sftp_upload"):
             async with conn.start_sftp_client() as sftp:
                 await sftp.put(str(archive_path), remote_archive)
-            
-            decompress_cmd = f"mkdir -p {remote_dir} && cd {remote_dir} && unzip -q {remote_archive}"
-            result = await conn.run(decompress_cmd)
-            if result.exit_status != 0:
-                raise RuntimeError(f"Décompression échouée: {result.stderr}")
-            
-            sonar_cmd = f"""
-                cd {remote_dir} && 
-                sonar-scanner \
-                    -Dsonar.host.url={SONAR_HOST} \
-                    -Dsonar.token={SONAR_TOKEN} \
-                    -Dsonar.log.level=DEBUG \
-                    -X
-            """
-            result = await conn.run(sonar_cmd)
-            
-            if result.exit_status != 0:
-                return {
-                    "filename": filename,
-                    "error": "SonarQube analysis failed",
-                    "exit_code": result.exit_status,
-                    "stderr": result.stderr,
-                    "stdout": result.stdout
-                }
-            
-            match = re.search(r"ce/task\?id=([\w-]+)", result.stdout)
-            if not match:
-                raise RuntimeError("Impossible de récupérer le taskId")
-            
-            task_id = match.group(1)
-            
-            from .sonar import wait_for_task, get_sonar_issues
-            status = await wait_for_task(task_id)
-            issues = get_sonar_issues(project_key)
-            
+        
+        decompress_cmd = f"mkdir -p {remote_dir} && cd {remote_dir} && unzip -q {remote_archive}"
+        result = await conn.run(decompress_cmd)
+        if result.exit_status != 0:
+            raise RuntimeError(f"Décompression échouée: {result.stderr}")
+        
+        await report_stage("scanner", "Exécution de sonar-scanner")
+        with track_stage("sonar_scanner"):
+            result = await _run_scanner(conn, remote_dir)
+        
+        if result.exit_status != 0:
             return {
                 "filename": filename,
-                "project_key": project_key,
-                "issues": issues,
-                "task_id": task_id,
-                "analysis_method": "ssh_remote"
+                "error": "SonarQube analysis failed",
+                "exit_code": result.exit_status,
+                "stderr": result.stderr,
+                "stdout": result.stdout
             }
-                
+        
+        match = re.search(r"ce/task\?id=([\w-]+)", result.stdout)
+        if not match:
+            raise RuntimeError("Impossible de récupérer le taskId")
+        
+        task_id = match.group(1)
+        
+        from .sonar import wait_for_task, get_sonar_issues
+        with track_stage("task_polling"):
+            status = await wait_for_task(task_id)
+        await report_stage("issues", "Récupération des issues")
+        issues = await run_blocking(get_sonar_issues, project_key)
+        
+        return {
+            "filename": filename,
+            "project_key": project_key,
+            "issues": issues,
+            "task_id": task_id,
+            "analysis_method": "ssh_remote"
+        }
+
     finally:
-        async with asyncssh.connect(**SSH_CONFIG) as conn:
-            await conn.run(f"rm -f {remote_archive} && rm -rf {remote_dir}")
+        await conn.run(f"rm -f {remote_archive} {remote_dir}.pid && rm -rf {remote_dir}")
 
 
 async def analyze_code_rsync(code: str, filename: str = "analysis.py") -> dict:
@@ -144,6 +247,8 @@ sonar.inclusions={filename}
             f"{SSH_CONFIG['username']}@{SSH_CONFIG['host']}:{remote_path}/"
         ]
         
+        if not SONAR_TOKEN:
+            return {"error": "SONAR_TOKEN non défini : analyse SonarQube ignorée"}
         import subprocess
         result = subprocess.run(rsync_cmd, capture_output=True, text=True)
         if result.returncode != 0:
@@ -160,29 +265,45 @@ sonar.inclusions={filename}
             if match:
                 task_id = match.group(1)
                 from .sonar import wait_for_task, get_sonar_issues
-                status = await wait_for_task(task_id)
-                if status == "SUCCESS":
-                    issues = await get_sonar_issues(project_key)
+                if await wait_for_task(task_id):
+                    issues = await run_blocking(get_sonar_issues, project_key)
                     return {"filename": filename, "issues": issues}
             
             return {"error": "Analysis failed", "output": result.stdout}
 
 
-async def submit_code(code: str):    
+async def submit_code(code: str, filename: str = "analysis.py"):
+    # Seul le nom de base est envoyé : pas de chemin qui sortirait du projet temporaire
+    filename = Path(filename).name or "analysis.py"
     try:
-        result = await analyze_code_via_ssh(code, "test_security_issues.py")
+        result = await analyze_code_via_ssh(code, filename)
         if "error" in result:
-            result = await analyze_code_rsync(code, "test_security_issues.py")
+            result = await analyze_code_rsync(code, filename)
         return result.get("issues", [])
     except Exception as e:
         import traceback
         traceback.print_exc()
 
 
+async def submit_batch_safe(items: List[dict]) -> dict:
+    """Wrapper autour de analyze_batch_via_ssh : renvoie toujours un élément (éventuellement vide) par fichier"""
+    try:
+        result = await analyze_batch_via_ssh(items)
+        if "error" not in result:
+            return result
+        error = result["error"]
+    except Exception as e:
+        error = f"SonarQube batch analysis failed: {str(e)}"
+    return {
+        "error": error,
+        "items": [{"filename": item["filename"], "issues": []} for item in items],
+    }
+
+
 async def submit_code_safe(code: str, filename: str = "analysis.py") -> dict:
     """Wrapper autour de submit_code pour toujours renvoyer un dict"""
     try:
-        result = await submit_code(code)
+        result = await submit_code(code, filename)
         if not isinstance(result, dict):
             return {"error": "SonarQube analysis returned no result"}
         result.setdefault("issues", [])
@@ -0,0 +1,74 @@
+"""
+Préchauffage optionnel en arrière-plan, lancé une fois le port HTTP ouvert (ECOCODE_WARMUP=1)
+"""
+import asyncio
+import importlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ECOCODE_WARMUP = os.getenv("ECOCODE_WARMUP", "0") == "1"
+
+WARMUP_MODULES = (
+    "services.carbon.carbon_analyzer",
+    "services.sonarqube.sonar_analyzer",
+    "services.sonarqube.sonar",
+    "services.github.main",
+    "numpy",
+    "services.workspaces",
+    "requests",
+    "asyncssh",
+)
+
+
+def warmup_imports() -> dict:
+    """Importe les modules lourds et renvoie le temps passé sur chacun (ms)"""
+    timings = {}
+    for name in WARMUP_MODULES:
+        started = time.perf_counter()
+        try:
+            module = importlib.import_module(name)
+            # Force l'exécution des modules enregistrés par lazy_import
+            getattr(module, "__name__", None)
+            dir(module)
+        except Exception as e:
+            timings[name] = f"échec : {e}"
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+
+async def warmup() -> dict:
+    """Imports, modèle énergétique, workers de travaux, connexions SSH et HTTP"""
+    report = {"imports_ms": await asyncio.to_thread(warmup_imports)}
+
+    from services.jobs import job_manager
+    job_manager.start()
+
+    from services.carbon.energy_model import MODEL_BACKENDS, get_model
+    models = {backend: await asyncio.to_thread(get_model, backend) for backend in MODEL_BACKENDS}
+    report["energy_model_samples"] = {backend: model.samples for backend, model in models.items()}
+
+    from services.sonarqube import sonar, sonar_analyzer
+    try:
+        await asyncio.wait_for(sonar_analyzer.get_ssh_connection(), timeout=10)
+        report["ssh"] = "connected"
+    except Exception as e:
+        report["ssh"] = f"indisponible : {e}"
+    try:
+        await asyncio.to_thread(sonar.http_session().get, f"{sonar.SONAR_HOST}/api/server/version", timeout=5)
+        report["sonar_http"] = "connected"
+    except Exception as e:
+        report["sonar_http"] = f"indisponible : {e}"
+    return report
+
+
+async def warmup_after_start(server):
+    """Attend que uvicorn ait ouvert le port, puis préchauffe sans bloquer les premières requêtes"""
+    while not server.started:
+        await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    report = await warmup()
+    logger.info("Préchauffage terminé en %.2fs : %s", time.perf_counter() - started, report)
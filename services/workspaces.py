@@ -0,0 +1,321 @@
+"""
+Copies de travail des repositories analysés : une copie isolée par repository@commit, partagée par tous les outils
+Chaque utilisation tient un verrou partagé (flock) sur la copie : le noyau compte les références, y compris
+entre workers. Une copie sans référence est évincée après WORKSPACE_TTL d'inactivité ou, des moins
+récemment utilisées aux plus récentes, dès que le total dépasse WORKSPACE_MAX_MB.
+Les copies sont en lecture seule pour les outils : rien n'y est écrit après le clone.
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+from services.cancellation import CANCELLATIONS_TOTAL, cancelled, on_cancel, remaining, run_blocking
+from services.metrics import Counter, Gauge, REGISTRY, track_stage
+
+WORKSPACE_DIR = Path(os.path.expanduser(os.getenv("WORKSPACE_DIR", "~/.cache/ecocode/workspaces")))
+WORKSPACE_TTL = int(os.getenv("WORKSPACE_TTL", "3600"))
+WORKSPACE_MAX_MB = int(os.getenv("WORKSPACE_MAX_MB", "4096"))
+GIT_TIMEOUT = int(os.getenv("GIT_TIMEOUT", "300"))
+
+WORKSPACES_TOTAL = Counter(
+    "ecocode_workspaces_total",
+    "Copies de travail demandées (reused : déjà clonée, cloned : nouveau clone) et évincées (ttl, quota)",
+    ("outcome",),
+)
+WORKSPACES_LEASED = Gauge("ecocode_workspaces_leased", "Copies de travail en cours d'utilisation dans ce worker")
+REGISTRY.extend([WORKSPACES_TOTAL, WORKSPACES_LEASED])
+
+_SHA = re.compile(r"^[0-9a-f]{7,40}$")
+_GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+
+class WorkspaceError(Exception):
+    pass
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _git(*args, cwd: Optional[Path] = None) -> str:
+    """git dans sa propre session : timeout, échéance de l'appel ou annulation tuent aussi git-remote-https"""
+    if cancelled():
+        raise WorkspaceError(f"git {args[0]} : annulé")
+    timeout = remaining(GIT_TIMEOUT)
+    proc = subprocess.Popen(["git", *args], cwd=cwd, env=_GIT_ENV, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, start_new_session=True)
+
+    def on_cancelled():
+        CANCELLATIONS_TOTAL.inc("git")
+        _kill_group(proc.pid)
+
+    try:
+        with on_cancel(on_cancelled):
+            stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc.pid)
+        proc.communicate()
+        raise WorkspaceError(f"git {args[0]} : timeout après {timeout:.1f}s")
+    if cancelled():
+        raise WorkspaceError(f"git {args[0]} : annulé")
+    if proc.returncode != 0:
+        raise WorkspaceError(f"git {args[0]} : {stderr.strip().splitlines()[-1] if stderr.strip() else proc.returncode}")
+    return stdout.strip()
+
+
+def repo_key(repo_url: str) -> str:
+    """Nom de dossier stable : nom court du repo + empreinte de l'URL (deux repos homonymes ne se mélangent pas)"""
+    url = repo_url.strip().rstrip("/")
+    if url.endswith(".git"):
+        url = url[:-4]
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", url.split("/")[-1]) or "repo"
+    return f"{name}-{hashlib.sha256(url.lower().encode()).hexdigest()[:12]}"
+
+
+def resolve_commit(repo_url: str, ref: str = "HEAD") -> Optional[str]:
+    """SHA distant de ref sans rien télécharger (None si le serveur ne répond pas)"""
+    try:
+        out = _git("ls-remote", repo_url, ref)
+    except WorkspaceError:
+        return None
+    return out.split()[0] if out else None
+
+
+def _open_lock(path: Path, flags: int) -> Optional[int]:
+    """Descripteur verrouillé sur le fichier de verrou actuel (un fichier supprimé par une éviction est rouvert)"""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _read_meta(path: Path) -> Optional[dict]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(path: Path, meta: dict):
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, path)
+
+
+def _disk_usage(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _clone(repo_url: str, commit: Optional[str], target: Path) -> str:
+    """Clone superficiel de HEAD ou du commit demandé ; renvoie le SHA extrait"""
+    if commit is None:
+        _git("clone", "--depth", "1", "--quiet", repo_url, str(target))
+    else:
+        target.mkdir(parents=True)
+        _git("init", "--quiet", cwd=target)
+        _git("remote", "add", "origin", repo_url, cwd=target)
+        try:
+            _git("fetch", "--depth", "1", "--quiet", "origin", commit, cwd=target)
+        except WorkspaceError:
+            # SHA abrégé ou serveur refusant les fetch par SHA : historique complet
+            _git("fetch", "--quiet", "origin", cwd=target)
+            _git("checkout", "--quiet", "--detach", commit, cwd=target)
+        else:
+            _git("checkout", "--quiet", "--detach", "FETCH_HEAD", cwd=target)
+    return _git("rev-parse", "HEAD", cwd=target)
+
+
+def _remove(name: str) -> bool:
+    """Supprime une copie si personne ne la tient (verrou exclusif non bloquant)"""
+    lock_path = WORKSPACE_DIR / f"{name}.lock"
+    fd = _open_lock(lock_path, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    if fd is None:
+        return False
+    try:
+        # Métadonnées d'abord : la copie cesse d'être considérée comme prête avant d'être effacée
+        (WORKSPACE_DIR / f"{name}.json").unlink(missing_ok=True)
+        shutil.rmtree(WORKSPACE_DIR / name, ignore_errors=True)
+        lock_path.unlink(missing_ok=True)
+        (WORKSPACE_DIR / f"{name}.clone-lock").unlink(missing_ok=True)
+    finally:
+        os.close(fd)
+    return True
+
+
+def evict(now: Optional[float] = None, force: bool = False) -> dict:
+    """Évince les copies inactives au-delà du TTL puis, si besoin, les moins récemment utilisées jusqu'au quota"""
+    global _last_evict
+    now = now or time.time()
+    with _evict_lock:
+        if not force and now - _last_evict < 60:
+            return {"evicted": 0}
+        _last_evict = now
+    try:
+        metas = [(p.stem, _read_meta(p)) for p in WORKSPACE_DIR.glob("*.json")]
+    except OSError:
+        return {"evicted": 0}
+    metas = sorted(((name, meta) for name, meta in metas if meta), key=lambda item: item[1]["last_used"])
+    total = sum(meta["size_bytes"] for _, meta in metas)
+    quota = WORKSPACE_MAX_MB * 1024 * 1024
+    evicted = 0
+    for name, meta in metas:
+        reason = "ttl" if now - meta["last_used"] > WORKSPACE_TTL else "quota" if total > quota else None
+        if reason is None:
+            break
+        if _remove(name):
+            total -= meta["size_bytes"]
+            evicted += 1
+            WORKSPACES_TOTAL.inc(reason)
+    # Clones interrompus (worker tué pendant le clone)
+    for tmp in WORKSPACE_DIR.glob("*.tmp-*"):
+        try:
+            if now - tmp.stat().st_mtime > GIT_TIMEOUT * 2:
+                shutil.rmtree(tmp, ignore_errors=True)
+        except OSError:
+            pass
+    return {"evicted": evicted, "size_mb": round(total / 1024 / 1024, 1)}
+
+
+def _known_commit(base: str, prefix: str) -> Optional[str]:
+    """SHA complet d'une copie existante dont le commit commence par prefix"""
+    for meta_path in WORKSPACE_DIR.glob(f"{base}@*.json"):
+        meta = _read_meta(meta_path)
+        if meta and meta["commit"].startswith(prefix):
+            return meta["commit"]
+    return None
+
+
+def _acquire(repo_url: str, commit: Optional[str]) -> dict:
+    WORKSPACE_DIR.mkdir(parents=True, exist_ok=True)
+    evict()
+    commit = commit.lower() if commit else resolve_commit(repo_url)
+    if commit is not None and not _SHA.match(commit):
+        raise WorkspaceError(f"Commit invalide : {commit}")
+    base = repo_key(repo_url)
+    if commit is not None and len(commit) < 40:
+        commit = _known_commit(base, commit) or commit
+
+    tmp = None
+    if commit is None or len(commit) < 40:
+        # Serveur injoignable par ls-remote ou SHA abrégé : le clone dira quel commit est extrait
+        tmp = WORKSPACE_DIR / f"{base}.tmp-{uuid4().hex[:8]}"
+        with track_stage("clone"):
+            commit = _clone(repo_url, commit, tmp)
+    name = f"{base}@{commit[:12]}"
+
+    fd = _open_lock(WORKSPACE_DIR / f"{name}.lock", fcntl.LOCK_SH)
+    try:
+        meta_path, path = WORKSPACE_DIR / f"{name}.json", WORKSPACE_DIR / name
+        meta = _read_meta(meta_path) if path.is_dir() else None
+        reused = meta is not None
+        if meta is None:
+            with _creation_lock(name):
+                meta = _read_meta(meta_path) if path.is_dir() else None
+                reused = meta is not None
+                if meta is None:
+                    if tmp is None:
+                        tmp = WORKSPACE_DIR / f"{base}.tmp-{uuid4().hex[:8]}"
+                        with track_stage("clone"):
+                            commit = _clone(repo_url, commit, tmp)
+                    shutil.rmtree(path, ignore_errors=True)
+                    os.replace(tmp, path)
+                    tmp = None
+                    meta = {"repo_url": repo_url, "commit": commit, "size_bytes": _disk_usage(path), "created_at": time.time()}
+                    # Écrites sous le verrou de création : le suivant voit la copie prête au lieu de recloner
+                    meta["last_used"] = time.time()
+                    _write_meta(meta_path, meta)
+        if reused:
+            meta["last_used"] = time.time()
+            _write_meta(meta_path, meta)
+    except BaseException:
+        os.close(fd)
+        raise
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    WORKSPACES_TOTAL.inc("reused" if reused else "cloned")
+    if not reused:
+        evict(force=True)
+    return {"fd": fd, "name": name, "path": path, "repo_url": repo_url, "commit": meta["commit"], "reused": reused}
+
+
+@contextmanager
+def _creation_lock(name: str):
+    fd = _open_lock(WORKSPACE_DIR / f"{name}.clone-lock", fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        os.close(fd)
+
+
+def _release(workspace: dict):
+    meta_path = WORKSPACE_DIR / f"{workspace['name']}.json"
+    meta = _read_meta(meta_path)
+    if meta is not None:
+        meta["last_used"] = time.time()
+        try:
+            _write_meta(meta_path, meta)
+        except OSError:
+            pass
+    os.close(workspace["fd"])
+
+
+def _public(workspace: dict) -> dict:
+    return {key: workspace[key] for key in ("name", "path", "repo_url", "commit", "reused")}
+
+
+@contextmanager
+def checkout(repo_url: str, commit: Optional[str] = None):
+    """Copie de travail de repo_url@commit (HEAD distant par défaut), tenue jusqu'à la sortie du bloc"""
+    workspace = _acquire(repo_url, commit)
+    WORKSPACES_LEASED.inc()
+    try:
+        yield _public(workspace)
+    finally:
+        WORKSPACES_LEASED.dec()
+        _release(workspace)
+
+
+@asynccontextmanager
+async def checkout_async(repo_url: str, commit: Optional[str] = None):
+    """Équivalent asynchrone de checkout : clone et verrous dans un thread, git tué si la tâche est annulée"""
+    workspace = await run_blocking(_acquire, repo_url, commit, release=_release)
+    WORKSPACES_LEASED.inc()
+    try:
+        yield _public(workspace)
+    finally:
+        WORKSPACES_LEASED.dec()
+        await asyncio.to_thread(_release, workspace)
@@ -0,0 +1,81 @@
+"""
+Sorties bornées : troncature tête + queue, artefact de la sortie complète et plafond ARTIFACT_MAX_MB
+"""
+import pytest
+
+from services import artifacts
+from services.artifacts import OutputCapture
+
+
+@pytest.fixture(autouse=True)
+def artifact_dir(monkeypatch, tmp_path):
+    path = tmp_path / "artifacts"
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", path)
+    return path
+
+
+def _stream(capture: OutputCapture, data: bytes, chunk_size: int = 7) -> OutputCapture:
+    for i in range(0, len(data), chunk_size):
+        capture.write(data[i:i + chunk_size])
+    capture.close()
+    return capture
+
+
+def test_small_output_is_kept_inline(artifact_dir):
+    capture = _stream(OutputCapture("stdout", head_bytes=16, tail_bytes=16), b"hello\n")
+    assert capture.text() == "hello\n"
+    assert capture.summary() == {"bytes": 6, "truncated": False, "omitted_bytes": 0, "artifact_id": None,
+                                 "artifact_complete": False}
+    assert not artifact_dir.exists()
+
+
+def test_long_output_keeps_head_and_tail_and_spills_everything(artifact_dir):
+    data = b"".join(f"{i:04d}\n".encode() for i in range(200))
+    capture = _stream(OutputCapture("stdout", head_bytes=20, tail_bytes=30), data)
+    summary = capture.summary()
+    assert summary["bytes"] == len(data)
+    assert summary["truncated"] and summary["omitted_bytes"] == len(data) - 50
+    assert summary["artifact_complete"]
+    text = capture.text()
+    assert text.startswith(data[:20].decode())
+    assert text.endswith(data[-30:].decode())
+    assert f"{len(data) - 50} octets omis sur {len(data)}" in text
+    assert capture.artifact_id in text
+    assert artifacts.artifact_path(capture.artifact_id).read_bytes() == data
+
+
+def test_artifact_is_capped_at_max_bytes(artifact_dir):
+    data = b"x" * 1000
+    capture = _stream(OutputCapture("stdout", head_bytes=10, tail_bytes=10, max_bytes=300), data, chunk_size=64)
+    assert artifacts.artifact_path(capture.artifact_id).stat().st_size == 300
+    assert capture.artifact_bytes == 300
+    assert not capture.summary()["artifact_complete"]
+    assert capture.summary()["omitted_bytes"] == 980
+
+
+def test_default_cap_follows_artifact_max_mb(monkeypatch):
+    monkeypatch.setattr(artifacts, "ARTIFACT_MAX_MB", 3)
+    assert OutputCapture().max_bytes == 3 * 1024 * 1024
+
+
+def test_unwritable_artifact_dir_still_truncates(monkeypatch, tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", blocker)
+    capture = _stream(OutputCapture("stdout", head_bytes=4, tail_bytes=4), b"0123456789abcdef")
+    assert capture.artifact_id is None
+    assert "sortie complète indisponible" in capture.text()
+    assert capture.text().startswith("0123") and capture.text().endswith("cdef")
+
+
+def test_artifact_pages_and_bounded_resource(monkeypatch):
+    artifact_id = artifacts.save_artifact("stdout", "a" * 3000)
+    assert artifacts.save_artifact("stdout", "a" * 3000) == artifact_id
+    page = artifacts.read_artifact(artifact_id, offset=1000, limit=1500)
+    assert page["size"] == 3000 and len(page["content"]) == 1500 and page["next_offset"] == 2500
+    assert artifacts.read_artifact(artifact_id, offset=2500)["next_offset"] is None
+    monkeypatch.setattr(artifacts, "ARTIFACT_RESOURCE_MAX_KB", 1)
+    resource = artifacts.read_resource(artifact_id)
+    assert resource.startswith("a" * 1024)
+    assert f"{3000 - 1024} octets restants" in resource
+    assert artifacts.read_artifact("../etc/passwd")["status"] == "error"
@@ -0,0 +1,71 @@
+"""
+Analyse par lot : budget CPU et durée propres à chaque fichier, relance après un runner tué, fichiers non mesurés
+exclus du scoring
+"""
+import asyncio
+
+import pytest
+
+import main
+from services.carbon import carbon_analyzer
+from services.carbon.sandbox import sandbox_limits
+
+OK = "print('ok')\n"
+
+
+@pytest.fixture(autouse=True)
+def samples(monkeypatch):
+    """Échantillons du modèle énergétique enregistrés pendant le test (aucun écrit sur disque)"""
+    recorded = []
+    monkeypatch.setattr(carbon_analyzer, "record_sample", lambda features, carbon: recorded.append(carbon))
+    return recorded
+
+
+def _batch(codes: list, **limits) -> list:
+    items = [{"code": code, "filename": f"file_{i}.py"} for i, code in enumerate(codes)]
+    return asyncio.run(carbon_analyzer.analyze_carbon_batch(
+        items, backend="direct", workers=1, limits=sandbox_limits(**{"cpu_seconds": 1, "wall_seconds": 2, **limits}),
+    ))
+
+
+def test_each_item_has_its_own_budget(samples):
+    results = _batch([OK, "while True:\n    pass\n", "import time\ntime.sleep(30)\n", OK])
+    usages = [result["resource_usage"] for result in results]
+    assert [usage["termination"] for usage in usages] == [None, "cpu_limit", "wall_timeout", None]
+    # Le runner survit aux fichiers interrompus : le dernier est mesuré dans le même interpréteur
+    assert {usage["runner_attempt"] for usage in usages} == {0}
+    assert usages[0]["item_limits"] == {"cpu_seconds": 1, "wall_seconds": 2}
+    assert results[1]["error"] == "Mesure impossible : budget CPU du fichier dépassé"
+    assert results[1]["resource_usage"]["item_cpu_s"] < 3
+    assert results[3]["execution_output"] == "ok\n"
+    assert "error" not in results[3]
+    assert len(samples) == 2
+
+
+def test_items_after_a_dead_runner_are_rerun():
+    results = _batch([OK, "import os\nprint('bye')\nos._exit(3)\n", OK])
+    assert [result["resource_usage"]["termination"] for result in results] == [None, "runner_exit", None]
+    assert results[1]["error"] == "Mesure impossible : le fichier a terminé l'interpréteur"
+    assert results[1]["carbon_impact"]["energy_kwh"] == 0
+    assert results[2]["resource_usage"]["runner_attempt"] == 1
+    assert results[2]["execution_output"] == "ok\n"
+
+
+def test_runner_that_cannot_start_runs_nothing(samples):
+    results = _batch([OK, OK], memory_mb=8)
+    assert [result["resource_usage"]["termination"] for result in results] == ["not_run", "not_run"]
+    assert all(result["error"].startswith("Mesure impossible : runner du lot arrêté") for result in results)
+    assert samples == []
+
+
+def test_failed_items_are_not_scored(monkeypatch):
+    real_limits = sandbox_limits
+    monkeypatch.setattr(carbon_analyzer, "sandbox_limits", lambda: real_limits(cpu_seconds=1, wall_seconds=2))
+    monkeypatch.setattr(main, "record_analysis", lambda *args, **kwargs: None)
+    items = [{"code": OK, "filename": "ok.py"}, {"code": "while True:\n    pass\n", "filename": "loop.py"}]
+    result = asyncio.run(main.run_batch_eco_analysis(items, include_sonar=False))
+    aggregate = result["aggregate"]
+    assert aggregate["files_measured"] == 1 and aggregate["files_failed"] == 1
+    assert sum(aggregate["grades"].values()) == 1
+    assert aggregate["mean_score"] == result["items"][0]["eco_score"]["score"]
+    assert result["items"][1]["eco_score"] == {"error": "Mesure impossible : budget CPU du fichier dépassé"}
@@ -0,0 +1,165 @@
+"""
+Annulation en cours de mesure : groupe de processus tué, répertoires temporaires supprimés, créneau libéré
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+from services.cancellation import deadline
+from services.carbon.carbon_analyzer import analyze_carbon_batch
+from services.carbon.sandbox import run_sandboxed_async, sandbox_limits
+from services.jobs import JobManager
+from services.shared import SharedState
+from services.singleflight import SingleFlight
+
+# Le runner lance un petit-enfant dans son groupe, écrit les deux pid puis attend
+SPAWNER = textwrap.dedent("""
+    import os, subprocess, sys, time
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    with open("pids.tmp", "w") as f:
+        f.write(f"{os.getpid()} {child.pid}")
+    os.rename("pids.tmp", "pids")
+    time.sleep(60)
+""")
+
+
+def _alive(pid: int) -> bool:
+    """Vrai si le processus existe et n'est pas un zombie (le pid 1 du conteneur ne les récolte pas toujours)"""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except (FileNotFoundError, ProcessLookupError):
+        return False
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def _processes_mentioning(text: str) -> list:
+    """Processus vivants dont la ligne de commande contient text"""
+    pids = []
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit() or int(entry.name) == os.getpid():
+            continue
+        try:
+            cmdline = (entry / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        if text in cmdline and _alive(int(entry.name)):
+            pids.append(int(entry.name))
+    return pids
+
+
+async def _until(predicate, timeout: float = 15.0):
+    started = time.monotonic()
+    while not predicate():
+        assert time.monotonic() - started < timeout, "condition non atteinte"
+        await asyncio.sleep(0.05)
+
+
+async def _start_spawner(workdir: Path) -> tuple:
+    """Lance SPAWNER dans le sandbox ; renvoie la tâche et les pid (runner, petit-enfant) une fois démarrés"""
+    script = workdir / "spawner.py"
+    script.write_text(SPAWNER)
+    task = asyncio.create_task(run_sandboxed_async([sys.executable, str(script)], str(workdir), sandbox_limits()))
+    await _until(lambda: (workdir / "pids").exists())
+    return task, [int(pid) for pid in (workdir / "pids").read_text().split()]
+
+
+@pytest.fixture
+def temp_root(monkeypatch, tmp_path):
+    """Racine des répertoires temporaires créés par le code testé"""
+    root = tmp_path / "tmp"
+    root.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(root))
+    return root
+
+
+def test_cancelled_sandbox_kills_process_group(tmp_path):
+    async def scenario():
+        task, pids = await _start_spawner(tmp_path)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pids
+
+    pids = asyncio.run(scenario())
+    # run_blocking ne rend la main qu'après le retour du thread : le groupe est déjà tué
+    assert not any(_alive(pid) for pid in pids)
+
+
+def test_deadline_stops_sandbox_early(tmp_path):
+    async def scenario():
+        with deadline(0.5):
+            return await run_sandboxed_async([sys.executable, "-c", "import time; time.sleep(60)"], str(tmp_path))
+
+    started = time.monotonic()
+    result = asyncio.run(scenario())
+    assert result["resource_usage"]["termination"] == "wall_timeout"
+    assert time.monotonic() - started < 10
+
+
+def test_cancelled_batch_removes_runner_and_temp_dirs(temp_root):
+    items = [{"code": "while True:\n    pass\n", "filename": "loop.py"}, {"code": "print(1)\n", "filename": "ok.py"}]
+
+    async def scenario():
+        task = asyncio.create_task(analyze_carbon_batch(items, backend="direct", workers=2))
+        await _until(lambda: len(_processes_mentioning(str(temp_root))) == 2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert _processes_mentioning(str(temp_root)) == []
+    assert list(temp_root.iterdir()) == []
+
+
+def test_job_timeout_frees_worker_slot(tmp_path):
+    manager = JobManager(workers=1, queue_size=4, timeout=1)
+    (tmp_path / "first").mkdir()
+
+    async def hanging():
+        return await run_sandboxed_async([sys.executable, "-c", SPAWNER], str(tmp_path / "first"))
+
+    async def quick():
+        return {"done": True}
+
+    async def scenario():
+        first = manager.submit("test", hanging)["job_id"]
+        second = manager.submit("test", quick)["job_id"]
+        await _until(lambda: manager.status(second)["state"] == "done")
+        return manager.status(first), manager.result(second)
+
+    first, second = asyncio.run(scenario())
+    assert first["state"] == "failed" and "Timeout" in first["error"]
+    assert second["result"] == {"done": True}
+    pids = [int(pid) for pid in (tmp_path / "first" / "pids").read_text().split()]
+    assert not any(_alive(pid) for pid in pids)
+
+
+def test_cancelled_flight_releases_key(tmp_path):
+    state = SharedState(tmp_path / "shared.db")
+    flights = SingleFlight(state)
+
+    async def scenario():
+        pids = []
+
+        async def factory():
+            task, started = await _start_spawner(tmp_path)
+            pids.extend(started)
+            return await task
+
+        caller = asyncio.create_task(flights.do("carbon:test", factory))
+        await _until(lambda: bool(pids))
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await _until(lambda: flights.in_flight() == 0)
+        return pids
+
+    pids = asyncio.run(scenario())
+    assert not any(_alive(pid) for pid in pids)
+    assert state.poll("carbon:test") == ("released", None)
@@ -0,0 +1,56 @@
+"""
+Mesure différentielle A/B : test apparié, verdict et ordonnancement AB / BA dans le runner chaud
+"""
+import asyncio
+
+import pytest
+
+from services.carbon import differential
+from services.carbon.sandbox import sandbox_limits
+
+
+def test_paired_test_is_exact_for_small_samples():
+    test = differential.paired_test([10.0, 10.0, 10.0, 10.0], [9.0, 9.0, 9.0, 9.0])
+    assert test["delta"] == pytest.approx(-1.0)
+    assert test["delta_pct"] == -10.0
+    # 2 affectations de signes sur 2^4 atteignent |moyenne| = 1
+    assert test["p_value"] == 0.125
+    assert test["candidate_faster_pairs"] == 4
+    assert test["ci95"] == pytest.approx([-1.0, -1.0])
+
+
+def test_paired_test_without_baseline_energy():
+    test = differential.paired_test([0.0, 0.0], [1.0, 1.0])
+    assert test["delta_pct"] is None
+    assert test["delta"] == 1.0
+
+
+@pytest.mark.parametrize("p_value, delta, delta_pct, expected", [
+    (0.2, -1.0, -50.0, "no_significant_difference"),
+    (0.01, -0.01, -1.0, "negligible"),
+    (0.01, -1.0, -50.0, "improved"),
+    (0.01, 1.0, 50.0, "regressed"),
+    (0.01, 1.0, None, "regressed"),
+])
+def test_verdict(p_value, delta, delta_pct, expected):
+    assert differential.verdict({"p_value": p_value, "delta": delta, "delta_pct": delta_pct}, alpha=0.05) == expected
+
+
+def test_diff_alternates_versions_in_one_runner(monkeypatch):
+    monkeypatch.setattr(differential, "DIFF_WARMUP_ROUNDS", 1)
+    result = asyncio.run(differential.analyze_carbon_diff(
+        "print(sum(range(1000)))", "print(sum(range(10)))", rounds=2, backend="direct",
+        limits=sandbox_limits(cpu_seconds=10, wall_seconds=30),
+    ))
+    assert result["schedule"] == "ABBAAB"
+    assert result["pairs_measured"] == 2
+    assert result["interrupted_runs"] == 0
+    assert result["outputs_match"] is False
+    assert "warning" in result
+    assert set(result["metrics"]) == set(differential.METRICS)
+    assert result["verdict"] in ("improved", "regressed", "negligible", "no_significant_difference")
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(differential.analyze_carbon_diff("x = 1", "x = 2", backend="nope"))
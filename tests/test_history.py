@@ -0,0 +1,104 @@
+"""
+Historique des analyses : agrégats horaires, comptage des analyses et requêtes de tendance
+"""
+import time
+
+import pytest
+
+from services import history
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """Historique dans une base temporaire"""
+    monkeypatch.setattr(history, "HISTORY_ENABLED", True)
+    store = history.HistoryStore(tmp_path / "history.db")
+    monkeypatch.setattr(history, "store", store)
+    return store
+
+
+def _carbon(energy_kwh: float, complexity_score: float = 2.0) -> dict:
+    return {
+        "carbon_impact": {"energy_kwh": energy_kwh, "emissions_kg": energy_kwh / 2, "duration_s": 0.1, "backend": "direct"},
+        "complexity_analysis": {"complexity_score": complexity_score},
+    }
+
+
+def test_one_call_counts_as_one_analysis(store):
+    history.record_analysis("x = 1", "src/a.py", carbon=_carbon(1e-6), eco_score={"score": 80, "grade": "A"},
+                            repository="owner/repo", commit="abc")
+    store.flush()
+    points = history.trend("owner/repo", "src/a.py")["points"]
+    assert len(points) == 1
+    assert points[0]["analyses"] == 1
+    assert points[0]["measurements"] == 1
+    assert points[0]["energy_kwh"] == pytest.approx(1e-6)
+    assert points[0]["eco_score"] == 80
+
+
+def test_rollups_feed_file_repository_and_path(store):
+    history.record_analysis("x = 1", "src/a.py", carbon=_carbon(1e-6), repository="owner/repo")
+    history.record_analysis("y = 2", "src/b.py", carbon=_carbon(3e-6), repository="owner/repo")
+    store.flush()
+    repository = history.trend("owner/repo")["points"]
+    assert repository[0]["analyses"] == 2
+    assert repository[0]["energy_kwh"] == pytest.approx(2e-6)
+    assert history.trend(path="src/b.py")["points"][0]["energy_kwh"] == pytest.approx(3e-6)
+    assert history.trend("owner/other")["points"] == []
+
+
+def test_ad_hoc_code_is_keyed_by_content(store):
+    history.record_analysis("x = 1", "analysis.py", carbon=_carbon(1e-6))
+    history.record_analysis("y = 2", "analysis.py", carbon=_carbon(5e-6))
+    store.flush()
+    # Deux extraits sans rapport sous le nom par défaut ne forment pas une tendance commune
+    assert history.trend(path="analysis.py")["points"] == []
+    points = history.trend(code_hash=history.content_hash("y = 2"))["points"]
+    assert len(points) == 1
+    assert points[0]["analyses"] == 1
+    assert points[0]["energy_kwh"] == pytest.approx(5e-6)
+
+
+def test_version_query_counts_calls_not_rows(store):
+    code = "x = 1"
+    for _ in range(3):
+        history.record_analysis(code, "src/a.py", carbon=_carbon(1e-6), quality={"issues": []},
+                                repository="owner/repo")
+        time.sleep(0.001)
+    store.flush()
+    points = history.trend("owner/repo", "src/a.py", history.content_hash(code))["points"]
+    assert points[0]["analyses"] == 3
+    assert points[0]["sonar_issues"] == 0
+
+
+def test_trend_compares_first_and_last_period(store):
+    now = time.time()
+    store.add([
+        history._row("carbon", now - 2 * 86400, "src/a.py", "h", "owner/repo", None, energy_kwh=4e-6, emissions_kg=2e-6),
+        history._row("carbon", now - 86400, "src/a.py", "h", "owner/repo", None, energy_kwh=3e-6, emissions_kg=1.5e-6),
+        history._row("carbon", now, "src/a.py", "h", "owner/repo", None, energy_kwh=2e-6, emissions_kg=1e-6),
+    ])
+    store.flush()
+    result = history.trend("owner/repo", "src/a.py", days=3)
+    assert [p["energy_kwh"] for p in result["points"]] == pytest.approx([4e-6, 3e-6, 2e-6])
+    assert result["energy_trend"]["change_pct"] == -50.0
+    assert result["eco_score_trend"] is None
+    assert len(history.trend("owner/repo", "src/a.py", days=1.5)["points"]) == 2
+
+
+def test_rollup_counts_runs_once_per_call():
+    rows = [
+        history._row("carbon", 100.0, "a.py", "h", "owner/repo", None, energy_kwh=1.0, emissions_kg=0.5),
+        history._row("complexity", 100.0, "a.py", "h", "owner/repo", None, complexity_score=3.0),
+        history._row("carbon", 200.0, "a.py", "h", "owner/repo", None, energy_kwh=3.0, emissions_kg=1.5),
+    ]
+    rollups = {(repository, path, kind): (n, value_sum) for repository, path, kind, hour, n, value_sum, _ in history.rollup(rows)}
+    assert rollups[("owner/repo", "a.py", history.RUN_KIND)][0] == 2
+    assert rollups[("owner/repo", "a.py", "carbon")] == (2, 4.0)
+    assert rollups[("", "a.py", "complexity")] == (1, 3.0)
+    assert rollups[("owner/repo", "", history.RUN_KIND)][0] == 2
+
+
+def test_unknown_bucket_is_rejected(store):
+    with pytest.raises(ValueError):
+        history.trend("owner/repo", bucket="month")
@@ -0,0 +1,97 @@
+"""
+Client qlty contre le stub HTTP local : pagination, reprise sur 429/5xx et limite de requêtes simultanées
+"""
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+from benchmarks.stubs import StubServer, StubState
+from services.codeclimate import cache
+from services.codeclimate.api import client
+
+
+@pytest.fixture
+def qlty(monkeypatch, tmp_path):
+    """Démarre un stub configuré par StubState(**options) et y pointe le client, cache vide"""
+    monkeypatch.setattr(cache, "QLTY_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(cache, "_memory", {})
+    monkeypatch.setattr(client, "_client", None)
+    with contextlib.ExitStack() as stack:
+        def start(**options) -> StubState:
+            server = stack.enter_context(StubServer(StubState(**options)))
+            monkeypatch.setattr(client, "qlty_api_url", server.url)
+            return server.state
+        yield start
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Délais d'attente demandés par le client, sans attendre réellement"""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args, **kwargs):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(client.asyncio, "sleep", sleep)
+    return delays
+
+
+def test_collection_follows_every_page(qlty):
+    state = qlty(qlty_items=250, qlty_page_size=100)
+    body = asyncio.run(client.get_project_metrics("stub", "owner", "project"))
+    assert [item["id"] for item in body["data"]] == [f"m{i}" for i in range(250)]
+    assert body["pages"] == 3
+    assert "links" not in body
+    assert state.requests["qlty"] == 3
+
+
+def test_429_honours_retry_after(qlty, sleeps):
+    state = qlty(qlty_failures=(429, 429), qlty_retry_after="0")
+    body = asyncio.run(client.get_project_metrics("stub", "owner", "project"))
+    assert len(body["data"]) == 50
+    assert sleeps == [0.0, 0.0]
+    assert state.requests["qlty"] == 3
+
+
+def test_5xx_backs_off_exponentially(qlty, sleeps):
+    state = qlty(qlty_failures=(503, 502, 500))
+    body = asyncio.run(client.get_project_metrics("stub", "owner", "project"))
+    assert len(body["data"]) == 50
+    assert sleeps == [1, 2, 4]
+    assert state.requests["qlty"] == 4
+
+
+def test_gives_up_after_max_retries(qlty, sleeps):
+    state = qlty(qlty_failures=(503,) * (client.QLTY_MAX_RETRIES + 1))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(client.get_project_metrics("stub", "owner", "project"))
+    assert state.requests["qlty"] == client.QLTY_MAX_RETRIES + 1
+    assert len(sleeps) == client.QLTY_MAX_RETRIES
+
+
+def test_other_errors_are_not_retried(qlty, sleeps):
+    state = qlty(qlty_failures=(404,))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(client.get_project_metrics("stub", "owner", "project"))
+    assert state.requests["qlty"] == 1
+    assert sleeps == []
+
+
+def test_files_metrics_fan_out_is_bounded(qlty):
+    state = qlty(latency_s=0.05)
+    paths = [f"src/mod_{i}.py" for i in range(24)]
+    results = asyncio.run(client.get_files_metrics(paths, "stub", "owner", "project", concurrency=3))
+    assert sorted(results) == sorted(paths)
+    assert all(result["data"]["path"] == path for path, result in results.items())
+    assert state.max_in_flight == 3
+
+
+def test_files_metrics_keeps_per_file_errors(qlty, sleeps):
+    qlty(qlty_failures=(404,))
+    results = asyncio.run(client.get_files_metrics(["a.py", "b.py"], "stub", "owner", "project", concurrency=1))
+    assert "error" in results["a.py"]
+    assert results["b.py"]["data"]["path"] == "b.py"
@@ -0,0 +1,82 @@
+"""
+Catalogue de règles SonarQube contre le stub HTTP local : classement écologique, cache mémoire / disque et TTL
+"""
+import pytest
+import requests
+
+from benchmarks.stubs import StubServer, StubState
+from services.sonarqube import rules
+
+
+@pytest.fixture
+def catalog(monkeypatch, tmp_path):
+    """Cache vide ; renvoie (stub, get) où get() charge le catalogue depuis le stub"""
+    monkeypatch.setattr(rules, "SONAR_RULES_CACHE", tmp_path / "sonar_rules.json")
+    monkeypatch.setattr(rules, "_catalog", None)
+    monkeypatch.setattr(rules, "_retry_at", 0.0)
+    monkeypatch.setattr(rules, "RULES_PAGE_SIZE", 2)
+    with requests.Session() as session, StubServer(StubState()) as server:
+        yield server, lambda host=server.url: rules.get_catalog(session, host, "token")
+
+
+def test_categories_follow_attribute_then_tags():
+    assert rules.eco_category({"key": "python:S3776", "tags": []}) == "complexity"
+    assert rules.eco_category({"key": "x:1", "clean_code_attribute": "EFFICIENT", "tags": ["unused"]}) == "efficiency"
+    assert rules.eco_category({"key": "x:2", "clean_code_attribute": "CLEAR", "tags": ["convention", "unused"]}) == "dead_code"
+    assert rules.eco_category({"key": "x:3", "clean_code_attribute": "CLEAR", "tags": ["convention"]}) is None
+
+
+def test_catalog_is_paginated_and_indexed(catalog):
+    server, get = catalog
+    loaded = get()
+    assert server.state.requests["sonar_rules"] == 3
+    assert loaded["index"] == {
+        "python:S1066": "complexity",
+        "python:S3776": "complexity",
+        "python:S1481": "dead_code",
+        "python:S117": None,
+        "python:S7500": "efficiency",
+    }
+    assert loaded["eco_rules"] == ["python:S1066", "python:S1481", "python:S3776", "python:S7500"]
+
+
+def test_catalog_is_served_from_memory_then_disk_within_ttl(catalog, monkeypatch):
+    server, get = catalog
+    get()
+    assert get()["index"]["python:S7500"] == "efficiency"
+    monkeypatch.setattr(rules, "_catalog", None)
+    assert get()["index"]["python:S7500"] == "efficiency"
+    assert server.state.requests["sonar_rules"] == 3
+    # Un autre serveur n'hérite pas du catalogue en cache
+    assert rules._load_disk("http://other.example") is None
+
+
+def test_expired_catalog_is_refreshed(catalog, monkeypatch):
+    server, get = catalog
+    get()
+    monkeypatch.setattr(rules, "SONAR_RULES_TTL", 0)
+    get()
+    assert server.state.requests["sonar_rules"] == 6
+
+
+def test_stale_catalog_is_kept_when_refresh_fails(catalog, monkeypatch):
+    _, get = catalog
+    dead = "http://127.0.0.1:9"
+    loaded = get()
+    monkeypatch.setattr(rules, "_catalog", {**loaded, "host": dead})
+    monkeypatch.setattr(rules, "SONAR_RULES_TTL", 0)
+    # Port fermé : l'ancien catalogue reste servi et le prochain essai est différé de SONAR_RULES_RETRY_S
+    stale = get(host=dead)
+    assert stale["index"] == loaded["index"]
+    assert rules._retry_at > 0
+    assert get(host=dead) is stale
+
+
+def test_issue_classification():
+    index = {"python:S117": None, "python:S7500": "efficiency"}
+    assert rules.classify({"rule": "python:S7500", "message": "anything"}, index) == "efficiency"
+    # Règle connue sans impact : le message n'est pas consulté
+    assert rules.classify({"rule": "python:S117", "message": "memory hog"}, index) is None
+    assert rules.classify({"rule": "python:S9999", "message": "Duplicate code block"}, index) == "duplication"
+    assert rules.classify({"rule": "python:S3776", "message": ""}, None) == "complexity"
+    assert rules.classify({"rule": "python:S9999", "message": "Rename this variable"}, None) is None
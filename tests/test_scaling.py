@@ -0,0 +1,50 @@
+"""
+Complexité empirique : ajustement log-log, extrapolation et arrêt du runner à la taille maximale
+"""
+import asyncio
+import math
+
+import pytest
+
+from services.carbon import scaling
+
+SIZES = [2 ** k for k in range(4, 14)]
+
+
+@pytest.mark.parametrize("growth_class, cost, slope", [
+    ("O(1)", lambda n: 1e-3, 0.0),
+    ("O(n)", lambda n: 1e-7 * n, 1.0),
+    ("O(n log n)", lambda n: 1e-8 * n * (math.log2(n) + 1), None),
+    ("O(n^2)", lambda n: 1e-9 * n * n, 2.0),
+])
+def test_fit_recovers_growth_class(growth_class, cost, slope):
+    fit = scaling._fit_loglog(SIZES, [cost(n) for n in SIZES])
+    assert fit["growth_class"] == growth_class
+    if slope is not None:
+        assert fit["slope"] == pytest.approx(slope, abs=1e-3)
+        assert fit["residuals"][growth_class] == pytest.approx(0, abs=1e-9)
+
+
+def test_exponential_class_is_skipped_for_large_sizes():
+    assert "O(2^n)" not in scaling._fit_loglog([1024, 2048, 4096], [1.0, 2.0, 4.0])["residuals"]
+
+
+def test_extrapolation():
+    fit = scaling._fit_loglog(SIZES, [1e-9 * n * n for n in SIZES])
+    assert scaling._extrapolate(fit["_log_a"], fit["growth_class"], 10 ** 6) == pytest.approx(1e3, rel=1e-6)
+    assert scaling._extrapolate(0.0, "O(2^n)", 10 ** 6) is None
+
+
+def test_runner_stops_at_max_size():
+    code = "def total(values):\n    return sum(values)\n"
+    result = asyncio.run(scaling.analyze_scaling(code, "total", filename="../outside.py", start_size=8, max_size=64,
+                                                 time_budget_s=10))
+    assert result["inputs"] == {"values": "list"}
+    assert [p["n"] for p in result["points"]] == [8, 16, 32, 64]
+    assert result["stopped_by"] == "max_size"
+    assert result["errors"] == []
+
+
+def test_growth_factor_must_grow():
+    with pytest.raises(ValueError):
+        asyncio.run(scaling.analyze_scaling("def f(n):\n    return n\n", "f", growth_factor=1.0))
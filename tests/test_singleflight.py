@@ -0,0 +1,120 @@
+"""
+Single-flight : regroupement des appels identiques, dans un worker et entre workers via l'état partagé
+"""
+import asyncio
+
+import pytest
+
+from services.shared import SharedState
+from services.singleflight import SingleFlight, make_key, normalize_code
+
+
+def _counting(result, delay: float = 0.05):
+    """Fabrique de coroutine qui compte ses exécutions"""
+    runs = []
+
+    async def factory():
+        runs.append(1)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return factory, runs
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    factory, runs = _counting({"energy_kwh": 1e-6})
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("carbon:a", factory) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert results == [({"energy_kwh": 1e-6}, 5)] * 5
+    assert flight.in_flight() == 0
+
+
+def test_distinct_keys_and_later_calls_run_again():
+    flight = SingleFlight()
+    factory, runs = _counting("ok")
+
+    async def scenario():
+        await asyncio.gather(flight.do("carbon:a", factory), flight.do("carbon:b", factory))
+        return await flight.do("carbon:a", factory)
+
+    assert asyncio.run(scenario()) == ("ok", 1)
+    assert len(runs) == 3
+
+
+def test_errors_reach_every_caller_and_are_not_cached():
+    flight = SingleFlight()
+    factory, runs = _counting(RuntimeError("boom"))
+
+    async def scenario():
+        return await asyncio.gather(flight.do("carbon:a", factory), flight.do("carbon:a", factory), return_exceptions=True)
+
+    first = asyncio.run(scenario())
+    assert [str(e) for e in first] == ["boom", "boom"]
+    asyncio.run(scenario())
+    assert len(runs) == 2
+
+
+def test_cancelling_one_waiter_keeps_the_shared_execution():
+    flight = SingleFlight()
+    factory, runs = _counting("ok", delay=0.2)
+
+    async def scenario():
+        first = asyncio.ensure_future(flight.do("carbon:a", factory))
+        second = asyncio.ensure_future(flight.do("carbon:a", factory))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == ("ok", 2)
+    assert len(runs) == 1
+
+
+def test_cancelling_the_last_waiter_cancels_the_execution():
+    flight = SingleFlight()
+    finished = []
+
+    async def factory():
+        await asyncio.sleep(1)
+        finished.append(1)
+
+    async def scenario():
+        call = asyncio.ensure_future(flight.do("carbon:a", factory))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        return flight.in_flight()
+
+    assert asyncio.run(scenario()) == 0
+    assert finished == []
+
+
+def test_workers_share_one_execution_through_shared_state(tmp_path):
+    state = SharedState(tmp_path / "shared.db")
+    workers = [SingleFlight(state), SingleFlight(state)]
+    factory, runs = _counting({"issues": []}, delay=0.3)
+
+    async def scenario():
+        return await asyncio.gather(*(worker.do("sonar:a", factory) for worker in workers))
+
+    results = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert [result for result, _ in results] == [{"issues": []}] * 2
+    assert max(calls for _, calls in results) == 2
+
+
+def test_keys_ignore_line_endings_and_trailing_spaces():
+    assert normalize_code("x = 1  \r\ny = 2\r\n") == "x = 1\ny = 2"
+    assert make_key("carbon", code=normalize_code("x = 1 \n"), backend="direct") == \
+        make_key("carbon", backend="direct", code=normalize_code("x = 1"))
+    assert make_key("carbon", code="x = 1") != make_key("carbon", code="x = 2")
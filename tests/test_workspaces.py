@@ -0,0 +1,92 @@
+"""
+Copies de travail partagées : réutilisation par repository@commit, SHA abrégés et éviction des copies non tenues
+"""
+import subprocess
+
+import pytest
+
+from services import workspaces
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd,
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Dépôt local à deux commits : (url, sha du premier, sha du second)"""
+    path = tmp_path / "origin" / "project"
+    path.mkdir(parents=True)
+    _git("init", "--quiet", cwd=path)
+    (path / "main.py").write_text("print('v1')\n")
+    _git("add", "main.py", cwd=path)
+    _git("commit", "--quiet", "-m", "v1", cwd=path)
+    first = _git("rev-parse", "HEAD", cwd=path)
+    (path / "main.py").write_text("print('v2')\n")
+    _git("commit", "--quiet", "-am", "v2", cwd=path)
+    return path.as_uri(), first, _git("rev-parse", "HEAD", cwd=path)
+
+
+@pytest.fixture(autouse=True)
+def workspace_dir(monkeypatch, tmp_path):
+    path = tmp_path / "workspaces"
+    monkeypatch.setattr(workspaces, "WORKSPACE_DIR", path)
+    monkeypatch.setattr(workspaces, "_last_evict", 0.0)
+    return path
+
+
+def test_head_is_cloned_once_then_reused(repo):
+    url, _, head = repo
+    with workspaces.checkout(url) as first:
+        assert first["commit"] == head
+        assert not first["reused"]
+        assert (first["path"] / "main.py").read_text() == "print('v2')\n"
+        with workspaces.checkout(url) as second:
+            assert second["reused"]
+            assert second["path"] == first["path"]
+
+
+def test_abbreviated_commit_resolves_to_full_sha(repo):
+    url, first_sha, _ = repo
+    with workspaces.checkout(url, first_sha[:10]) as workspace:
+        assert workspace["commit"] == first_sha
+        assert (workspace["path"] / "main.py").read_text() == "print('v1')\n"
+    # Le préfixe d'une copie existante est reconnu sans recloner
+    with workspaces.checkout(url, first_sha[:8].upper()) as workspace:
+        assert workspace["reused"]
+        assert workspace["commit"] == first_sha
+
+
+def test_held_workspace_survives_eviction(repo, workspace_dir):
+    url, _, _ = repo
+    far_future = 2 ** 40
+    with workspaces.checkout(url) as workspace:
+        assert workspaces.evict(now=far_future, force=True)["evicted"] == 0
+        assert workspace["path"].is_dir()
+    assert workspaces.evict(now=far_future, force=True)["evicted"] == 1
+    assert not workspace["path"].exists()
+    assert list(workspace_dir.glob("*.json")) == []
+
+
+def test_quota_evicts_least_recently_used(repo, monkeypatch):
+    url, first_sha, head = repo
+    with workspaces.checkout(url, first_sha):
+        pass
+    with workspaces.checkout(url, head) as latest:
+        monkeypatch.setattr(workspaces, "WORKSPACE_MAX_MB", 0)
+        assert workspaces.evict(force=True)["evicted"] == 1
+        assert latest["path"].is_dir()
+
+
+def test_invalid_commit_is_rejected(repo):
+    url, _, _ = repo
+    with pytest.raises(workspaces.WorkspaceError):
+        with workspaces.checkout(url, "main; rm -rf /"):
+            pass
+
+
+def test_repo_key_ignores_suffixes_and_keeps_homonyms_apart():
+    assert workspaces.repo_key("https://github.com/owner/repo.git") == workspaces.repo_key("https://github.com/owner/repo/")
+    assert workspaces.repo_key("https://github.com/a/repo") != workspaces.repo_key("https://github.com/b/repo")
+    assert workspaces.repo_key("https://github.com/owner/repo").startswith("repo-")